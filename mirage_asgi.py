@@ -0,0 +1,469 @@
+"""
+Async (ASGI) entry point for Project Mirage.
+
+Serves the same mocks as the Flask app, built on the same registry, compiler
+and chaos engine, but injected latency, timeouts and slow drips are awaited
+instead of holding a thread, so a few workers can keep thousands of slow
+connections open. Generator calls stay synchronous: cheap ones run inline on
+the event loop, while sandboxed mocks, mocks whose measured p99 is above
+MIRAGE_OFFLOAD_P99_MS, and every batch/stream are handed to the default thread
+executor so one big request cannot stall the loop.
+
+Run it with several worker processes (they share deployments through the
+MIRAGE_STATE_FILE snapshot, see mirage_state.py):
+
+    python mirage_asgi.py --workers 4 --port 5000
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:5000 mirage_asgi:app
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from urllib.parse import parse_qsl
+
+import mirage_gemini as core
+from mirage_chaos import PRE_BODY_FAULTS, fault_status, truncate_body, truncate_stream, drip
+from mirage_fixture import FixtureIndexError
+
+OFFLOAD_P99_MS = float(os.environ.get("MIRAGE_OFFLOAD_P99_MS", "1.0"))
+OFFLOAD_RECHECK_S = 1.0  # how often a mock's offload decision is re-derived from its exec timer
+DEFAULT_STATE_FILE = os.path.join(".mirage_state", "registry.json")
+
+_offload_cache = {}
+
+
+# --- REQUEST / RESPONSE HELPERS ---
+class Headers(dict):
+    """Case-insensitive view of the ASGI header list (last value wins)."""
+    def __init__(self, scope):
+        super().__init__((k.decode("latin-1").lower(), v.decode("latin-1")) for k, v in scope.get("headers", []))
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+
+def query_args(scope):
+    return dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True))
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return body
+
+
+async def read_json(receive):
+    body = await read_body(receive)
+    try:
+        return json.loads(body) if body else {}
+    except ValueError:
+        return None
+
+
+def _header_list(content_type, headers=None):
+    pairs = [(b"content-type", content_type.encode("latin-1"))]
+    for key, value in (headers or {}).items():
+        pairs.append((key.lower().encode("latin-1"), str(value).encode("latin-1")))
+    return pairs
+
+
+async def send_body(send, status, body, content_type="application/json", headers=None):
+    pairs = _header_list(content_type, headers)
+    pairs.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": pairs})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, payload, status=200, headers=None):
+    await send_body(send, status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+
+# --- SERVING ---
+def encode_body(mock, payload):
+    """encode_record to UTF-8 bytes, timed into the serialization histogram."""
+    started = time.perf_counter()
+    body = core.encode_record(payload).encode("utf-8")
+    core.SERIALIZE_SECONDS.observe((mock.name,), time.perf_counter() - started)
+    return body
+
+
+def should_offload(mock):
+    """
+    Sandboxed mocks always leave the loop; inline ones once their p99 generation time is too high.
+    A version that was just swapped in has no timings yet, so its deploy-time validation p99 stands in.
+    """
+    if mock.execution == "sandbox":
+        return True
+    now = time.monotonic()
+    cached = _offload_cache.get(mock.name)
+    if cached is not None and cached[0] > now and cached[1] is mock:
+        return cached[2]
+    p99 = mock.exec_timer.snapshot()["p99_ms"]
+    if p99 is None and mock.validation and mock.validation.get("call_us"):
+        p99 = mock.validation["call_us"]["p99"] / 1000
+    offload = p99 is not None and p99 > OFFLOAD_P99_MS
+    _offload_cache[mock.name] = (now + OFFLOAD_RECHECK_S, mock, offload)
+    return offload
+
+
+def build_body(mock, batch, index, seed, params, index_given=True):
+    """
+    Synchronous part of a mock response: (status, content_type, headers, chunks, streamed).
+    Streamed bodies are lazy iterators; nothing is generated until they are pulled.
+    """
+    fixture, pool = mock.fixture, mock.pool
+    if fixture is not None:
+        content_type, headers, chunks = core.fixture_body(mock, fixture, batch, index if index_given else None, seed, params)
+        # ASGI bodies are bytes, so the mapped slices are copied once here
+        return 200, content_type, headers, [b"".join(chunks)], False
+    buf = pool.pop() if pool is not None and batch is None and seed is None and not params else None
+    if buf is not None:
+        return 200, "application/json", {}, [buf], False
+    if batch is None:
+        record = core.apply_path_params(next(mock.generate(index, 1, seed)), params)
+        headers = {"X-Mirage-Seed": seed} if seed is not None else {}
+        return 200, "application/json", headers, [encode_body(mock, record)], False
+
+    records = core.iter_records(mock, batch["offset"], batch["count"], batch["seed"], params)
+    content_type = "application/x-ndjson" if batch["ndjson"] else "application/json"
+    if batch["kind"] == "stream":
+        return 200, content_type, {}, core.stream_records(mock, records, batch["ndjson"]), True
+    next_cursor = core.encode_cursor(batch["seed"], batch["offset"] + batch["count"], batch["count"])
+    headers = {"X-Mirage-Next-Cursor": next_cursor, "X-Mirage-Seed": batch["seed"]}
+    if batch["ndjson"]:
+        return 200, content_type, headers, core.stream_records(mock, records, True), True
+    payload = core.page_payload(batch, records, next_cursor)
+    return 200, content_type, headers, [encode_body(mock, payload)], False
+
+
+async def send_chaos(send, fault):
+    """Async twin of core.chaos_response: the timeout fault awaits instead of sleeping."""
+    kind = fault["type"]
+    if kind == "error":
+        status = int(fault["status"])
+        return await send_json(send, {"error": fault["message"] or f"🔥 CHAOS MODE: {status} Server Error Simulated"}, status)
+    if kind == "rate_limit":
+        return await send_json(send, {"error": "🔥 CHAOS MODE: 429 Too Many Requests"}, 429,
+                               {"Retry-After": fault["retry_after"]})
+    if kind == "timeout":
+        await asyncio.sleep(float(fault["after_ms"]) / 1000.0)
+        return await send_json(send, {"error": "🔥 CHAOS MODE: 504 Gateway Timeout"}, 504)
+    # reset: headers go out, then the app raises and the server drops the connection
+    await send({"type": "http.response.start", "status": 200, "headers": _header_list("application/json")})
+    raise ConnectionResetError("🔥 CHAOS MODE: connection reset")
+
+
+async def serve_state(mock, scope, receive, send, params, fault):
+    method = scope["method"]
+    body = await read_json(receive) if method in ("POST", "PUT", "PATCH") else None
+    if method == "GET" and mock.item_param() not in (params or {}):
+        # Scans over a large store take a while; keep them off the loop
+        payload, status = await asyncio.get_running_loop().run_in_executor(
+            None, core.serve_state, mock, method, params, query_args(scope), body)
+    else:
+        payload, status = core.serve_state(mock, method, params, query_args(scope), body)
+    encoded = encode_body(mock, payload)
+    if fault is None:
+        mock.stats.hit("ok", status)
+        return await send_body(send, status, encoded)
+    mock.stats.hit("chaos", status)
+    if fault["type"] == "truncate":
+        encoded = truncate_body(encoded, fault)
+    await send({"type": "http.response.start", "status": status, "headers": _header_list("application/json")})
+    if fault["type"] == "slow_drip":
+        for piece, pause in drip([encoded], fault):
+            await asyncio.sleep(pause)
+            await send({"type": "http.response.body", "body": piece, "more_body": True})
+    else:
+        await send({"type": "http.response.body", "body": encoded, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def serve_mock(mock, scope, receive, send, params=None):
+    args = query_args(scope)
+    seed = core.request_seed(args, Headers(scope))
+    try:
+        index = core._int_arg(args, 'index', 0, 0, 2 ** 63)
+        batch = core.parse_batch_args(args, seed)
+    except ValueError as e:
+        mock.stats.hit("rejected", 400)
+        return await send_json(send, {"error": str(e)}, 400)
+
+    decision = core.roll_chaos(mock, seed, index)
+    if decision.delay:
+        await asyncio.sleep(decision.delay)
+    fault = decision.fault
+    if fault is not None and fault["type"] in PRE_BODY_FAULTS:
+        mock.stats.hit("chaos", fault_status(fault))
+        return await send_chaos(send, fault)
+
+    if mock.store is not None:
+        return await serve_state(mock, scope, receive, send, params, fault)
+
+    loop = asyncio.get_running_loop()
+    try:
+        if batch is not None or should_offload(mock):
+            status, content_type, headers, chunks, streamed = await loop.run_in_executor(
+                None, build_body, mock, batch, index, seed, params, 'index' in args)
+        else:
+            status, content_type, headers, chunks, streamed = build_body(mock, batch, index, seed, params, 'index' in args)
+    except FixtureIndexError as e:
+        mock.stats.hit("rejected", 404)
+        return await send_json(send, {"error": str(e)}, 404)
+    except Exception as e:
+        mock.stats.hit("errors", 500)
+        return await send_json(send, {"error": f"Runtime Error: {str(e)}"}, 500)
+
+    if fault is not None:
+        mock.stats.hit("chaos", status)
+        if fault["type"] == "truncate":
+            chunks = truncate_stream(chunks, fault) if streamed else [truncate_body(chunks[0], fault)]
+        # Mangled bodies never carry a Content-Length
+        streamed = True
+    else:
+        mock.stats.hit("ok", status)
+
+    if not streamed:
+        return await send_body(send, status, chunks[0], content_type, headers)
+
+    await send({"type": "http.response.start", "status": status, "headers": _header_list(content_type, headers)})
+    if fault is not None and fault["type"] == "slow_drip":
+        pieces = drip(chunks, fault)
+        while True:
+            item = await loop.run_in_executor(None, next, pieces, None)
+            if item is None:
+                break
+            await asyncio.sleep(item[1])
+            await send({"type": "http.response.body", "body": item[0], "more_body": True})
+    else:
+        # Each ~64 KB chunk is generated off the loop
+        chunks = iter(chunks)
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                break
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+# --- ROUTING ---
+async def handle_http(scope, receive, send):
+    method, path = scope["method"], scope["path"].rstrip("/") or "/"
+    loop = asyncio.get_running_loop()
+
+    if path == "/api/mirage" or path.startswith("/api/mirage/"):
+        if path == "/api/mirage":
+            mock, params = core.active_simulations.get('default'), None
+            allowed = ("GET",)
+        else:
+            mock, params = core.active_simulations.match(path[len("/api/mirage/"):])
+            allowed = mock.allowed_methods() if mock else ()
+        if not mock: return await send_json(send, {"error": "Not Deployed"}, 404)
+        if method not in allowed:
+            return await send_json(send, {"error": f"Method {method} not allowed"}, 405)
+        started = time.perf_counter()
+        try:
+            return await serve_mock(mock, scope, receive, send, params)
+        finally:
+            core.REQUEST_SECONDS.observe((mock.name,), time.perf_counter() - started)
+
+    if path.startswith("/api/replay/"):
+        name, _, subpath = path[len("/api/replay/"):].partition("/")
+        recording = core.recordings.get(name)
+        if not recording: return await send_json(send, {"error": "Not Recording"}, 404)
+        # An index lookup and a slice of the mapped log: cheap enough for the loop
+        found = core.replay_exchange(recording, method, subpath)
+        if found is None: return await send_json(send, {"error": "Not Recorded"}, 404)
+        status, content_type, body = found
+        return await send_body(send, status, bytes(body), content_type)
+
+    if path.startswith("/api/proxy/"):
+        name, _, subpath = path[len("/api/proxy/"):].partition("/")
+        recording = core.recordings.get(name)
+        if not recording or not recording.upstream: return await send_json(send, {"error": "Not Recording"}, 404)
+        body = await read_body(receive)
+        status, content_type, headers, body = await loop.run_in_executor(
+            None, core.proxy_exchange, recording, method, subpath,
+            scope.get("query_string", b"").decode("latin-1"), Headers(scope), body)
+        return await send_body(send, status, body, content_type or "application/octet-stream", headers)
+
+    if path == "/" and method == "GET":
+        return await send_body(send, 200, core.HTML_TEMPLATE.encode("utf-8"), "text/html; charset=utf-8")
+
+    if path == "/deploy" and method == "POST":
+        data = await read_json(receive)
+        if data is None: return await send_json(send, {"success": False, "error": "Body must be JSON"}, 400)
+        if not isinstance(data, dict): return await send_json(send, {"success": False, "error": "Body must be a JSON object"}, 400)
+        # Planning, Gemini and compilation are blocking; keep them off the loop
+        return await send_json(send, await loop.run_in_executor(None, core.deploy_mock, data))
+
+    if path == "/deploy/batch" and method == "POST":
+        data = await read_json(receive)
+        if query_args(scope).get("stream") != "ndjson":
+            payload, status = await loop.run_in_executor(None, core.batch_deploy, data)
+            return await send_json(send, payload, status)
+        try:
+            events = core.batch_deploy_events(data)
+        except (ValueError, TypeError) as e:
+            return await send_json(send, {"success": False, "error": str(e)}, 400)
+        await send({"type": "http.response.start", "status": 200, "headers": _header_list("application/x-ndjson")})
+        while True:
+            # Each result line waits on Gemini and compilation off the loop
+            event = await loop.run_in_executor(None, next, events, None)
+            if event is None:
+                break
+            await send({"type": "http.response.body", "body": (json.dumps(event) + "\n").encode("utf-8"), "more_body": True})
+        return await send({"type": "http.response.body", "body": b""})
+
+    if path == "/api/chaos":
+        if method == "GET":
+            return await send_json(send, core.chaos_status())
+        data = await read_json(receive)
+        if data is None: return await send_json(send, {"success": False, "error": "Body must be JSON"}, 400)
+        payload, status = core.configure_chaos(data)
+        return await send_json(send, payload, status)
+
+    if path == "/api/cache" and method == "GET":
+        return await send_json(send, core.generator_cache.stats())
+
+    if path == "/api/cache/invalidate" and method == "POST":
+        payload, status = core.invalidate_cache(await read_json(receive) or {})
+        return await send_json(send, payload, status)
+
+    if path == "/api/sandbox" and method == "GET":
+        return await send_json(send, core.sandbox_pool.stats())
+
+    if path == "/metrics" and method == "GET":
+        return await send_body(send, 200, core.metrics_text().encode("utf-8"), "text/plain; version=0.0.4")
+
+    if path == "/api/profiler":
+        if method == "GET":
+            payload, status = core.profiler_status(query_args(scope))
+            if isinstance(payload, str):
+                return await send_body(send, status, payload.encode("utf-8"), "text/plain")
+            return await send_json(send, payload, status)
+        payload, status = core.configure_profiler(await read_json(receive))
+        return await send_json(send, payload, status)
+
+    if path == "/api/recordings":
+        if method == "GET":
+            return await send_json(send, {"recordings": [r.describe() for r in list(core.recordings.values())]})
+        payload, status = core.open_recording(await read_json(receive))
+        return await send_json(send, payload, status)
+
+    if path.startswith("/api/recordings/"):
+        name, _, action = path[len("/api/recordings/"):].partition("/")
+        if action == "learn" and method == "POST":
+            data = await read_json(receive) or {}
+            # Plans every recorded route (and may call Gemini); keep it off the loop
+            payload, status = await loop.run_in_executor(None, core.learn_recording, name, data)
+            return await send_json(send, payload, status)
+        if not action and method == "DELETE":
+            if not core.close_recording(name): return await send_json(send, {"error": "Not Recording"}, 404)
+            return await send_json(send, {"success": True})
+        if not action and method == "GET":
+            recording = core.recordings.get(name)
+            if not recording: return await send_json(send, {"error": "Not Recording"}, 404)
+            return await send_json(send, recording.describe())
+
+    if path == "/api/mocks" and method == "GET":
+        return await send_json(send, {"mocks": [mock.describe() for mock in core.active_simulations.all()]})
+
+    if path.startswith("/api/mocks/"):
+        parts = path[len("/api/mocks/"):].split("/")
+        name = parts[0]
+        if len(parts) == 2 and parts[1] == "pool" and method == "POST":
+            payload, status = core.configure_pool_for(name, await read_json(receive) or {})
+            return await send_json(send, payload, status)
+        if len(parts) == 2 and parts[1] == "state" and method == "POST":
+            data = await read_json(receive)
+            if data is None: return await send_json(send, {"success": False, "error": "Body must be JSON"}, 400)
+            # Seeding a large store takes a while; keep it off the loop
+            payload, status = await loop.run_in_executor(None, core.configure_state_for, name, data)
+            return await send_json(send, payload, status)
+        if len(parts) == 2 and parts[1] == "validate" and method == "POST":
+            data = await read_json(receive) or {}
+            # A batch of seeded runs (sandboxed ones included) takes a while; keep it off the loop
+            payload, status = await loop.run_in_executor(None, core.validate_mock, name, data)
+            return await send_json(send, payload, status)
+        if len(parts) == 2 and parts[1] == "versions" and method == "GET":
+            payload, status = core.mock_versions(name)
+            return await send_json(send, payload, status)
+        if len(parts) == 2 and parts[1] == "rollback" and method == "POST":
+            data = await read_json(receive) or {}
+            # Rebuilding a version that is no longer loaded compiles it and warms its pool
+            payload, status = await loop.run_in_executor(None, core.rollback_mock, name, data)
+            return await send_json(send, payload, status)
+        if len(parts) == 2 and parts[1] == "materialize" and method == "POST":
+            data = await read_json(receive) or {}
+            # Writing a large fixture takes a while; keep it off the loop
+            payload, status = await loop.run_in_executor(None, core.materialize_mock, name, data)
+            return await send_json(send, payload, status)
+        if len(parts) == 2 and parts[1] == "export" and method == "GET":
+            source = core.export_mock(name)
+            if source is None: return await send_json(send, {"error": "Not Deployed"}, 404)
+            return await send_body(send, 200, source.encode("utf-8"), "text/x-python",
+                                   {"Content-Disposition": f'attachment; filename="{name}_server.py"'})
+        if len(parts) == 1 and method == "DELETE":
+            if not core.remove_mock(name): return await send_json(send, {"error": "Not Deployed"}, 404)
+            return await send_json(send, {"success": True})
+        if len(parts) == 1 and method == "GET":
+            mock = core.active_simulations.get(name)
+            if not mock: return await send_json(send, {"error": "Not Deployed"}, 404)
+            return await send_json(send, dict(mock.describe(), plan=mock.plan))
+
+    return await send_json(send, {"error": "Not Found"}, 404)
+
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                if os.environ.get("MIRAGE_STATE_FILE"):
+                    core.enable_shared_state(os.environ["MIRAGE_STATE_FILE"])
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            core.sandbox_pool.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await handle_lifespan(receive, send)
+    if scope["type"] == "http":
+        return await handle_http(scope, receive, send)
+
+
+# --- LAUNCHER ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Project Mirage with uvicorn worker processes.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--state-file", default=os.environ.get("MIRAGE_STATE_FILE", DEFAULT_STATE_FILE),
+                        help="snapshot file the workers share deployments through")
+    opts = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        print("mirage_asgi needs uvicorn: pip install uvicorn")
+        return 1
+    # Workers are separate processes; they inherit this and sync through the file
+    os.environ["MIRAGE_STATE_FILE"] = opts.state_file
+    uvicorn.run("mirage_asgi:app", host=opts.host, port=opts.port, workers=opts.workers, lifespan="on")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Batch deployment for Project Mirage.
+
+Turns a directory of sample files or an OpenAPI-style bundle into the
+`{"mocks": [...]}` body of POST /deploy/batch, and ships it to a running
+server, printing each mock's result as the server finishes it:
+
+    python mirage_batch.py samples/ --engine gemini --api-key $GEMINI_API_KEY
+    python mirage_batch.py openapi.json --server http://localhost:5000
+
+A directory contributes one mock per *.json file, named after the file. A
+bundle contributes one mock per path with a JSON example in a 2xx response
+(`example`, or the first of `examples`), answering every method that has one.
+The route is the path itself, so `/users/{user_id}` is served at
+`/api/mirage/users/{user_id}`.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+
+HTTP_METHODS = ("get", "post", "put", "patch", "delete")
+JSON_MEDIA = re.compile(r"^application/(.+\+)?json")
+
+
+def mock_name(text):
+    """A registry-safe name: anything outside [A-Za-z0-9_.-] becomes '_'."""
+    return re.sub(r"[^A-Za-z0-9_.\-]+", "_", text).strip("_") or "default"
+
+
+def mocks_from_directory(path):
+    """One /deploy body per *.json sample in `path`, in file name order."""
+    mocks = []
+    for entry in sorted(os.listdir(path)):
+        if not entry.endswith(".json"):
+            continue
+        with open(os.path.join(path, entry), encoding="utf-8") as f:
+            sample = json.load(f)
+        mocks.append({"name": mock_name(entry[:-len(".json")]), "schema": sample})
+    return mocks
+
+
+def _response_example(operation):
+    for status, response in sorted((operation.get("responses") or {}).items()):
+        if not str(status).startswith("2"):
+            continue
+        for media, content in (response.get("content") or {}).items():
+            if not JSON_MEDIA.match(media):
+                continue
+            if "example" in content:
+                return content["example"]
+            for example in (content.get("examples") or {}).values():
+                if isinstance(example, dict) and "value" in example:
+                    return example["value"]
+    return None
+
+
+def mocks_from_openapi(doc):
+    """
+    One /deploy body per path that has a JSON response example. A mock owns its route,
+    so every method with an example shares one mock, sampled from GET's example when
+    there is one. Raises ValueError if the document has no `paths` object.
+    """
+    paths = doc.get("paths") if isinstance(doc, dict) else None
+    if not isinstance(paths, dict):
+        raise ValueError("An OpenAPI bundle needs a 'paths' object")
+    mocks = []
+    for route, item in paths.items():
+        if not isinstance(item, dict):
+            continue
+        examples = []  # (method, example, operationId)
+        for method in HTTP_METHODS:
+            operation = item.get(method)
+            if isinstance(operation, dict):
+                example = _response_example(operation)
+                if example is not None:
+                    examples.append((method.upper(), example, operation.get("operationId")))
+        if not examples:
+            continue
+        _, example, operation_id = examples[0]
+        name = operation_id or re.sub(r"\{[^}]*\}", "by", route)
+        mocks.append({"name": mock_name(name), "schema": example, "route": route,
+                      "methods": [method for method, _, _ in examples]})
+    return mocks
+
+
+def load_bundle(path):
+    """Mocks from a directory, an OpenAPI document, or a file already shaped like {"mocks": [...]}."""
+    if os.path.isdir(path):
+        return mocks_from_directory(path)
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    if isinstance(doc, dict) and isinstance(doc.get("mocks"), list):
+        return doc["mocks"]
+    return mocks_from_openapi(doc)
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deploy a directory or OpenAPI bundle of samples to a Mirage server.")
+    parser.add_argument("bundle", help="directory of *.json samples, an OpenAPI JSON document, or a {\"mocks\": [...]} file")
+    parser.add_argument("--server", default="http://localhost:5000")
+    parser.add_argument("--engine", choices=("local", "gemini"))
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"))
+    parser.add_argument("--execution", choices=("inline", "sandbox"))
+    parser.add_argument("--concurrency", type=int, help="parallel Gemini calls (the server caps this)")
+    opts = parser.parse_args(argv)
+
+    try:
+        mocks = load_bundle(opts.bundle)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {opts.bundle}: {e}")
+        return 1
+    if not mocks:
+        print(f"No samples found in {opts.bundle}")
+        return 1
+    body = {"mocks": mocks}
+    for key in ("engine", "api_key", "execution", "concurrency"):
+        if getattr(opts, key) is not None:
+            body[key] = getattr(opts, key)
+
+    import requests
+    print(f"Deploying {len(mocks)} mocks to {opts.server} ...")
+    reply = requests.post(f"{opts.server.rstrip('/')}/deploy/batch?stream=ndjson", json=body, stream=True, timeout=None)
+    if reply.status_code != 200:
+        print(f"Batch deploy failed ({reply.status_code}): {reply.text}")
+        return 1
+    summary = None
+    for line in reply.iter_lines():
+        if not line:
+            continue
+        event = json.loads(line)
+        if "summary" in event:
+            summary = event["summary"]
+        elif event.get("success"):
+            print(f"  ok    {event['name']} -> {event['endpoint']}{' (cached)' if event.get('cached') else ''}")
+        else:
+            print(f"  FAIL  {event.get('name')}: {event.get('error')}")
+    if summary is None:
+        print("The server closed the stream before finishing")
+        return 1
+    print(f"{summary['deployed']} deployed, {summary['failed']} failed in {summary['seconds']}s")
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""
+Load generator and benchmark suite for Project Mirage.
+
+Deploys a set of reference schemas on a running server, drives each one with
+a pool of concurrent keep-alive connections for a fixed time, and reports
+throughput and latency percentiles with chaos off and on. The client is plain
+asyncio streams speaking HTTP/1.1, so it needs nothing beyond the standard
+library and one process can hold hundreds of connections open.
+
+    python mirage_gemini.py                     # or: python mirage_asgi.py --workers 4
+    python mirage_bench.py --concurrency 64 --duration 10 --label flask -o flask.json
+    python mirage_bench.py --label asgi --compare flask.json -o asgi.json
+
+Results are JSON (one entry per schema and chaos mode), so runs from different
+versions or serving modes can be diffed; --compare prints the throughput and
+p99 change against an earlier file.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+from urllib.parse import urlsplit
+
+from mirage_compiler import SAMPLE_PROFILE
+
+# The shape gemini_shadow_server.py serves
+INVENTORY = {
+    "product_id": "sku_4821",
+    "stock_level": 320,
+    "warehouse_location": "Zone-A",
+    "next_shipment": "2025-03-14",
+    "status": "IN_STOCK",
+    "dimensions": {"h": 40, "w": 25, "l": 60},
+}
+
+
+def nested_sample(depth=6):
+    """An object `depth` levels deep, each level with a few leaves and a short array."""
+    node = {"leaf_id": "nd_0001", "value": 12.5, "flag": False}
+    for level in range(depth, 0, -1):
+        node = {
+            "level": level,
+            "label": f"LEVEL_{level}",
+            "updated_at": "2025-01-01T00:00:00Z",
+            "tags": ["alpha", "beta"],
+            "child": node,
+        }
+    return node
+
+
+def large_array_sample(lines=200):
+    """An order with a few hundred line items (the compiler draws between half and twice as many)."""
+    return {
+        "order_id": "ord_100234",
+        "customer_email": "ann@example.com",
+        "created_at": "2025-06-01T12:30:00Z",
+        "lines": [
+            {"sku": "sku_1000", "quantity": 3, "unit_price": 19.99, "status": "PACKED"}
+            for _ in range(lines)
+        ],
+    }
+
+
+REFERENCE_SCHEMAS = {
+    "user_profile": SAMPLE_PROFILE,
+    "inventory": INVENTORY,
+    "nested": nested_sample(),
+    "large_array": large_array_sample(),
+}
+
+# What "chaos on" means for a run: some latency and a small share of failed requests
+CHAOS_PROFILE = {
+    "latency": {"dist": "uniform", "min_ms": 0, "max_ms": 20},
+    "faults": [
+        {"type": "error", "status": 500, "probability": 0.05},
+        {"type": "rate_limit", "probability": 0.02},
+    ],
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+# --- HTTP CLIENT ---
+class HttpError(Exception):
+    pass
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection. Reconnects after the server closes it."""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        """Sends one request and reads the whole response. Returns (status, body bytes)."""
+        fresh = self.writer is None
+        if fresh:
+            await self._connect()
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+        if body is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+        self.writer.write(head.encode("latin-1") + b"\r\n" + payload)
+        status_line = await self.reader.readline()
+        if not status_line and not fresh:
+            # The server dropped an idle keep-alive connection; retry once on a new one
+            self.close()
+            return await self.request(method, path, body)
+        try:
+            return await self._read_response(status_line)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _read_response(self, status_line):
+        parts = status_line.split()
+        if len(parts) < 2:
+            raise HttpError("connection closed before a status line")
+        status, version = int(parts[1]), parts[0]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            pieces = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                pieces.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b"".join(pieces)
+        else:
+            body = await self.reader.read()
+            headers["connection"] = "close"
+        if headers.get("connection", "").lower() == "close" or version == b"HTTP/1.0":
+            self.close()
+        return status, body
+
+
+# --- RUNS ---
+def summarize(latencies, statuses, failures, elapsed, received):
+    """Throughput and latency percentiles (ms) of one timed run."""
+    ordered = sorted(latencies)
+    done = len(ordered)
+    latency = {}
+    if ordered:
+        for p in PERCENTILES:
+            latency[f"p{p}"] = round(ordered[min(done - 1, int(p / 100 * done))] * 1000, 3)
+        latency["max"] = round(ordered[-1] * 1000, 3)
+        latency["mean"] = round(sum(ordered) / done * 1000, 3)
+    ok = sum(count for status, count in statuses.items() if 200 <= int(status) < 300)
+    return {
+        "requests": done,
+        "seconds": round(elapsed, 3),
+        "rps": round(done / elapsed, 1) if elapsed else 0.0,
+        "ok_ratio": round(ok / done, 4) if done else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+        "transport_errors": failures,
+        "bytes_received": received,
+        "latency_ms": latency,
+    }
+
+
+async def drive(host, port, path, concurrency, duration, warmup, timeout):
+    """`concurrency` connections requesting `path` back to back; only requests started after `warmup` count."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+    latencies, statuses = [], {}
+    totals = {"failures": 0, "bytes": 0}
+
+    async def worker():
+        conn = Connection(host, port)
+        try:
+            while True:
+                begin = loop.time()
+                if begin >= stop_at:
+                    return
+                t0 = time.perf_counter()
+                try:
+                    status, body = await asyncio.wait_for(conn.request("GET", path), timeout)
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HttpError, ValueError):
+                    # Chaos resets and hung requests land here; the connection is rebuilt
+                    conn.close()
+                    if begin >= measure_from:
+                        totals["failures"] += 1
+                    continue
+                if begin >= measure_from:
+                    latencies.append(time.perf_counter() - t0)
+                    statuses[str(status)] = statuses.get(str(status), 0) + 1
+                    totals["bytes"] += len(body)
+        finally:
+            conn.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = min(loop.time(), stop_at + timeout) - measure_from
+    return summarize(latencies, statuses, totals["failures"], max(elapsed, 1e-9), totals["bytes"])
+
+
+async def api(host, port, method, path, body=None):
+    conn = Connection(host, port)
+    try:
+        status, raw = await conn.request(method, path, body)
+    finally:
+        conn.close()
+    try:
+        return status, json.loads(raw) if raw else None
+    except ValueError:
+        return status, None
+
+
+async def run_suite(opts):
+    url = urlsplit(opts.server)
+    if url.scheme != "http":
+        raise SystemExit("mirage_bench only speaks plain http://")
+    host, port = url.hostname or "localhost", url.port or 80
+    names = opts.schemas.split(",") if opts.schemas else list(REFERENCE_SCHEMAS)
+    unknown = [n for n in names if n not in REFERENCE_SCHEMAS]
+    if unknown:
+        raise SystemExit(f"Unknown schemas: {', '.join(unknown)} (have {', '.join(REFERENCE_SCHEMAS)})")
+    modes = ("off", "on") if opts.chaos == "both" else (opts.chaos,)
+    query = f"?count={opts.count}" if opts.count else ""
+
+    results = []
+    for name in names:
+        mock = f"bench_{name}"
+        status, reply = await api(host, port, "POST", "/deploy", {
+            "schema": json.dumps(REFERENCE_SCHEMAS[name]), "name": mock, "engine": "local",
+            "execution": opts.execution,
+        })
+        if status != 200 or not (reply or {}).get("success"):
+            raise SystemExit(f"Deploying {mock} failed: {reply}")
+        path = f"/api/mirage{reply['route']}{query}"
+        try:
+            for mode in modes:
+                chaos = dict(CHAOS_PROFILE, name=mock, enabled=True) if mode == "on" else {"name": mock, "enabled": False}
+                await api(host, port, "POST", "/api/chaos", chaos)
+                print(f"{name} (chaos {mode}): {opts.concurrency} connections for {opts.duration}s ...")
+                result = await drive(host, port, path, opts.concurrency, opts.duration, opts.warmup, opts.timeout)
+                _, described = await api(host, port, "GET", f"/api/mocks/{mock}")
+                result.update(schema=name, chaos=mode, path=path,
+                              server_exec_time=(described or {}).get("exec_time"))
+                results.append(result)
+                lat = result["latency_ms"]
+                print(f"  {result['rps']} req/s  p50 {lat.get('p50')} ms  p95 {lat.get('p95')} ms  "
+                      f"p99 {lat.get('p99')} ms  ok {result['ok_ratio']:.1%}")
+        finally:
+            if not opts.keep:
+                await api(host, port, "DELETE", f"/api/mocks/{mock}")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(report, baseline_path):
+    """Prints req/s and p99 changes against an earlier results file, scenario by scenario."""
+    with open(baseline_path, encoding="utf-8") as f:
+        earlier = json.load(f)
+    baseline = {(r["schema"], r["chaos"]): r for r in earlier["results"]}
+    print(f"\nAgainst {baseline_path} ({earlier.get('label') or earlier.get('commit')}):")
+    changed = [k for k, v in report["config"].items() if earlier.get("config", {}).get(k) != v]
+    if changed:
+        print(f"  note: {', '.join(changed)} differ between the runs")
+    results = report["results"]
+    for result in results:
+        old = baseline.get((result["schema"], result["chaos"]))
+        if old is None:
+            continue
+        rps_change = (result["rps"] - old["rps"]) / old["rps"] * 100 if old["rps"] else 0.0
+        old_p99, new_p99 = old["latency_ms"].get("p99"), result["latency_ms"].get("p99")
+        p99 = f"{old_p99} -> {new_p99} ms" if old_p99 is not None and new_p99 is not None else "n/a"
+        print(f"  {result['schema']} (chaos {result['chaos']}): req/s {rps_change:+.1f}%  p99 {p99}")
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark a running Mirage server with reference schemas.")
+    parser.add_argument("--server", default="http://localhost:5000")
+    parser.add_argument("--schemas", help=f"comma-separated subset of: {', '.join(REFERENCE_SCHEMAS)}")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unmeasured seconds before each scenario")
+    parser.add_argument("--timeout", type=float, default=10.0, help="per-request timeout in seconds")
+    parser.add_argument("--chaos", choices=("off", "on", "both"), default="both")
+    parser.add_argument("--count", type=int, default=0, help="request ?count=N batches instead of single records")
+    parser.add_argument("--execution", choices=("inline", "sandbox"), default="inline")
+    parser.add_argument("--label", help="free-form name for this run, e.g. the serving mode")
+    parser.add_argument("--keep", action="store_true", help="leave the bench_* mocks deployed")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("-o", "--output", help="write results JSON here")
+    opts = parser.parse_args(argv)
+
+    results = asyncio.run(run_suite(opts))
+    report = {
+        "label": opts.label,
+        "server": opts.server,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {
+            "concurrency": opts.concurrency, "duration": opts.duration, "warmup": opts.warmup,
+            "count": opts.count, "execution": opts.execution, "chaos_profile": CHAOS_PROFILE,
+        },
+        "results": results,
+    }
+    if opts.output:
+        with open(opts.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {opts.output}")
+    if opts.compare:
+        compare(report, opts.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
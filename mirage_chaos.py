@@ -0,0 +1,283 @@
+"""
+Chaos engine for Project Mirage.
+
+A ChaosConfig describes what can go wrong with a mock: injected latency drawn
+from a distribution, and a list of faults (errors, 429s, timeouts, truncated or
+slow-dripped bodies, connection resets), each with its own probability and
+optional time windows. decide() is pure: it only rolls the RNG it is given and
+returns a ChaosDecision, so the Flask app can time.sleep() on it while an async
+server awaits the same delay without tying up a thread.
+"""
+import bisect
+import datetime
+import math
+import threading
+import time
+
+DEFAULT_CHAOS_RATE = 0.5
+
+# Faults that replace the response entirely vs. ones that mangle the real body
+PRE_BODY_FAULTS = ("error", "rate_limit", "timeout", "reset")
+BODY_FAULTS = ("truncate", "slow_drip")
+FAULT_TYPES = PRE_BODY_FAULTS + BODY_FAULTS
+LATENCY_DISTS = ("fixed", "uniform", "normal", "longtail")
+
+FAULT_DEFAULTS = {
+    "error": {"status": 500, "message": None},
+    "rate_limit": {"retry_after": 1},
+    "timeout": {"after_ms": 30000},
+    "reset": {},
+    "truncate": {"fraction": 0.5},
+    "slow_drip": {"chunk_bytes": 16, "interval_ms": 100},
+}
+
+
+def _param(spec, key, default, low=0, high=float("inf"), cast=float):
+    """spec[key] (or `default`) as a `cast` number in low..high; ValueError otherwise."""
+    raw = spec.get(key, default)
+    try:
+        if isinstance(raw, bool) or (cast is int and isinstance(raw, float) and not raw.is_integer()):
+            raise TypeError
+        value = cast(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{key}' must be a number")
+    if not math.isfinite(value) or not low <= value <= high:
+        raise ValueError(f"'{key}' must be at least {low}" if math.isinf(high) else f"'{key}' must be between {low} and {high}")
+    return value
+
+
+def _timestamp(value):
+    """Accepts epoch seconds or an ISO 8601 string (naive means UTC)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    parsed = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+class Schedule:
+    """
+    Time windows in which chaos (or one fault) is live. Each window is either
+    absolute {"start": ..., "end": ...} or periodic {"period_s": 60, "active_s": 10, "offset_s": 0}.
+    No windows means always on.
+    """
+    def __init__(self, windows=None):
+        self.windows = []
+        for window in windows or []:
+            if "period_s" in window:
+                period, active = float(window["period_s"]), float(window.get("active_s", 0))
+                if period <= 0 or not 0 <= active <= period:
+                    raise ValueError("Periodic windows need period_s > 0 and 0 <= active_s <= period_s")
+                self.windows.append(("periodic", period, active, float(window.get("offset_s", 0))))
+            else:
+                start = _timestamp(window["start"]) if window.get("start") is not None else float("-inf")
+                end = _timestamp(window["end"]) if window.get("end") is not None else float("inf")
+                if end <= start:
+                    raise ValueError("Schedule window ends before it starts")
+                self.windows.append(("absolute", start, end, 0.0))
+
+    def active(self, now):
+        if not self.windows:
+            return True
+        for kind, a, b, offset in self.windows:
+            if kind == "periodic":
+                if (now - offset) % a < b:
+                    return True
+            elif a <= now < b:
+                return True
+        return False
+
+
+class Latency:
+    """Injected delay in milliseconds, drawn from a fixed, uniform, normal or long-tail (percentile table) distribution."""
+    def __init__(self, spec):
+        if not isinstance(spec, dict):
+            raise ValueError("Latency must be an object")
+        self.dist = spec.get("dist", "fixed")
+        if self.dist not in LATENCY_DISTS:
+            raise ValueError(f"Latency dist must be one of {', '.join(LATENCY_DISTS)}")
+        self.probability = _param(spec, "probability", 1.0, 0, 1)
+        self.spec = dict(spec)
+        if self.dist == "fixed":
+            self.ms = _param(spec, "ms", 0)
+        elif self.dist == "uniform":
+            self.min_ms, self.max_ms = _param(spec, "min_ms", 0), _param(spec, "max_ms", 0)
+            if self.min_ms > self.max_ms:
+                raise ValueError("Uniform latency needs min_ms <= max_ms")
+        elif self.dist == "normal":
+            self.mean_ms, self.stddev_ms = _param(spec, "mean_ms", 0), _param(spec, "stddev_ms", 0)
+        else:
+            # {"50": 20, "90": 120, "99": 900, "100": 3000}: piecewise-linear inverse CDF
+            percentiles = spec.get("percentiles")
+            if not isinstance(percentiles, dict) or not percentiles:
+                raise ValueError("Long-tail latency needs a non-empty 'percentiles' object")
+            try:
+                table = sorted((float(p), float(ms)) for p, ms in percentiles.items())
+            except TypeError:
+                raise ValueError("Long-tail percentiles and delays must be numbers")
+            if table[0][0] > 0:
+                table.insert(0, (0.0, _param(spec, "min_ms", 0)))
+            if any(not 0 <= p <= 100 for p, _ in table) or table[-1][0] != 100:
+                raise ValueError("Long-tail percentiles must lie in 0..100 and include 100")
+            if any(not 0 <= ms < float("inf") for _, ms in table):
+                raise ValueError("Long-tail delays must be non-negative")
+            self.points = [p for p, _ in table]
+            self.values = [ms for _, ms in table]
+
+    def sample_ms(self, rng):
+        if self.dist == "fixed":
+            return self.ms
+        if self.dist == "uniform":
+            return rng.uniform(self.min_ms, self.max_ms)
+        if self.dist == "normal":
+            return max(0.0, rng.gauss(self.mean_ms, self.stddev_ms))
+        u = rng.random() * 100
+        i = bisect.bisect_right(self.points, u)
+        if i >= len(self.points):
+            return self.values[-1]
+        p0, p1 = self.points[i - 1], self.points[i]
+        v0, v1 = self.values[i - 1], self.values[i]
+        return v0 + (v1 - v0) * (u - p0) / (p1 - p0) if p1 > p0 else v1
+
+
+class ChaosDecision:
+    """What to do to one request: sleep `delay` seconds, then apply `fault` (a fault dict or None)."""
+    __slots__ = ("delay", "fault")
+
+    def __init__(self, delay=0.0, fault=None):
+        self.delay = delay
+        self.fault = fault
+
+
+NO_CHAOS = ChaosDecision()
+
+
+class ChaosStats:
+    """Injected-fault counters by type for one mock."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {t: 0 for t in ("latency",) + FAULT_TYPES}
+        self.latency_ms_total = 0.0
+
+    def record(self, decision):
+        if decision.delay <= 0 and decision.fault is None:
+            return
+        with self.lock:
+            if decision.delay > 0:
+                self.counts["latency"] += 1
+                self.latency_ms_total += decision.delay * 1000
+            if decision.fault is not None:
+                self.counts[decision.fault["type"]] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts, latency_ms_total=round(self.latency_ms_total, 1))
+
+
+class ChaosConfig:
+    """
+    Parsed chaos settings:
+        {"latency": {"dist": "longtail", "percentiles": {...}},
+         "faults": [{"type": "rate_limit", "probability": 0.05, "retry_after": 2, "schedule": [...]}],
+         "schedule": [{"period_s": 60, "active_s": 15}]}
+    Fault probabilities are exclusive slices of one roll, so they must sum to at most 1.
+    Fault parameters are coerced and range-checked here, so serving never has to.
+    Raises ValueError on anything malformed.
+    """
+    def __init__(self, data):
+        data = dict(data or {})
+        self.latency = Latency(data["latency"]) if data.get("latency") else None
+        self.schedule = Schedule(data.get("schedule"))
+        self.faults = []
+        total = 0.0
+        for spec in data.get("faults") or []:
+            if not isinstance(spec, dict):
+                raise ValueError("Each fault must be an object")
+            kind = spec.get("type")
+            if kind not in FAULT_TYPES:
+                raise ValueError(f"Fault type must be one of {', '.join(FAULT_TYPES)}")
+            fault = dict(FAULT_DEFAULTS[kind], **spec)
+            fault["probability"] = _param(spec, "probability", 0, 0, 1)
+            fault.update(_fault_params(kind, fault))
+            total += fault["probability"]
+            self.faults.append((fault, Schedule(spec.get("schedule"))))
+        if total > 1 + 1e-9:
+            raise ValueError("Fault probabilities sum to more than 1")
+        self.data = data
+
+    @classmethod
+    def legacy(cls, rate=DEFAULT_CHAOS_RATE):
+        """The original behaviour: a plain HTTP 500 with probability `rate`."""
+        return cls({"faults": [{"type": "error", "probability": rate}]})
+
+    def to_dict(self):
+        return self.data
+
+    def decide(self, rng, now=None):
+        now = time.time() if now is None else now
+        if not self.schedule.active(now):
+            return NO_CHAOS
+        delay = 0.0
+        if self.latency is not None and rng.random() < self.latency.probability:
+            delay = self.latency.sample_ms(rng) / 1000.0
+        fault = None
+        if self.faults:
+            roll = rng.random()
+            for spec, schedule in self.faults:
+                if roll < spec["probability"]:
+                    if schedule.active(now):
+                        fault = spec
+                    break
+                roll -= spec["probability"]
+        if not delay and fault is None:
+            return NO_CHAOS
+        return ChaosDecision(delay, fault)
+
+
+def _fault_params(kind, fault):
+    """The parsed, range-checked parameters of one fault type."""
+    if kind == "error":
+        if fault["message"] is not None and not isinstance(fault["message"], str):
+            raise ValueError("'message' must be a string")
+        return {"status": _param(fault, "status", 500, 100, 599, int)}
+    if kind == "rate_limit":
+        return {"retry_after": _param(fault, "retry_after", 1, cast=int)}
+    if kind == "timeout":
+        return {"after_ms": _param(fault, "after_ms", 30000)}
+    if kind == "truncate":
+        return {"fraction": _param(fault, "fraction", 0.5, 0, 1)}
+    if kind == "slow_drip":
+        return {"chunk_bytes": _param(fault, "chunk_bytes", 16, 1, cast=int),
+                "interval_ms": _param(fault, "interval_ms", 100)}
+    return {}
+
+
+def fault_status(fault):
+    """The HTTP status a pre-body fault answers with, or "reset" for a dropped connection."""
+    kind = fault["type"]
+    if kind == "error":
+        return int(fault["status"])
+    return {"rate_limit": 429, "timeout": 504}.get(kind, "reset")
+
+
+# --- BODY FAULTS ---
+def truncate_body(body, fault):
+    """First `fraction` of a complete body: a 200 whose JSON does not parse."""
+    return body[:int(len(body) * float(fault["fraction"]))]
+
+
+def truncate_stream(chunks, fault):
+    """Streams have no known length, so the cut lands inside the first chunk and the rest is dropped."""
+    for chunk in chunks:
+        yield chunk[:max(1, int(len(chunk) * float(fault["fraction"])))]
+        return
+
+
+def drip(chunks, fault):
+    """Re-chunks a body into (piece, pause_seconds) pairs for slow-drip delivery."""
+    size = max(1, int(fault["chunk_bytes"]))
+    pause = float(fault["interval_ms"]) / 1000.0
+    for chunk in chunks:
+        for i in range(0, len(chunk), size):
+            yield chunk[i:i + size], pause
@@ -0,0 +1,724 @@
+"""
+Offline schema compiler for Project Mirage.
+
+Walks a sample JSON document and infers a *plan*: a JSON-serialisable tree that
+describes how to generate each field (ranges, enums, ID formats, date anchors).
+The plan is then turned into the body of a generator function, the same shape
+of code Gemini used to write, so it can be compiled and served without any
+network call. Gemini may refine a plan (see refine_plan) but never replace it.
+"""
+import re
+import copy
+import random
+import datetime
+from collections import Counter
+
+# --- PLAN INFERENCE ---
+ISO_DATETIME_RE = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})([T ])(\d{2}):(\d{2})(?::(\d{2}))?(?:\.(\d{1,6}))?(Z|[+-]\d{2}:?\d{2})?$'
+)
+ISO_DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+UUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+PREFIXED_ID_RE = re.compile(r'^([A-Za-z][A-Za-z0-9]*[_\-:])([0-9A-Za-z]+)$')
+EMAIL_RE = re.compile(r'^[^@\s]+@([^@\s]+\.[^@\s]+)$')
+URL_RE = re.compile(r'^(https?://[^/\s]+)(/\S*)?$')
+ENUM_RE = re.compile(r'^[A-Z][A-Z0-9]*(?:_[A-Z0-9]+)*$')
+
+ENUM_KEYS = ("status", "state", "type", "kind", "category", "level", "tier", "role", "currency", "country", "plan")
+FUTURE_KEYS = ("next", "expires", "expiry", "due", "scheduled", "until", "deadline", "eta")
+PAST_KEYS = ("last", "created", "updated", "modified", "joined", "born", "since", "published")
+EPOCH_MIN, EPOCH_MAX = 10 ** 9, 10 ** 10
+
+WORDS = (
+    "alpha", "bravo", "cipher", "delta", "echo", "falcon", "ghost", "harbor", "ion", "jade",
+    "kilo", "lumen", "matrix", "nova", "orbit", "pixel", "quantum", "raven", "shell", "tango",
+    "ultra", "vector", "willow", "xenon", "yonder", "zephyr", "ember", "frost", "glitch", "hollow",
+)
+CHARSETS = {"alnum": "abcdefghijklmnopqrstuvwxyz0123456789", "upper": "ABCDEFGHIJKLMNOPQRSTUVWXYZ"}
+
+LEAF_TYPES = ("null", "bool", "int", "float", "string", "choice", "id", "uuid", "email", "url", "datetime", "date")
+CONTAINER_TYPES = ("object", "array", "subset")
+
+# The sample the dashboard's editor opens with; the benchmark deploys it as user_profile
+SAMPLE_PROFILE = {
+    "user_id": "usr_8821",
+    "username": "GhostInShell",
+    "account_balance": 4500.50,
+    "is_verified": True,
+    "last_login": "2025-11-20T14:00:00Z",
+    "roles": ["admin", "editor"],
+}
+MAX_LEARNED_CHOICES = 16  # distinct strings a recorded field may have and still be learned as an enum
+
+
+def _key_hint(key, words):
+    key = (key or "").lower()
+    return any(w in key for w in words)
+
+
+def _direction(key):
+    if _key_hint(key, FUTURE_KEYS):
+        return "future"
+    if _key_hint(key, PAST_KEYS):
+        return "past"
+    return "around"
+
+
+def _infer_datetime(key, value, match):
+    year, month, day, sep, hour, minute, second, frac, zone = match.groups()
+    fmt = "%Y-%m-%d" + sep + "%H:%M" + (":%S" if second is not None else "")
+    anchor = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0))
+    return {
+        "type": "datetime",
+        "anchor": anchor.strftime("%Y-%m-%dT%H:%M:%S"),
+        "spread_days": 30,
+        "direction": _direction(key),
+        "format": fmt,
+        "frac_digits": len(frac) if frac else 0,
+        "suffix": zone or "",
+    }
+
+
+def _infer_string(key, value):
+    # Shaped like a date but not a real one (2025-02-30, 2025-13-01): plain text
+    match = ISO_DATETIME_RE.match(value)
+    if match:
+        try:
+            return _infer_datetime(key, value, match)
+        except (ValueError, OverflowError):
+            return _infer_text(value)
+    match = ISO_DATE_RE.match(value)
+    if match:
+        try:
+            datetime.date.fromisoformat(value)
+        except ValueError:
+            return _infer_text(value)
+        return {"type": "date", "anchor": value, "spread_days": 365, "direction": _direction(key), "format": "%Y-%m-%d"}
+    if UUID_RE.match(value):
+        return {"type": "uuid"}
+    match = EMAIL_RE.match(value)
+    if match:
+        return {"type": "email", "domain": match.group(1)}
+    match = URL_RE.match(value)
+    if match:
+        return {"type": "url", "base": match.group(1)}
+    match = PREFIXED_ID_RE.match(value)
+    if match:
+        prefix, tail = match.groups()
+        if tail.isdigit():
+            return {"type": "id", "prefix": prefix, "charset": "digits", "length": len(tail)}
+        if len(tail) >= 6 and re.fullmatch(r'[0-9a-f]+', tail) and re.search(r'\d', tail):
+            return {"type": "id", "prefix": prefix, "charset": "hex", "length": len(tail)}
+        if len(tail) >= 6 and re.search(r'\d', tail):
+            return {"type": "id", "prefix": prefix, "charset": "alnum", "length": len(tail)}
+        if tail.isalpha() and tail.isupper() and len(tail) <= 3:
+            # Zone-A, Bay-C: keep the prefix, vary the short code
+            return {"type": "id", "prefix": prefix, "charset": "upper", "length": len(tail)}
+    if value.isdigit() and (key or "").lower().endswith("id"):
+        return {"type": "id", "prefix": "", "charset": "digits", "length": len(value)}
+    if (ENUM_RE.match(value) and len(value) <= 32) or (_key_hint(key, ENUM_KEYS) and " " not in value):
+        return {"type": "choice", "values": [value]}
+    return _infer_text(value)
+
+
+def _infer_text(value):
+    if " " in value.strip():
+        count = len(value.split())
+        return {"type": "string", "style": "sentence", "min_words": max(1, count // 2), "max_words": max(1, count * 2)}
+    if value[:1].isupper() and any(c.islower() for c in value):
+        return {"type": "string", "style": "title", "min_words": 1, "max_words": 3}
+    sep = next((c for c in "_-." if c in value), "")
+    return {"type": "string", "style": "lower", "sep": sep, "min_words": 1, "max_words": 2 if sep else 1}
+
+
+def _infer_number(key, value):
+    if isinstance(value, int):
+        if EPOCH_MIN <= abs(value) < EPOCH_MAX * 1000:
+            # Unix timestamps (seconds or millis) wander a month around the sample
+            spread = 30 * 86400 * (1000 if abs(value) >= EPOCH_MAX else 1)
+            return {"type": "int", "min": value - spread, "max": value + spread}
+        if value >= 0:
+            return {"type": "int", "min": 0, "max": max(10, value * 2)}
+        return {"type": "int", "min": value * 2, "max": -value * 2}
+    text = repr(value)
+    decimals = len(text.split(".")[1]) if "." in text and "e" not in text else 2
+    bound = max(10.0, abs(value) * 2)
+    return {"type": "float", "min": 0.0 if value >= 0 else -bound, "max": bound, "decimals": min(6, max(2, decimals))}
+
+
+def _array_bounds(n):
+    if n == 0:
+        return 0, 0
+    return max(1, n // 2), max(1, n * 2)
+
+
+def infer_plan(sample, key=None):
+    """
+    Infers a generation plan from a sample JSON value.
+    Objects keep their key order; arrays of scalar strings become enum subsets.
+    """
+    if sample is None:
+        return {"type": "null"}
+    if isinstance(sample, bool):
+        return {"type": "bool", "p_true": 0.5}
+    if isinstance(sample, (int, float)):
+        return _infer_number(key, sample)
+    if isinstance(sample, str):
+        return _infer_string(key, sample)
+    if isinstance(sample, dict):
+        return {"type": "object", "fields": {k: infer_plan(v, k) for k, v in sample.items()}}
+    if isinstance(sample, list):
+        low, high = _array_bounds(len(sample))
+        if sample and all(isinstance(v, str) for v in sample):
+            item_plans = [_infer_string(key, v) for v in sample]
+            if all(p["type"] in ("choice", "string") for p in item_plans):
+                values = list(dict.fromkeys(sample))
+                return {"type": "subset", "values": values, "min_items": 1, "max_items": len(values)}
+        items = {"type": "null"}
+        for i, item in enumerate(sample):
+            plan = infer_plan(item, key)
+            items = plan if i == 0 else merge_plans(items, plan)
+        return {"type": "array", "items": items, "min_items": low, "max_items": high}
+    return {"type": "null"}
+
+
+def merge_plans(a, b):
+    """
+    Merges two plans for the same field into one that covers both:
+    ranges widen, enum values union, object fields missing on one side become optional.
+    """
+    ta, tb = a.get("type"), b.get("type")
+    if ta == "null" and tb != "null":
+        return dict(b, nullable=True)
+    if tb == "null" and ta != "null":
+        return dict(a, nullable=True)
+    if {ta, tb} == {"array", "subset"}:
+        # An empty sample array says nothing about its items; the strings on the other side do
+        array, subset = (a, b) if ta == "array" else (b, a)
+        if array["max_items"] == 0:
+            return dict(subset, min_items=0)
+        return a
+    if {ta, tb} == {"int", "float"}:
+        decimals = max(a.get("decimals", 2), b.get("decimals", 2))
+        return {"type": "float", "min": float(min(a["min"], b["min"])), "max": float(max(a["max"], b["max"])), "decimals": decimals}
+    if ta != tb:
+        if ta in ("choice", "string") and tb in ("choice", "string"):
+            # A free-text sample widens an enum back to plain text
+            return a if ta == "string" else b
+        return a
+    merged = dict(a)
+    if ta in ("int", "float"):
+        merged["min"] = min(a["min"], b["min"])
+        merged["max"] = max(a["max"], b["max"])
+        if ta == "float":
+            merged["decimals"] = max(a.get("decimals", 2), b.get("decimals", 2))
+    elif ta in ("choice", "subset"):
+        merged["values"] = list(dict.fromkeys(list(a["values"]) + list(b["values"])))
+        if ta == "subset":
+            merged["min_items"] = min(a.get("min_items", 1), b.get("min_items", 1))
+            merged["max_items"] = max(a.get("max_items", 1), b.get("max_items", 1))
+    elif ta == "string":
+        merged["min_words"] = min(a.get("min_words", 1), b.get("min_words", 1))
+        merged["max_words"] = max(a.get("max_words", 1), b.get("max_words", 1))
+    elif ta == "id":
+        merged["length"] = max(a.get("length", 1), b.get("length", 1))
+    elif ta == "object":
+        fields = {}
+        for k in list(a["fields"]) + [k for k in b["fields"] if k not in a["fields"]]:
+            if k in a["fields"] and k in b["fields"]:
+                fields[k] = merge_plans(a["fields"][k], b["fields"][k])
+            else:
+                fields[k] = dict(a["fields"].get(k) or b["fields"][k], optional=True)
+        merged["fields"] = fields
+    elif ta == "array":
+        if a["max_items"] == 0 or b["max_items"] == 0:
+            merged["items"] = b["items"] if a["max_items"] == 0 else a["items"]
+        else:
+            merged["items"] = merge_plans(a["items"], b["items"])
+        merged["min_items"] = min(a["min_items"], b["min_items"])
+        merged["max_items"] = max(a["max_items"], b["max_items"])
+    return merged
+
+
+# --- LEARNING FROM MANY SAMPLES ---
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _parse_time(plan, value):
+    try:
+        if plan["type"] == "date":
+            return datetime.datetime.strptime(value, plan.get("format", "%Y-%m-%d"))
+        match = ISO_DATETIME_RE.match(value)
+        if match:
+            year, month, day, _, hour, minute, second = match.groups()[:7]
+            return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _as_choice(plan, counts):
+    # Seen often enough to be an enum: replay the observed mix, not a uniform pick
+    for attr in ("style", "sep", "min_words", "max_words", "min", "max"):
+        plan.pop(attr, None)
+    plan["type"] = "choice"
+    plan["values"] = list(counts)
+    plan["weights"] = list(counts.values())
+
+
+def _is_enum(counts):
+    return 0 < len(counts) <= MAX_LEARNED_CHOICES and sum(counts.values()) >= 2 * len(counts)
+
+
+def _fit_leaf(plan, values):
+    kind = plan["type"]
+    if kind in ("int", "float"):
+        numbers = [v for v in values if (type(v) is int if kind == "int" else _is_number(v))]
+        counts = Counter(numbers)
+        if kind == "int" and len(numbers) >= 4 * len(counts) and _is_enum(counts):
+            _as_choice(plan, counts)
+        elif len(numbers) >= 2:
+            plan["min"], plan["max"] = min(numbers), max(numbers)
+            if kind == "float":
+                plan["min"], plan["max"] = float(plan["min"]), float(plan["max"])
+    elif kind == "bool":
+        flags = [v for v in values if isinstance(v, bool)]
+        if flags:
+            plan["p_true"] = round(sum(flags) / len(flags), 4)
+    elif kind in ("choice", "string"):
+        counts = Counter(v for v in values if isinstance(v, (str, int, float, bool)))
+        if counts and (kind == "choice" or _is_enum(counts)):
+            _as_choice(plan, counts)
+        elif plan.get("style") in ("sentence", "title") and counts:
+            words = [len(str(v).split()) for v in counts]
+            plan["min_words"], plan["max_words"] = max(1, min(words)), max(1, max(words))
+    elif kind in ("datetime", "date"):
+        times = [t for t in (_parse_time(plan, v) for v in values if isinstance(v, str)) if t is not None]
+        if len(times) >= 2 and min(times) < max(times):
+            low, high = min(times), max(times)
+            plan["anchor"] = low.strftime("%Y-%m-%dT%H:%M:%S") if kind == "datetime" else low.strftime("%Y-%m-%d")
+            plan["direction"] = "future"
+            days = (high - low).total_seconds() / 86400
+            plan["spread_days"] = round(days, 4) if kind == "datetime" else max(1, int(round(days)))
+
+
+def fit_plan(plan, values):
+    """
+    Tunes a plan (normally merge_plans over the same samples) to the values observed
+    at its node, in place: numeric ranges and date spans shrink to what was seen,
+    bools and low-cardinality strings get their observed frequencies, and
+    optional/nullable fields their observed presence and null rates.
+    """
+    if plan.get("nullable"):
+        plan["p_null"] = round(sum(1 for v in values if v is None) / max(1, len(values)), 4)
+    values = [v for v in values if v is not None]
+    kind = plan["type"]
+    if kind == "object":
+        records = [v for v in values if isinstance(v, dict)]
+        for key, child in plan["fields"].items():
+            present = [r[key] for r in records if key in r]
+            if child.get("optional") and records:
+                child["p_present"] = round(len(present) / len(records), 4)
+            fit_plan(child, present)
+    elif kind in ("array", "subset"):
+        lists = [v for v in values if isinstance(v, list)]
+        if lists:
+            lengths = [len(v) for v in lists]
+            plan["min_items"], plan["max_items"] = min(lengths), max(lengths)
+            if kind == "array":
+                fit_plan(plan["items"], [item for v in lists for item in v])
+    else:
+        _fit_leaf(plan, values)
+    return plan
+
+
+def plan_from_samples(samples):
+    """
+    One plan covering every sample (e.g. responses recorded from a real API), with the
+    value distributions fitted to them rather than guessed from a single example.
+    """
+    if not samples:
+        raise ValueError("Need at least one sample")
+    plan = infer_plan(samples[0])
+    for sample in samples[1:]:
+        plan = merge_plans(plan, infer_plan(sample))
+    return fit_plan(copy.deepcopy(plan), samples)
+
+
+# --- PLAN REFINEMENT ---
+LEAF_ATTRS = {
+    "bool": ("p_true",),
+    "int": ("min", "max"),
+    "float": ("min", "max", "decimals"),
+    "string": ("style", "sep", "min_words", "max_words", "values"),
+    "choice": ("values", "weights"),
+    "id": ("prefix", "charset", "length"),
+    "uuid": (),
+    "email": ("domain",),
+    "url": ("base",),
+    "datetime": ("anchor", "spread_days", "direction", "format", "frac_digits", "suffix"),
+    "date": ("anchor", "spread_days", "direction", "format"),
+    "null": (),
+}
+
+
+def refine_plan(local, proposed):
+    """
+    Applies a model-proposed plan on top of a locally inferred one.
+    The local structure always wins: keys, nesting and array shape are kept,
+    and only known attributes of leaves (or a leaf-for-leaf type swap) are taken.
+    Anything that fails to compile falls back to the local node.
+    """
+    if not isinstance(proposed, dict):
+        return local
+    kind = local.get("type")
+    if kind == "object":
+        fields = proposed.get("fields") if isinstance(proposed.get("fields"), dict) else {}
+        refined = dict(local)
+        refined["fields"] = {k: refine_plan(v, fields.get(k)) for k, v in local["fields"].items()}
+        return refined
+    if kind == "array":
+        refined = dict(local)
+        refined["items"] = refine_plan(local["items"], proposed.get("items"))
+        for attr in ("min_items", "max_items"):
+            if isinstance(proposed.get(attr), int) and proposed[attr] >= 0:
+                refined[attr] = proposed[attr]
+        return refined if refined["min_items"] <= refined["max_items"] else local
+    if kind == "subset":
+        refined = dict(local)
+        if isinstance(proposed.get("values"), list) and proposed["values"]:
+            refined["values"] = proposed["values"]
+        return refined
+    new_kind = proposed.get("type", kind)
+    if new_kind not in LEAF_TYPES:
+        return local
+    refined = {"type": new_kind} if new_kind != kind else dict(local)
+    for attr in LEAF_ATTRS[new_kind]:
+        if attr in proposed:
+            refined[attr] = proposed[attr]
+    if isinstance(proposed.get("expr"), str):
+        refined["expr"] = proposed["expr"]
+    for attr in ("nullable", "optional", "p_null", "p_present"):
+        if attr in local:
+            refined[attr] = local[attr]
+    try:
+        _leaf_expr(refined)
+        if "expr" in refined:
+            compile(refined["expr"], "<plan>", "eval")
+    except Exception:
+        return local
+    return refined
+
+
+# --- CODE GENERATION ---
+def _const(value):
+    """Python literal for a plan constant; lists become tuples so they fold into code constants."""
+    if isinstance(value, list):
+        return repr(tuple(value))
+    return repr(value)
+
+
+def _datetime_expr(plan):
+    anchor = datetime.datetime.fromisoformat(plan["anchor"])
+    seconds = int(plan.get("spread_days", 30) * 86400)
+    low, high = {"future": (0, seconds), "past": (-seconds, 0)}.get(plan.get("direction"), (-seconds, seconds))
+    base = (
+        f"(datetime.datetime({anchor.year}, {anchor.month}, {anchor.day}, {anchor.hour}, {anchor.minute}, {anchor.second})"
+        f" + datetime.timedelta(seconds=random.randint({low}, {high}))).strftime({plan['format']!r})"
+    )
+    digits = plan.get("frac_digits", 0)
+    if digits:
+        base += f" + '.%0{digits}d' % random.randrange({10 ** digits})"
+    if plan.get("suffix"):
+        base += f" + {plan['suffix']!r}"
+    return base
+
+
+def _date_expr(plan):
+    anchor = datetime.date.fromisoformat(plan["anchor"])
+    days = int(plan.get("spread_days", 365))
+    low, high = {"future": (0, days), "past": (-days, 0)}.get(plan.get("direction"), (-days, days))
+    return (
+        f"(datetime.date({anchor.year}, {anchor.month}, {anchor.day})"
+        f" + datetime.timedelta(days=random.randint({low}, {high}))).strftime({plan.get('format', '%Y-%m-%d')!r})"
+    )
+
+
+def _string_expr(plan):
+    if plan.get("values"):
+        return f"random.choice({_const(plan['values'])})"
+    low, high = int(plan.get("min_words", 1)), int(plan.get("max_words", 1))
+    count = str(low) if low == high else f"random.randint({low}, {high})"
+    style = plan.get("style", "lower")
+    if style == "title":
+        return f"''.join(w.title() for w in random.sample({_const(WORDS)}, {count}))"
+    if style == "sentence":
+        return f"' '.join(random.choices({_const(WORDS)}, k={count})).capitalize()"
+    return f"{plan.get('sep', '')!r}.join(random.sample({_const(WORDS)}, {count}))"
+
+
+def _leaf_expr(plan):
+    """Python expression producing one value for a leaf plan node."""
+    if "expr" in plan:
+        return plan["expr"]
+    kind = plan["type"]
+    if kind == "null":
+        return "None"
+    if kind == "bool":
+        return f"random.random() < {float(plan.get('p_true', 0.5))!r}"
+    if kind == "int":
+        return f"random.randint({int(plan['min'])}, {int(plan['max'])})"
+    if kind == "float":
+        return f"round(random.uniform({float(plan['min'])!r}, {float(plan['max'])!r}), {int(plan.get('decimals', 2))})"
+    if kind == "choice":
+        if plan.get("weights"):
+            return f"random.choices({_const(plan['values'])}, weights={_const(plan['weights'])})[0]"
+        return f"random.choice({_const(plan['values'])})"
+    if kind == "string":
+        return _string_expr(plan)
+    if kind == "id":
+        length, prefix = int(plan["length"]), plan.get("prefix", "")
+        if plan.get("charset") == "digits":
+            return f"{prefix + '%0' + str(length) + 'd'!r} % random.randrange({10 ** length})"
+        if plan.get("charset") == "hex":
+            return f"{prefix + '%0' + str(length) + 'x'!r} % random.getrandbits({4 * length})"
+        chars = CHARSETS.get(plan.get("charset"), CHARSETS["alnum"])
+        return f"{prefix!r} + ''.join(random.choices({chars!r}, k={length}))"
+    if kind == "uuid":
+        return "str(uuid.UUID(int=random.getrandbits(128), version=4))"
+    if kind == "email":
+        return f"'%s%d@%s' % (random.choice({_const(WORDS)}), random.randrange(1000), {plan['domain']!r})"
+    if kind == "url":
+        return f"'%s/%s/%d' % ({plan['base']!r}, random.choice({_const(WORDS)}), random.randrange(100000))"
+    if kind == "datetime":
+        return _datetime_expr(plan)
+    if kind == "date":
+        return _date_expr(plan)
+    raise ValueError(f"Unknown plan type: {kind}")
+
+
+class _Emitter:
+    """Accumulates indented statements and hands out unique temporaries."""
+    def __init__(self):
+        self.lines = []
+        self.counter = 0
+
+    def temp(self, stem):
+        self.counter += 1
+        return f"_{stem}{self.counter}"
+
+    def emit(self, depth, line):
+        self.lines.append("    " * depth + line)
+
+
+def _emit_value(em, plan, depth):
+    """Emits the statements for a plan node and returns the expression holding its value."""
+    kind = plan["type"]
+    if kind == "object":
+        name = em.temp("obj")
+        em.emit(depth, f"{name} = {{}}")
+        for key, child in plan["fields"].items():
+            inner = depth
+            if child.get("optional"):
+                em.emit(depth, f"if random.random() < {float(child.get('p_present', 0.8))!r}:")
+                inner += 1
+            value = _emit_value(em, child, inner)
+            em.emit(inner, f"{name}[{key!r}] = {value}")
+        return name
+    if kind == "array":
+        name = em.temp("arr")
+        low, high = int(plan["min_items"]), int(plan["max_items"])
+        count = str(low) if low == high else f"random.randint({low}, {high})"
+        if plan["items"]["type"] in CONTAINER_TYPES:
+            em.emit(depth, f"{name} = []")
+            em.emit(depth, f"for _ in range({count}):")
+            item = _emit_value(em, plan["items"], depth + 1)
+            em.emit(depth + 1, f"{name}.append({item})")
+        else:
+            em.emit(depth, f"{name} = [{_nullable(plan['items'], _leaf_expr(plan['items']))} for _ in range({count})]")
+        return name
+    if kind == "subset":
+        values = _const(plan["values"])
+        low = min(int(plan.get("min_items", 1)), len(plan["values"]))
+        high = min(int(plan.get("max_items", len(plan["values"]))), len(plan["values"]))
+        return f"random.sample({values}, random.randint({low}, {high}))"
+    return _nullable(plan, _leaf_expr(plan))
+
+
+def _nullable(plan, expr):
+    if plan.get("nullable") and plan["type"] != "null":
+        return f"({expr} if random.random() < {1.0 - float(plan.get('p_null', 0.1))!r} else None)"
+    return expr
+
+
+def plan_to_code(plan):
+    """
+    Renders a plan as the BODY of a generator function that ends in 'return data'.
+    The body only uses the random, datetime and uuid names, like Gemini's output did.
+    """
+    em = _Emitter()
+    value = _emit_value(em, plan, 0)
+    em.emit(0, f"data = {value}")
+    em.emit(0, "return data")
+    return "\n".join(em.lines)
+
+
+# --- VALIDATION ---
+JSON_NAMES = {dict: "object", list: "array", str: "string", int: "int", float: "number", bool: "bool", type(None): "null"}
+STRING_TYPES = ("string", "id", "uuid", "email", "url", "datetime", "date")
+_MISSING = object()
+
+
+def _json_name(value):
+    return JSON_NAMES.get(type(value), type(value).__name__)
+
+
+def _key_diffs(where, record, required, allowed, diff):
+    for key in required - record.keys():
+        diff((f"{where}.{key}", "present", "missing"))
+    for key in record.keys() - allowed:
+        diff((f"{where}.{key}", "absent", "unexpected key"))
+
+
+def _leaf_types(plan):
+    """(Python type names a leaf may hold, JSON name to report), or (None, None) when anything goes."""
+    kind = plan["type"]
+    if kind in STRING_TYPES:
+        return ("str",), "string"
+    if kind == "int":
+        return ("int",), "int"
+    if kind == "float":
+        return ("int", "float"), "number"
+    if kind == "bool":
+        return ("bool",), "bool"
+    if kind == "choice" and plan.get("values"):
+        values = plan["values"]
+        names = tuple(sorted({type(v).__name__ for v in values}))
+        if all(name in ("str", "int", "float", "bool", "NoneType") for name in names):
+            return names, "/".join(sorted({_json_name(v) for v in values}))
+    return None, None
+
+
+class _CheckEmitter(_Emitter):
+    """An _Emitter that also hoists constants (key sets) out of the generated function."""
+    def __init__(self):
+        super().__init__()
+        self.consts = {}
+
+    def const(self, value):
+        name = self.temp("K")
+        self.consts[name] = value
+        return name
+
+
+def _emit_check(em, plan, var, path, depth):
+    """
+    Emits the checks of one plan node against the value held in `var`. `path` is a
+    (%-format, loop index names) pair, only formatted on a failing branch.
+    Returns False if the node accepts anything, so nothing was emitted.
+    """
+    fmt, args = path
+    where = f"{fmt!r} % ({', '.join(args)},)" if args else repr(fmt)
+    kind = plan["type"]
+    nullable = plan.get("nullable") and kind != "null"
+    present = f"{var} is not None and " if nullable else ""
+    if kind == "object":
+        fields = plan["fields"]
+        required = frozenset(k for k, c in fields.items() if not c.get("optional"))
+        required_name = em.const(required)
+        em.emit(depth, f"if {present}type({var}) is not dict:")
+        em.emit(depth + 1, f"_diff(({where}, 'object', _name({var})))")
+        em.emit(depth, f"elif {var} is not None:" if nullable else "else:")
+        if required == frozenset(fields):
+            em.emit(depth + 1, f"if {var}.keys() != {required_name}:")
+            em.emit(depth + 2, f"_keys({where}, {var}, {required_name}, {required_name}, _diff)")
+        else:
+            allowed_name = em.const(frozenset(fields))
+            em.emit(depth + 1, f"if not ({required_name} <= {var}.keys() <= {allowed_name}):")
+            em.emit(depth + 2, f"_keys({where}, {var}, {required_name}, {allowed_name}, _diff)")
+        for key, child in fields.items():
+            child_var = em.temp("v")
+            em.emit(depth + 1, f"{child_var} = {var}.get({key!r}, _MISSING)")
+            em.emit(depth + 1, f"if {child_var} is not _MISSING:")
+            key_fmt = fmt + "." + str(key).replace("%", "%%")
+            if not _emit_check(em, child, child_var, (key_fmt, args), depth + 2):
+                em.lines.pop()
+                em.lines.pop()
+        return True
+    if kind in ("array", "subset"):
+        em.emit(depth, f"if {present}type({var}) is not list:")
+        em.emit(depth + 1, f"_diff(({where}, 'array', _name({var})))")
+        items = plan["items"] if kind == "array" else {"type": "choice", "values": plan.get("values")}
+        index, item = em.temp("i"), em.temp("v")
+        mark = len(em.lines)
+        em.emit(depth, f"elif {var} is not None:" if nullable else "else:")
+        em.emit(depth + 1, f"for {index}, {item} in enumerate({var}):")
+        if not _emit_check(em, items, item, (fmt + "[%d]", args + [index]), depth + 2):
+            del em.lines[mark:]
+        return True
+    names, label = _leaf_types(plan)
+    if names is None:
+        return False
+    test = f"type({var}) is not {names[0]}" if len(names) == 1 else f"type({var}) not in ({', '.join(names)})"
+    em.emit(depth, f"if {present}{test}:")
+    em.emit(depth + 1, f"_diff(({where}, {label!r}, _name({var})))")
+    return True
+
+
+def validator_source(plan):
+    """Source of check_record(record) -> [(path, expected, got), ...] for records of `plan`'s shape, and its constants."""
+    em = _CheckEmitter()
+    em.emit(0, "def check_record(data):")
+    em.emit(1, "_diffs = []")
+    em.emit(1, "_diff = _diffs.append")
+    _emit_check(em, plan, "data", ("$", []), 1)
+    em.emit(1, "return _diffs")
+    return "\n".join(em.lines) + "\n", em.consts
+
+
+def compile_validator(plan):
+    """
+    Compiles a plan (normally the one inferred from the sample) into a checker.
+    All type and key checks are unrolled into straight-line code with the key sets
+    precomputed, so a valid record costs one pass and no schema walk.
+    Nullable fields may be None and optional fields may be absent.
+    """
+    source, consts = validator_source(plan)
+    namespace = dict(consts, _MISSING=_MISSING, _name=_json_name, _keys=_key_diffs)
+    exec(source, namespace)
+    return namespace["check_record"]
+
+
+def format_diff(diff):
+    path, expected, got = diff
+    return f"{path}: expected {expected}, got {got}"
+
+
+# --- GENERATOR WRAPPING ---
+def generator_source(code_body):
+    """
+    Wraps a generator body in a real function definition. `random` is a parameter
+    defaulting to the module, so callers can pass a seeded random.Random.
+    """
+    full_code = "def dynamic_generator(random=random):\n"
+    full_code += "    import datetime, uuid\n"
+    # Indent every line of the body by 4 spaces
+    for line in code_body.splitlines():
+        full_code += f"    {line}\n"
+    return full_code
+
+
+def load_generator(full_code):
+    """Compiles wrapped generator source and returns the function."""
+    local_ns = {}
+    exec(full_code, {"random": random}, local_ns)
+    return local_ns['dynamic_generator']
+
+
+def record_rng(mock_name, seed, index, stream="data"):
+    """
+    Independent RNG for record `index` of `mock_name` under `seed`.
+    String seeds hash identically in every process, so (mock, seed, index) always replays the same record.
+    """
+    return random.Random(f"{mock_name}:{seed}:{index}:{stream}")
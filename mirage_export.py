@@ -0,0 +1,398 @@
+"""
+Standalone server export for Project Mirage.
+
+Turns a deployed mock's plan into one self-contained Flask module, the kind of
+file gemini_shadow_server.py was pasted by hand. Besides the per-record
+dynamic_generator, the module carries bulk_generator(n): a column-wise variant
+that draws every numeric, enum, ID and date field for all n rows at once with
+NumPy and only then zips the columns into dicts. Fields that have no vector
+form (arrays of objects, Gemini expressions, IDs too wide for int64) fall back
+to the per-record code for that column alone. Without NumPy installed the exported
+module still runs; bulk_generator just loops.
+
+    python mirage_export.py --schema sample.json --name inventory -o inventory_server.py
+    python mirage_export.py --server http://localhost:5000 --name inventory -o inventory_server.py
+"""
+import gc
+import sys
+import json
+import random
+import hashlib
+import datetime
+import argparse
+
+try:
+    import numpy as np
+except ImportError:  # bulk generators still load; they loop per record instead
+    np = None
+
+from mirage_compiler import (
+    WORDS, CHARSETS, CONTAINER_TYPES, _Emitter, _const, infer_plan, plan_to_code, generator_source,
+)
+
+MAX_EXPORT_COUNT = 100000  # ?count= cap in the exported server
+FIXTURE_CHUNK = 100000     # rows per bulk_generator call when writing fixtures
+VECTOR_DATETIME_FORMATS = {
+    "%Y-%m-%d": "D", "%Y-%m-%dT%H:%M:%S": "s", "%Y-%m-%d %H:%M:%S": "s", "%Y-%m-%dT%H:%M": "m", "%Y-%m-%d %H:%M": "m",
+}
+
+
+# --- BULK (COLUMN-WISE) CODE GENERATION ---
+def _row_wise(em, plan, depth):
+    """Column built by calling the per-record code n times, for nodes with no vector form."""
+    plan = {k: v for k, v in plan.items() if k != "optional"}
+    func = em.temp("row")
+    em.emit(depth, f"def {func}(random):")
+    for line in plan_to_code(plan).splitlines():
+        em.emit(depth + 1, line)
+    col = em.temp("col")
+    em.emit(depth, f"{col} = [{func}(prng) for _ in range(n)]")
+    return col
+
+
+def _datetime_column(em, plan, depth, col, unit):
+    """datetime64 arithmetic over the whole column; ISO layouts stringify in C, others via strftime."""
+    fmt = plan.get("format", "%Y-%m-%d")
+    if plan["type"] == "date":
+        step, span = "D", int(plan.get("spread_days", 365))
+        anchor = plan["anchor"]
+    else:
+        step, span = "s", int(plan.get("spread_days", 30) * 86400)
+        anchor = datetime.datetime.fromisoformat(plan["anchor"]).strftime("%Y-%m-%dT%H:%M:%S")
+    low, high = {"future": (0, span), "past": (-span, 0)}.get(plan.get("direction"), (-span, span))
+    em.emit(depth, f"{col} = np.datetime64({anchor!r}, {step!r}) + rng.integers({low}, {high}, n, endpoint=True)")
+    if unit is not None:
+        em.emit(depth, f"{col} = np.datetime_as_string({col}, unit={unit!r}).tolist()")
+        if " " in fmt:
+            em.emit(depth, f"{col} = [_v.replace('T', ' ') for _v in {col}]")
+    else:
+        em.emit(depth, f"{col} = [_v.strftime({fmt!r}) for _v in {col}.astype(object)]")
+    digits = plan.get("frac_digits", 0) if plan["type"] == "datetime" else 0
+    suffix = plan.get("suffix", "") if plan["type"] == "datetime" else ""
+    if digits:
+        em.emit(depth, f"{col} = ['%s.%0{digits}d%s' % (_v, _f, {suffix!r}) for _v, _f in zip({col}, rng.integers(0, {10 ** digits}, n).tolist())]")
+    elif suffix:
+        em.emit(depth, f"{col} = [_v + {suffix!r} for _v in {col}]")
+    return col
+
+
+BULK_HELPERS = '''
+def _distinct_indices(rng, n, k, m):
+    """(n, m) grid of indices below k, distinct within each row: m draws without replacement per row."""
+    grid = rng.integers(0, k, (n, m))
+    for j in range(1, m):
+        while True:
+            clash = (grid[:, :j] == grid[:, j:j + 1]).any(axis=1)
+            if not clash.any():
+                break
+            grid[clash, j] = rng.integers(0, k, int(clash.sum()))
+    return grid
+'''
+
+
+def _word_rows(em, depth, col, values, low, high, distinct, first=None):
+    """
+    Emits `col` as n lists of low..high items from `values`, drawn from one index grid.
+    `first` optionally swaps in a different vocabulary for the first item (sentence capitalisation).
+    """
+    k = len(values)
+    em.emit(depth, f"_vals = np.array({_const(values)}, dtype=object)")
+    if distinct:
+        em.emit(depth, f"_grid = _distinct_indices(rng, n, {k}, {high})")
+    else:
+        em.emit(depth, f"_grid = rng.integers(0, {k}, (n, {high}))")
+    if first is not None:
+        em.emit(depth, f"_rows = np.concatenate([np.array({_const(first)}, dtype=object)[_grid[:, :1]], _vals[_grid[:, 1:]]], axis=1).tolist()")
+    else:
+        em.emit(depth, "_rows = _vals[_grid].tolist()")
+    if low == high:
+        em.emit(depth, f"{col} = _rows")
+    else:
+        em.emit(depth, f"{col} = [_r[:_c] for _r, _c in zip(_rows, rng.integers({low}, {high}, n, endpoint=True).tolist())]")
+
+
+def _string_column(em, plan, depth, col):
+    low, high = int(plan.get("min_words", 1)), int(plan.get("max_words", 1))
+    style = plan.get("style", "lower")
+    if style == "sentence":
+        _word_rows(em, depth, col, WORDS, low, high, False, first=[w.capitalize() for w in WORDS])
+        em.emit(depth, f"{col} = [' '.join(_r) for _r in {col}]")
+        return col
+    if high > len(WORDS):
+        return None
+    if style == "title":
+        _word_rows(em, depth, col, [w.title() for w in WORDS], low, high, True)
+        em.emit(depth, f"{col} = [''.join(_r) for _r in {col}]")
+    else:
+        _word_rows(em, depth, col, WORDS, low, high, True)
+        em.emit(depth, f"{col} = [{plan.get('sep', '')!r}.join(_r) for _r in {col}]")
+    return col
+
+
+def _leaf_column(em, plan, depth):
+    """Emits a vectorized column for a leaf, or returns None when the leaf has no vector form."""
+    kind = plan["type"]
+    col = em.temp("col")
+    if kind == "null":
+        em.emit(depth, f"{col} = [None] * n")
+    elif kind == "bool":
+        em.emit(depth, f"{col} = (rng.random(n) < {float(plan.get('p_true', 0.5))!r}).tolist()")
+    elif kind == "int":
+        em.emit(depth, f"{col} = rng.integers({int(plan['min'])}, {int(plan['max'])}, n, endpoint=True).tolist()")
+    elif kind == "float":
+        em.emit(depth, f"{col} = np.round(rng.uniform({float(plan['min'])!r}, {float(plan['max'])!r}, n), {int(plan.get('decimals', 2))}).tolist()")
+    elif kind in ("choice", "string") and plan.get("values"):
+        values = _const(plan["values"])
+        if kind == "choice" and plan.get("weights"):
+            em.emit(depth, f"_w = np.asarray({_const(plan['weights'])}, dtype=float)")
+            em.emit(depth, f"{col} = np.array({values}, dtype=object)[rng.choice(len(_w), n, p=_w / _w.sum())].tolist()")
+        else:
+            em.emit(depth, f"{col} = np.array({values}, dtype=object)[rng.integers(0, {len(plan['values'])}, n)].tolist()")
+    elif kind == "string":
+        return _string_column(em, plan, depth, col)
+    elif kind == "id":
+        length, prefix, charset = int(plan["length"]), plan.get("prefix", ""), plan.get("charset")
+        if charset == "digits" and length <= 18:
+            em.emit(depth, f"{col} = [{prefix + '%0' + str(length) + 'd'!r} % _v for _v in rng.integers(0, {10 ** length}, n).tolist()]")
+        elif charset == "hex" and length <= 15:
+            em.emit(depth, f"{col} = [{prefix + '%0' + str(length) + 'x'!r} % _v for _v in rng.integers(0, {16 ** length}, n).tolist()]")
+        elif charset not in ("digits", "hex"):
+            # An (n, length) grid of single characters viewed as n strings of `length`
+            chars = CHARSETS.get(charset, CHARSETS["alnum"])
+            em.emit(depth, f"{col} = np.array({_const(list(chars))})[rng.integers(0, {len(chars)}, (n, {length}))].view('<U{length}').ravel().tolist()")
+            if prefix:
+                em.emit(depth, f"{col} = [{prefix!r} + _v for _v in {col}]")
+        else:
+            return None
+    elif kind == "uuid":
+        em.emit(depth, "_b = rng.integers(0, 256, (n, 16), dtype=np.uint8)")
+        em.emit(depth, "_b[:, 6] = (_b[:, 6] & 0x0F) | 0x40")
+        em.emit(depth, "_b[:, 8] = (_b[:, 8] & 0x3F) | 0x80")
+        # Hex digits and dashes laid out as an (n, 36) byte grid, then cut into strings in C
+        em.emit(depth, "_h = np.frombuffer(_b.tobytes().hex().encode('ascii'), dtype=np.uint8).reshape(n, 32)")
+        em.emit(depth, "_u = np.full((n, 36), ord('-'), dtype=np.uint8)")
+        em.emit(depth, "_u[:, 0:8], _u[:, 9:13], _u[:, 14:18], _u[:, 19:23], _u[:, 24:36] = _h[:, 0:8], _h[:, 8:12], _h[:, 12:16], _h[:, 16:20], _h[:, 20:32]")
+        em.emit(depth, f"{col} = _u.view('S36').ravel().astype('U36').tolist()")
+    elif kind in ("email", "url"):
+        words = f"np.array({_const(WORDS)}, dtype=object)[rng.integers(0, {len(WORDS)}, n)].tolist()"
+        if kind == "email":
+            em.emit(depth, f"{col} = ['%s%d@%s' % (_w, _k, {plan['domain']!r}) for _w, _k in zip({words}, rng.integers(0, 1000, n).tolist())]")
+        else:
+            em.emit(depth, f"{col} = ['%s/%s/%d' % ({plan['base']!r}, _w, _k) for _w, _k in zip({words}, rng.integers(0, 100000, n).tolist())]")
+    elif kind in ("date", "datetime"):
+        fmt = plan.get("format", "%Y-%m-%d")
+        unit = VECTOR_DATETIME_FORMATS.get(fmt)
+        if kind == "date" and unit != "D" or kind == "datetime" and unit == "D":
+            unit = None
+        _datetime_column(em, plan, depth, col, unit)
+    else:
+        return None
+    return col
+
+
+def _emit_column(em, plan, depth):
+    """Emits the statements for a plan node and returns the name of a list holding its n values."""
+    kind = plan["type"]
+    if kind == "object":
+        cols = [(key, _emit_column(em, child, depth)) for key, child in plan["fields"].items()]
+        name = em.temp("obj")
+        if not cols:
+            em.emit(depth, f"{name} = [{{}} for _ in range(n)]")
+        else:
+            names = ", ".join(f"_v{i}" for i in range(len(cols)))
+            row = ", ".join(f"{key!r}: _v{i}" for i, (key, _) in enumerate(cols))
+            sources = ", ".join(col for _, col in cols)
+            em.emit(depth, f"{name} = [{{{row}}} for {names}, in zip({sources})]" if len(cols) == 1
+                    else f"{name} = [{{{row}}} for {names} in zip({sources})]")
+        for key, child in plan["fields"].items():
+            if child.get("optional"):
+                em.emit(depth, f"for _row, _keep in zip({name}, (rng.random(n) < {float(child.get('p_present', 0.8))!r}).tolist()):")
+                em.emit(depth + 1, "if not _keep:")
+                em.emit(depth + 2, f"del _row[{key!r}]")
+        return name
+    if kind == "subset" and "expr" not in plan:
+        values = plan["values"]
+        high = min(int(plan.get("max_items", len(values))), len(values))
+        low = min(int(plan.get("min_items", 1)), high)
+        col = em.temp("col")
+        _word_rows(em, depth, col, values, low, high, True)
+        return col
+    if "expr" in plan or kind in CONTAINER_TYPES:
+        return _row_wise(em, plan, depth)
+    col = _leaf_column(em, plan, depth)
+    if col is None:
+        return _row_wise(em, plan, depth)
+    if plan.get("nullable") and kind != "null":
+        em.emit(depth, f"{col} = [_v if _k else None for _v, _k in zip({col}, (rng.random(n) < {1.0 - float(plan.get('p_null', 0.1))!r}).tolist())]")
+    return col
+
+
+def bulk_source(plan):
+    """
+    Source of `bulk_generator(n, seed=None)` (plus its helpers), a column-wise generator for `plan`.
+    It expects module globals np (or None), gc, random and hashlib, and dynamic_generator for the no-NumPy path.
+    Seeded output is reproducible, but it is not the same stream as seeded per-record generation.
+    """
+    em = _Emitter()
+    root = _emit_column(em, plan, 1)
+    lines = [
+        "def bulk_generator(n, seed=None):",
+        '    """Generates n records column by column; falls back to the per-record loop without NumPy."""',
+        "    import datetime, uuid",
+        "    if gc.isenabled():",
+        "        # Millions of fresh acyclic dicts would otherwise trigger collection after collection",
+        "        gc.disable()",
+        "        try:",
+        "            return bulk_generator(n, seed)",
+        "        finally:",
+        "            gc.enable()",
+        "    if isinstance(seed, str):",
+        "        seed = int(hashlib.sha256(seed.encode('utf-8')).hexdigest()[:16], 16)",
+        "    if np is None:",
+        "        prng = random.Random(seed)",
+        "        return [dynamic_generator(prng) for _ in range(n)]",
+        "    rng = np.random.default_rng(seed)",
+        "    prng = random.Random(int(rng.integers(2 ** 63)))",
+    ]
+    lines.extend(em.lines)
+    lines.append(f"    return {root}")
+    return BULK_HELPERS.lstrip() + "\n\n" + "\n".join(lines) + "\n"
+
+
+def load_bulk_generator(plan, dynamic_generator):
+    """Compiles bulk_source(plan) in-process, with `dynamic_generator` as the no-NumPy fallback."""
+    namespace = {"np": np, "gc": gc, "random": random, "hashlib": hashlib, "dynamic_generator": dynamic_generator}
+    exec(bulk_source(plan), namespace)
+    return namespace["bulk_generator"]
+
+
+# --- STANDALONE SERVER ---
+SERVER_HEADER = '''"""
+Standalone mock server for '{name}', exported from Project Mirage.
+
+    python {module}.py [--port 5001]                          serve {route}
+    python {module}.py --fixture 1000000 out.ndjson [--seed 7]   write an NDJSON fixture
+"""
+import gc
+import sys
+import json
+import random
+import hashlib
+import argparse
+
+from flask import Flask, jsonify, request
+
+try:
+    import numpy as np
+except ImportError:  # bulk_generator falls back to the per-record loop
+    np = None
+
+ROUTE = {flask_route!r}
+METHODS = {methods!r}
+CHAOS_RATE = {chaos_rate!r}  # chance of an HTTP 500, from the mock's chaos settings at export time
+MAX_COUNT = {max_count!r}
+FIXTURE_CHUNK = {fixture_chunk!r}
+
+app = Flask(__name__)
+
+'''
+
+SERVER_FOOTER = '''
+
+def write_fixture(path, n, seed=None):
+    """Writes n records as NDJSON, FIXTURE_CHUNK rows per bulk_generator call."""
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    with open(path, "w", encoding="utf-8") as f:
+        for start in range(0, n, FIXTURE_CHUNK):
+            rows = bulk_generator(min(FIXTURE_CHUNK, n - start), None if seed is None else f"{seed}:{start}")
+            f.write("\\n".join(map(encode, rows)))
+            f.write("\\n")
+
+
+@app.route(ROUTE, methods=METHODS)
+def get_mock_data(**params):
+    if random.random() < CHAOS_RATE:
+        return jsonify({"error": "Internal Server Error - Chaos Mode Activated"}), 500
+    count = request.args.get("count", type=int)
+    if count is not None:
+        return jsonify(bulk_generator(max(0, min(count, MAX_COUNT)), request.args.get("seed")))
+    data = dynamic_generator()
+    if isinstance(data, dict):
+        # Echo path parameters into matching fields, keeping the sample's type
+        for key, value in params.items():
+            if key in data:
+                data[key] = int(value) if isinstance(data[key], int) and value.lstrip("-").isdigit() else value
+    return jsonify(data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--fixture", nargs=2, metavar=("N", "PATH"))
+    parser.add_argument("--seed")
+    opts = parser.parse_args()
+    if opts.fixture:
+        write_fixture(opts.fixture[1], int(opts.fixture[0]), opts.seed)
+        sys.exit(0)
+    app.run(debug=True, port=opts.port)
+'''
+
+
+def flask_route(route):
+    """/users/{user_id} -> /users/<user_id>"""
+    return "/".join(f"<{seg[1:-1]}>" if seg.startswith("{") and seg.endswith("}") else seg for seg in route.split("/")) or "/"
+
+
+def export_server(plan, name, route=None, methods=("GET",), chaos_rate=0.0, module=None):
+    """Source of a self-contained Flask server (per-record and bulk generators) for one mock."""
+    header = SERVER_HEADER.format(
+        name=name, module=module or f"{name}_server", route=route or f"/{name}",
+        flask_route=flask_route(route or f"/{name}"), methods=list(methods), chaos_rate=float(chaos_rate),
+        max_count=MAX_EXPORT_COUNT, fixture_chunk=FIXTURE_CHUNK,
+    )
+    return header + generator_source(plan_to_code(plan)) + "\n\n" + bulk_source(plan) + SERVER_FOOTER
+
+
+def chaos_error_rate(config):
+    """The part of a ChaosConfig the exported server keeps: the probability of an HTTP error."""
+    if config is None:
+        return 0.0
+    return sum(fault["probability"] for fault, _ in config.faults if fault["type"] == "error")
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a Mirage mock as a standalone Flask server.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--schema", help="sample JSON file to infer the plan from")
+    source.add_argument("--server", help="base URL of a running Mirage server to fetch the deployed plan from")
+    parser.add_argument("--name", default="default")
+    parser.add_argument("--route")
+    parser.add_argument("-o", "--output")
+    opts = parser.parse_args(argv)
+
+    methods, chaos_rate, route = ["GET"], 0.0, opts.route
+    if opts.schema:
+        with open(opts.schema, encoding="utf-8") as f:
+            plan = infer_plan(json.load(f))
+    else:
+        import requests
+        reply = requests.get(f"{opts.server.rstrip('/')}/api/mocks/{opts.name}", timeout=10)
+        if reply.status_code != 200:
+            print(f"Could not fetch mock '{opts.name}': {reply.text}")
+            return 1
+        mock = reply.json()
+        plan, methods, route = mock["plan"], mock["methods"], route or mock["route"]
+        if mock["chaos"]["enabled"]:
+            chaos_rate = sum(f.get("probability", 0) for f in mock["chaos"]["config"].get("faults", []) if f.get("type") == "error")
+
+    output = opts.output or f"{opts.name}_server.py"
+    module = output.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(export_server(plan, opts.name, route, methods, chaos_rate, module))
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
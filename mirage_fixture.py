@@ -0,0 +1,138 @@
+"""
+Materialized fixture datasets for Project Mirage.
+
+A fixture is one file holding N pre-generated records:
+
+    header | metadata JSON | record 0 \\n record 1 \\n ... | pad | (N + 1) uint64 offsets
+
+Records are the exact JSON bytes the server would send, each followed by a
+newline (encode_record escapes newlines inside strings, so a raw one is always
+a separator). Readers mmap the file, so opening a 10 GB fixture costs one
+header read, every worker process shares the same page cache, and record i
+or any contiguous range is a slice of the mapping with no parsing. A range is
+already an NDJSON body; a JSON array is the same bytes with newlines turned
+into commas.
+"""
+import os
+import sys
+import json
+import mmap
+import shutil
+import struct
+from array import array
+
+MAGIC = b"MIRAGEFX"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")  # magic, version, metadata length, record count, index offset
+WRITE_BUFFER_BYTES = 1 << 20
+INDEX_FLUSH = 1 << 16  # offsets held in memory before spilling to the index temp file
+
+
+class FixtureIndexError(IndexError):
+    """A request asked for a record the fixture does not have."""
+
+
+def write_fixture(path, bodies, meta):
+    """
+    Streams encoded record bodies (bytes, no trailing newline) into a fixture at `path`.
+    Memory stays flat however many records there are; the file appears atomically.
+    Returns the record count.
+    """
+    meta = dict(meta, byteorder=sys.byteorder)
+    meta_bytes = json.dumps(meta, sort_keys=True).encode("utf-8")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    index_path = tmp_path + ".idx"
+    count = 0
+    try:
+        with open(tmp_path, "wb") as f, open(index_path, "w+b") as index:
+            f.write(HEADER.pack(MAGIC, VERSION, len(meta_bytes), 0, 0))
+            f.write(meta_bytes)
+            pos = HEADER.size + len(meta_bytes)
+            offsets, buf, buffered = array("Q"), [], 0
+            for body in bodies:
+                offsets.append(pos)
+                pos += len(body) + 1
+                buf.append(body)
+                buffered += len(body) + 1
+                count += 1
+                if buffered >= WRITE_BUFFER_BYTES:
+                    buf.append(b"")
+                    f.write(b"\n".join(buf))
+                    buf, buffered = [], 0
+                if len(offsets) >= INDEX_FLUSH:
+                    offsets.tofile(index)
+                    offsets = array("Q")
+            if buf:
+                buf.append(b"")
+                f.write(b"\n".join(buf))
+            offsets.append(pos)
+            offsets.tofile(index)
+            pad = -pos % 8
+            f.write(b"\0" * pad)
+            index.seek(0)
+            shutil.copyfileobj(index, f)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, len(meta_bytes), count, pos + pad))
+        os.replace(tmp_path, path)
+    finally:
+        for leftover in (tmp_path, index_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return count
+
+
+def read_meta(path):
+    """The metadata of a fixture file, or None if it is missing or not a fixture."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(HEADER.size)
+            if len(head) < HEADER.size:
+                return None
+            magic, version, meta_len, count, _ = HEADER.unpack(head)
+            if magic != MAGIC or version != VERSION:
+                return None
+            return dict(json.loads(f.read(meta_len)), count=count)
+    except (OSError, ValueError):
+        return None
+
+
+class Fixture:
+    """Read-only, mmap-backed view of a fixture file. Raises ValueError for anything that isn't one."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, meta_len, count, index_offset = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a Mirage fixture")
+        self.meta = json.loads(self.mm[HEADER.size:HEADER.size + meta_len])
+        if self.meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{path} was written on a {self.meta.get('byteorder')}-endian machine")
+        self.count = count
+        self.view = memoryview(self.mm)
+        self.offsets = self.view[index_offset:index_offset + 8 * (count + 1)].cast("Q")
+
+    def record(self, i):
+        """Bytes of record i, as a zero-copy memoryview."""
+        return self.view[self.offsets[i]:self.offsets[i + 1] - 1]
+
+    def lines(self, start, stop):
+        """NDJSON body for records [start, stop), as a zero-copy memoryview."""
+        stop = min(stop, self.count)
+        if start >= stop:
+            return self.view[0:0]
+        return self.view[self.offsets[start]:self.offsets[stop]]
+
+    def array_items(self, start, stop):
+        """Comma-joined records [start, stop): the inside of a JSON array (copied in C, never parsed)."""
+        return self.lines(start, stop)[:-1].tobytes().replace(b"\n", b",")
+
+    def describe(self):
+        return {
+            "path": self.path,
+            "count": self.count,
+            "bytes": len(self.mm),
+            "seed": self.meta.get("seed"),
+            "generator": self.meta.get("generator"),
+        }
@@ -5,16 +5,114 @@ import uuid
 import datetime
 import traceback
 import re
-from flask import Flask, render_template_string, request, jsonify, session
+import base64
+import hashlib
+import threading
+import time
+import socket
+import struct
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, render_template_string, request, jsonify, session, Response
 import google.generativeai as genai
+import requests
+from mirage_compiler import (
+    infer_plan, refine_plan, plan_to_code, generator_source, load_generator, record_rng,
+    compile_validator, format_diff, plan_from_samples, SAMPLE_PROFILE,
+)
+from mirage_sandbox import SandboxPool, SandboxError, ExecTimer
+from mirage_state import StateFile, StateWatcher, change_notifier
+from mirage_export import export_server, chaos_error_rate, load_bulk_generator
+import mirage_export
+from mirage_fixture import Fixture, FixtureIndexError, write_fixture, read_meta
+from mirage_store import ColumnStore, StoreError, infer_primary_key
+from mirage_batch import mocks_from_openapi
+from mirage_recorder import RecordLog, Recorder, learned_mocks
+from mirage_metrics import Metrics, ShardedCounts, SamplingProfiler
+from mirage_chaos import (
+    ChaosConfig, ChaosStats, NO_CHAOS, PRE_BODY_FAULTS,
+    fault_status, truncate_body, truncate_stream, drip,
+)
 
 # --- FLASK APP CONFIGURATION ---
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
 # GLOBAL STORAGE
-active_simulations = {}
 CHAOS_ENABLED = False
+CHAOS_CONFIG = ChaosConfig.legacy()  # what the global toggle injects into mocks without their own config
+MOCK_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+NAME_RE = re.compile(r'^[A-Za-z0-9_.\-]+$')
+
+# Bump whenever the prompt in get_ai_logic() or the plan format changes so stale plans are not reused
+PROMPT_VERSION = "v3"
+ENGINES = ("local", "gemini")
+
+# Batch / streaming limits for ?count= and pagination
+MAX_BATCH_COUNT = int(os.environ.get("MIRAGE_MAX_BATCH_COUNT", "1000000"))
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Generator execution: in-process for trusted generators, or a pool of worker processes
+EXECUTION_MODES = ("inline", "sandbox")
+SANDBOX_BATCH = 256
+EXEC_TIMER_FLUSH = 256
+
+# Response pool defaults (per mock, opt-in)
+DEFAULT_POOL_SIZE = 1024
+MAX_POOL_SIZE = int(os.environ.get("MIRAGE_MAX_POOL_SIZE", "65536"))
+POOL_REFILL_BATCH = 64
+POOL_WARM_TIMEOUT_S = 2.0  # how long a redeploy waits for the new version's pool before swapping it in
+
+# Versioned deploys: replaced versions kept per mock for instant rollback
+MAX_RETAINED_VERSIONS = int(os.environ.get("MIRAGE_MAX_RETAINED_VERSIONS", "5"))
+
+# Materialized fixtures (per mock, opt-in)
+FIXTURE_DIR = os.environ.get("MIRAGE_FIXTURE_DIR", ".mirage_fixtures")
+MAX_FIXTURE_COUNT = int(os.environ.get("MIRAGE_MAX_FIXTURE_COUNT", str(10 ** 9)))
+FIXTURE_BULK_CHUNK = 100000
+
+# Stateful CRUD mocks (per mock, opt-in)
+DEFAULT_STATE_ROWS = 100
+MAX_STATE_ROWS = int(os.environ.get("MIRAGE_MAX_STATE_ROWS", str(10 ** 7)))
+STATE_QUERY_ARGS = ("offset", "limit", "seed", "index")
+# Gemini calls: shared concurrency cap and retry/backoff on rate limits
+GEMINI_CONCURRENCY = int(os.environ.get("MIRAGE_GEMINI_CONCURRENCY", "8"))
+GEMINI_RETRIES = int(os.environ.get("MIRAGE_GEMINI_RETRIES", "4"))
+GEMINI_BACKOFF_S = 1.0
+GEMINI_BACKOFF_MAX_S = 30.0
+GEMINI_STUB_MS = float(os.environ["MIRAGE_GEMINI_STUB_MS"]) if os.environ.get("MIRAGE_GEMINI_STUB_MS") else None
+RETRYABLE_GEMINI_ERRORS = ("429", "quota", "rate limit", "resource exhausted", "resource_exhausted",
+                           "503", "unavailable", "500", "internal", "deadline", "timed out", "timeout")
+MAX_BATCH_DEPLOY = 1000
+
+# Generator validation: seeded runs at deploy, Gemini repair rounds, and live sampling (off by default)
+VALIDATE_RUNS = int(os.environ.get("MIRAGE_VALIDATE_RUNS", "100"))
+MAX_VALIDATE_RUNS = 100000
+MAX_REPAIR_ROUNDS = int(os.environ.get("MIRAGE_MAX_REPAIR_ROUNDS", "2"))
+LIVE_VALIDATE_RATE = float(os.environ.get("MIRAGE_LIVE_VALIDATE_RATE", "0"))
+MAX_REPORTED_DIFFS = 10
+RECENT_MISMATCHES = 20
+
+# Record & replay proxy mode (per recording, opt-in)
+RECORDING_DIR = os.environ.get("MIRAGE_RECORDING_DIR", ".mirage_recordings")
+RECORD_QUEUE_SIZE = int(os.environ.get("MIRAGE_RECORD_QUEUE_SIZE", "10000"))
+PROXY_TIMEOUT_S = float(os.environ.get("MIRAGE_PROXY_TIMEOUT_S", "30"))
+HOP_BY_HOP_HEADERS = frozenset((
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers",
+    "transfer-encoding", "upgrade", "host", "content-length", "content-encoding",
+))
+MAX_LEARN_SAMPLES = 1000
+GEMINI_PROMPT_SAMPLES = 3  # recorded samples shown to Gemini when refining a learned plan
+
+# Sampling profiler (off until POST /api/profiler)
+PROFILE_INTERVAL_MS = float(os.environ.get("MIRAGE_PROFILE_INTERVAL_MS", "10"))
+MIN_PROFILE_INTERVAL_MS = 1.0
+
+CACHE_DIR = os.environ.get("MIRAGE_CACHE_DIR", ".mirage_cache")
+CACHE_MAX_ENTRIES = int(os.environ.get("MIRAGE_CACHE_MAX_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.environ.get("MIRAGE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
 
 # --- HTML TEMPLATE ---
 HTML_TEMPLATE = """
@@ -154,14 +252,7 @@ HTML_TEMPLATE = """
                     </div>
                 </div>
                 <textarea id="jsonInput" class="flex-1 w-full input-glass rounded-lg p-4 text-sm text-blue-300 font-mono resize-none" spellcheck="false">
-{
-    "user_id": "usr_8821",
-    "username": "GhostInShell",
-    "account_balance": 4500.50,
-    "is_verified": true,
-    "last_login": "2025-11-20T14:00:00Z",
-    "roles": ["admin", "editor"]
-}</textarea>
+{{ sample }}</textarea>
                 
                 <button onclick="deployMirage()" id="deployBtn" class="w-full mt-6 btn-neon text-white font-bold py-4 rounded-lg tracking-widest flex justify-center items-center gap-3 group">
                     <svg class="w-5 h-5 group-hover:rotate-90 transition-transform" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M19.428 15.428a2 2 0 00-1.022-.547l-2.384-.477a6 6 0 00-3.86.517l-.318.158a6 6 0 01-3.86.517L6.05 15.21a2 2 0 00-1.806.547M8 4h8l-1 1v5.172a2 2 0 00.586 1.414l5 5c1.26 1.26.367 3.414-1.415 3.414H4.828c-1.782 0-2.674-2.154-1.414-3.414l5-5A2 2 0 009 10.172V5L8 4z"></path></svg>
@@ -234,18 +325,19 @@ HTML_TEMPLATE = """
             const jsonSchema = document.getElementById('jsonInput').value;
             const btn = document.getElementById('deployBtn');
 
-            if (!apiKey) { log("ERROR: API Key missing.", 'error'); return; }
+            const engine = apiKey ? 'gemini' : 'local';
+            if (!apiKey) log("No API Key: using the offline compiler.");
 
             const originalText = btn.innerHTML;
             btn.innerHTML = '<span class="animate-spin">⚙️</span> PROCESSING...';
             btn.disabled = true;
-            log("Sending schema to Neural Engine...");
+            log(engine === 'gemini' ? "Sending schema to Neural Engine..." : "Compiling schema locally...");
 
             try {
                 const response = await fetch('/deploy', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ api_key: apiKey, schema: jsonSchema })
+                    body: JSON.stringify({ api_key: apiKey, schema: jsonSchema, engine: engine })
                 });
                 const data = await response.json();
 
@@ -305,8 +397,8 @@ def clean_ai_code(raw_text):
     Strictly extracts Python code from AI response.
     Removes Markdown, explanations, and whitespace.
     """
-    # 1. Extract code inside ```python ... ``` or ``` ... ```
-    code_match = re.search(r'```(?:python)?(.*?)```', raw_text, re.DOTALL)
+    # 1. Extract code inside ```python ... ```, ```json ... ``` or ``` ... ```
+    code_match = re.search(r'```(?:python|json)?(.*?)```', raw_text, re.DOTALL)
     if code_match:
         code = code_match.group(1)
     else:
@@ -324,35 +416,77 @@ def clean_ai_code(raw_text):
     
     return "\n".join(clean_lines).strip()
 
-def get_ai_logic(api_key, schema_str):
-    genai.configure(api_key=api_key)
-    
-    # Tries to find a valid model automatically
-    model_name = 'gemini-1.5-flash-latest'
+# --- GEMINI CLIENT ---
+_gemini_lock = threading.Lock()
+_gemini_models = {}  # api key -> GenerativeModel, so discovery runs once per key
+_configured_key = None
+
+def gemini_model(api_key):
+    """
+    The model to call for `api_key`: genai is configured and list_models() is
+    asked for a model once per key, then the same client is reused by every call.
+    genai's configuration is process-wide, so a different key reconfigures it.
+    """
+    global _configured_key
+    with _gemini_lock:
+        if _configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+        model = _gemini_models.get(api_key)
+        if model is not None:
+            return model
+
+        # Tries to find a valid model automatically
+        model_name = 'gemini-1.5-flash-latest'
+        try:
+            # Simple model fallback logic
+            found_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+            if found_models:
+                 # Prefer flash, else take first available
+                flash_models = [m for m in found_models if 'flash' in m]
+                model_name = flash_models[0] if flash_models else found_models[0]
+        except:
+            pass # Fallback to hardcoded string
+
+        model = _gemini_models[api_key] = genai.GenerativeModel(model_name)
+        return model
+
+def get_ai_logic(api_key, schema_str, plan, feedback=None):
+    """
+    Asks Gemini to refine a locally inferred plan. With `feedback` (the validation failures
+    of records generated from `plan`), asks it to repair its earlier proposal instead.
+    Returns the cleaned JSON text of the proposed plan, or '# Error: ...' on failure.
+    """
     try:
-        # Simple model fallback logic
-        found_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        if found_models:
-             # Prefer flash, else take first available
-            flash_models = [m for m in found_models if 'flash' in m]
-            model_name = flash_models[0] if flash_models else found_models[0]
-    except:
-        pass # Fallback to hardcoded string
-
-    model = genai.GenerativeModel(model_name)
+        model = gemini_model(api_key)
+    except Exception as e:
+        return f"# Error: {str(e)}"
     
+    repair = ""
+    if feedback:
+        repair = f"""
+    This plan was tried already, and records generated from it do not match the input schema:
+    {feedback}
+    Fix the leaves responsible (usually an "expr" that returns the wrong type or raises).
+"""
     prompt = f"""
-    You are a code generation engine. 
+    You are a mock data planning engine.
     Input Schema: {schema_str}
-    
-    Task: Write the BODY of a Python function that generates a dictionary called `data` matching the schema with random values.
-    
+
+    Inferred Plan: {json.dumps(plan)}
+{repair}
+    Task: Refine the inferred plan so the generated values look like a real API would return them.
+    You may widen or narrow numeric ranges, add realistic enum values to "choice" nodes,
+    swap a leaf's "type" for a better one (e.g. "string" to "choice"), or give a leaf an "expr"
+    holding a single Python expression that uses only random, datetime and uuid.
+
     Constraints:
-    1. Do NOT write 'def function_name():'.
-    2. Do NOT write markdown.
-    3. ONLY write the code inside the function.
-    4. Use 'random' and 'datetime' libraries.
-    5. Final line MUST be 'return data'.
+    1. Keep every object key, nesting level and array exactly as in the inferred plan.
+    2. Leaf types: null, bool, int, float, string, choice, id, uuid, email, url, datetime, date.
+    3. An "expr" must draw all randomness from `random` (it may be a seeded random.Random);
+       never call uuid.uuid4(), datetime.now() or anything else that cannot be replayed.
+    4. Do NOT write markdown or explanations.
+    5. ONLY return the refined plan as JSON.
     """
     
     try:
@@ -361,65 +495,2171 @@ def get_ai_logic(api_key, schema_str):
     except Exception as e:
         return f"# Error: {str(e)}"
 
+def stub_ai_logic(api_key, schema_str, plan, feedback=None):
+    """Offline stand-in for get_ai_logic: proposes the inferred plan unchanged after GEMINI_STUB_MS."""
+    time.sleep(GEMINI_STUB_MS / 1000.0)
+    return json.dumps(plan)
+
+# Every Gemini call goes through this hook; tests (or MIRAGE_GEMINI_STUB_MS) swap in a local stub
+plan_refiner = stub_ai_logic if GEMINI_STUB_MS is not None else get_ai_logic
+gemini_slots = threading.BoundedSemaphore(GEMINI_CONCURRENCY)
+
+def retry_delay(error, attempt):
+    """
+    Seconds to wait before retrying a failed Gemini call, or None if retrying won't help.
+    Rate limits and transient server errors back off exponentially (with jitter), or
+    as long as the error asks for; anything else (bad key, bad request) fails at once.
+    """
+    text = error.lower()
+    if not any(marker in text for marker in RETRYABLE_GEMINI_ERRORS):
+        return None
+    asked = re.search(r'retry(?:[ _]delay|[ -]after| in)\D{0,20}(\d+(?:\.\d+)?)', text)
+    if asked:
+        return min(GEMINI_BACKOFF_MAX_S, float(asked.group(1)))
+    return min(GEMINI_BACKOFF_MAX_S, GEMINI_BACKOFF_S * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+def refine_with_gemini(api_key, schema, plan, feedback=None):
+    """
+    plan_refiner with at most GEMINI_CONCURRENCY calls in flight process-wide, retried
+    on rate limits up to GEMINI_RETRIES times. Returns the proposal text or '# Error: ...'.
+    """
+    for attempt in range(GEMINI_RETRIES + 1):
+        with gemini_slots:
+            started = time.perf_counter()
+            proposal = plan_refiner(api_key, schema, plan, feedback)
+            failed = proposal.startswith("# Error:")
+            GEMINI_SECONDS.observe(("error" if failed else "ok",), time.perf_counter() - started)
+        if not failed:
+            return proposal
+        delay = retry_delay(proposal, attempt) if attempt < GEMINI_RETRIES else None
+        if delay is None:
+            return proposal
+        print(f"GEMINI RETRY {attempt + 1}/{GEMINI_RETRIES} in {delay:.1f}s: {proposal[len('# Error:'):].strip()[:120]}")
+        time.sleep(delay)
+    return proposal
+
+# --- GENERATOR CACHE ---
+def schema_cache_key(schema, prompt_version=PROMPT_VERSION):
+    """
+    Content address of a schema: sha256 over the prompt version and the
+    canonical JSON form, so whitespace and key order do not cause misses.
+    """
+    if not isinstance(schema, str):
+        schema = json.dumps(schema)
+    try:
+        canonical = json.dumps(json.loads(schema), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except ValueError:
+        canonical = schema.strip()
+    return hashlib.sha256(f"{prompt_version}\n{canonical}".encode("utf-8")).hexdigest()
+
+class GeneratorCache:
+    """
+    On-disk LRU cache of refined generator plans, one file per schema key.
+    Recency is kept in memory and mirrored to file mtimes so it survives restarts.
+    """
+    def __init__(self, directory, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        if not os.path.isdir(self.directory):
+            return
+        found = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            stat = os.stat(os.path.join(self.directory, filename))
+            found.append((stat.st_mtime, filename[:-5], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), encoding="utf-8") as f:
+                    payload = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                # File removed behind our back; treat as a miss
+                self.total_bytes -= self.entries.pop(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key, payload):
+        data = payload.encode("utf-8")
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+
+    def invalidate(self, key=None):
+        """Drops one entry, or every entry when no key is given. Returns the number removed."""
+        with self.lock:
+            keys = [key] if key is not None else list(self.entries)
+            removed = 0
+            for k in keys:
+                if k not in self.entries:
+                    continue
+                self.total_bytes -= self.entries.pop(k)
+                removed += 1
+                try:
+                    os.remove(self._path(k))
+                except OSError:
+                    pass
+            return removed
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+generator_cache = GeneratorCache(CACHE_DIR)
+
+def compile_generator(code_body):
+    """
+    Wraps a generator body in a real function definition and compiles it.
+    `random` is a parameter defaulting to the module, so callers can pass a
+    seeded random.Random to make a record reproducible.
+    """
+    full_code = generator_source(code_body)
+    started = time.perf_counter()
+    try:
+        func = load_generator(full_code)
+    except Exception:
+        # The source is only worth reading when it doesn't compile
+        print(f"COMPILE ERROR:\n{full_code}")
+        raise
+    COMPILE_SECONDS.observe((), time.perf_counter() - started)
+    return func
+
+# --- METRICS ---
+metrics = Metrics()
+REQUESTS = metrics.counter(
+    "mirage_requests_total", "Mock requests by status and outcome (ok, errors, chaos, rejected).",
+    ("mock", "status", "outcome"))
+REQUEST_SECONDS = metrics.histogram(
+    "mirage_request_seconds", "Time to answer a mock request, injected latency included (ASGI: until the body is sent).", ("mock",))
+GENERATE_SECONDS = metrics.histogram(
+    "mirage_generate_seconds", "Generator execution time per record.", ("mock",))
+SERIALIZE_SECONDS = metrics.histogram(
+    "mirage_serialize_seconds", "JSON encoding time per response body or ~64 KB stream chunk.", ("mock",))
+GEMINI_SECONDS = metrics.histogram(
+    "mirage_gemini_seconds", "Gemini plan refinement call latency.", ("outcome",))
+COMPILE_SECONDS = metrics.histogram(
+    "mirage_compile_seconds", "Time to exec a generator's source into a function.")
+PROXY_SECONDS = metrics.histogram(
+    "mirage_proxy_seconds", "Upstream round trip of a proxied (recorded) request.", ("recording",))
+REPLAYS = metrics.counter(
+    "mirage_replays_total", "Replay requests by result (hit, miss).", ("recording", "result"))
+LIVE_VALIDATIONS = metrics.counter(
+    "mirage_live_validations_total", "Served records sampled for validation, by result (ok, mismatch).", ("mock", "result"))
+profiler = SamplingProfiler()
+
+# --- VALIDATION ---
+def _top(counter, total):
+    return [{"what": what, "count": count, "of": total} for what, count in counter.most_common(MAX_REPORTED_DIFFS)]
+
+def _micros(seconds):
+    return round(seconds * 1e6, 2)
+
+def validate_generator(name, func, source, execution, check, runs, seed="validate"):
+    """
+    Runs a generator `runs` times on seeded rngs (the same records every time for the same
+    seed) and checks each record with `check`, a compile_validator() checker. Returns a report:
+    how many runs raised or produced a mismatching record, the most frequent errors and diffs
+    (array indexes folded to [*], so one bad item field counts once), and the per-call cost.
+    """
+    durations = []
+    errors, diffs = Counter(), Counter()
+    raised = mismatched = 0
+    for i in range(runs):
+        if execution == "sandbox":
+            try:
+                records, took = sandbox_pool.run(source, name, i, 1, seed)
+            except SandboxError as e:
+                raised += 1
+                errors[str(e)] += 1
+                continue
+            record = records[0]
+            durations.extend(took)
+        else:
+            started = time.perf_counter()
+            try:
+                record = func(record_rng(name, seed, i))
+            except Exception as e:
+                raised += 1
+                errors[f"{type(e).__name__}: {e}"] += 1
+                continue
+            finally:
+                durations.append(time.perf_counter() - started)
+        found = check(record)
+        if found:
+            mismatched += 1
+            diffs.update({re.sub(r"\[\d+\]", "[*]", format_diff(d)) for d in found})
+    durations.sort()
+    return {
+        "ok": raised == 0 and mismatched == 0, "runs": runs, "raised": raised, "mismatched": mismatched,
+        "errors": _top(errors, runs), "diffs": _top(diffs, runs),
+        "call_us": {
+            "mean": _micros(sum(durations) / len(durations)),
+            "p50": _micros(durations[len(durations) // 2]),
+            "p99": _micros(durations[min(len(durations) - 1, int(len(durations) * 0.99))]),
+        } if durations else None,
+    }
+
+def repair_feedback(report):
+    """A validation report as the bullet list get_ai_logic() hands back to Gemini."""
+    lines = [f"- raised {e['what']} ({e['count']} of {e['of']} runs)" for e in report["errors"]]
+    lines += [f"- {d['what']} ({d['count']} of {d['of']} records)" for d in report["diffs"]]
+    return "\n    ".join(lines)
+
+def validation_options(data):
+    """(runs, sample_rate) from a {"runs", "sample_rate"} object; `false` turns both off. Raises ValueError."""
+    if data is False:
+        return 0, 0.0
+    if data is None or data is True:
+        data = {}
+    if not isinstance(data, dict):
+        raise ValueError("'validate' must be an object or false")
+    try:
+        runs = int(data.get('runs', VALIDATE_RUNS))
+        rate = float(data.get('sample_rate', LIVE_VALIDATE_RATE))
+    except (TypeError, ValueError):
+        raise ValueError("'runs' must be an integer and 'sample_rate' a number")
+    if not 0 <= runs <= MAX_VALIDATE_RUNS:
+        raise ValueError(f"'runs' must be between 0 and {MAX_VALIDATE_RUNS}")
+    if not 0.0 <= rate <= 1.0:
+        raise ValueError("'sample_rate' must be between 0 and 1")
+    return runs, rate
+
+def pool_options(data):
+    """(size, low_water) from a {"size", "low_water"} object; `true` means the defaults. Raises ValueError."""
+    if data is True:
+        data = {}
+    if not isinstance(data, dict):
+        raise ValueError("'pool' must be an object or true")
+    size = _int_arg(data, 'size', DEFAULT_POOL_SIZE, 1, MAX_POOL_SIZE)
+    low_water = _int_arg(data, 'low_water', size // 4, 0, size - 1)
+    return size, low_water
+
+# --- MOCK REGISTRY ---
+class MockStats:
+    """Per-mock request counters, kept per thread (see mirage_metrics) so handlers never wait on a lock."""
+    def __init__(self, name):
+        self.name = name
+        self.counts = ShardedCounts()
+
+    def hit(self, outcome, status=200):
+        self.counts.add("requests")
+        self.counts.add(outcome)
+        REQUESTS.inc((self.name, status, outcome))
+
+    def snapshot(self):
+        return dict({"requests": 0, "ok": 0, "errors": 0, "chaos": 0, "rejected": 0}, **self.counts.collect())
+
+class Mock:
+    """A deployed mock: its compiled generator, the plan it came from, its route, chaos settings and stats."""
+    def __init__(self, name, func, plan, route=None, methods=("GET",), engine="local", source=None, execution="inline", shape=None):
+        self.name = name
+        self.func = func
+        self.plan = plan
+        self.shape = shape if shape is not None else plan  # the sample's own plan, which records are validated against
+        self.source = source if source is not None else generator_source(plan_to_code(plan))
+        self.execution = execution
+        self.exec_timer = ExecTimer()
+        self.route = normalize_route(route or f"/{name}")
+        self.methods = tuple(m.upper() for m in methods)
+        self.engine = engine
+        self.chaos_enabled = None  # None inherits the global CHAOS_ENABLED toggle
+        self.chaos_config = None   # None inherits the global CHAOS_CONFIG
+        self.chaos_stats = ChaosStats()
+        self.stats = MockStats(name)
+        self.pool = None
+        self.fixture = None
+        self.store = None
+        self.state_config = None
+        self.spec_digest = None  # digest of the shared-state spec this mock was built from
+        self.version = None      # set when registered; redeploys get the next number
+        self.deployed_at = time.time()
+        self.retired_pool = None # pool settings to restore if a rollback makes this version live again
+        self.validator = None
+        self.validation = None   # the last batch validation report
+        self.live_rate = LIVE_VALIDATE_RATE
+        self.live_counts = ShardedCounts()
+        self.mismatches = deque(maxlen=RECENT_MISMATCHES)
+
+    def spec(self):
+        """Everything another worker needs to rebuild this mock without calling Gemini."""
+        return {
+            "name": self.name, "version": self.version, "deployed_at": self.deployed_at,
+            "plan": self.plan, "shape": self.shape, "route": self.route, "methods": list(self.methods),
+            "engine": self.engine, "execution": self.execution, "validate": {"sample_rate": self.live_rate},
+            "pool": {"size": self.pool.size, "low_water": self.pool.low_water} if self.pool else None,
+            "fixture": self.fixture.path if self.fixture else None,
+            "stateful": self.state_config,
+            "chaos_enabled": self.chaos_enabled,
+            "chaos": self.chaos_config.to_dict() if self.chaos_config is not None else None,
+        }
+
+    def enable_pool(self, size=DEFAULT_POOL_SIZE, low_water=None):
+        self.disable_pool()
+        self.pool = ResponsePool(self, size, low_water)
+        self.pool.start()
+
+    def disable_pool(self):
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.stop()
+
+    def retire(self):
+        """Called once a newer version replaced this one. Requests already holding it finish normally."""
+        if self.pool is not None:
+            self.retired_pool = {"size": self.pool.size, "low_water": self.pool.low_water}
+        self.disable_pool()
+
+    def attach_fixture(self, path):
+        self.fixture = Fixture(path)
+
+    def detach_fixture(self):
+        # Responses still holding views keep the old mapping alive until they finish
+        self.fixture = None
+
+    def enable_state(self, config):
+        """
+        Switches the mock to stateful CRUD: a ColumnStore seeded with `rows` generated
+        records, keyed by `primary_key` (inferred when omitted) and indexed on `indexes`.
+        Raises ValueError for a config the plan can't support.
+        """
+        config = dict(config) if isinstance(config, dict) else {}
+        primary_key = config.get("primary_key") or infer_primary_key(self.plan, self.name, self.route)
+        if not primary_key:
+            raise ValueError("Could not infer a primary key; pass stateful.primary_key")
+        rows = int(config.get("rows", DEFAULT_STATE_ROWS))
+        if not 0 <= rows <= MAX_STATE_ROWS:
+            raise ValueError(f"'rows' must be between 0 and {MAX_STATE_ROWS}")
+        store = ColumnStore(self.plan, primary_key, config.get("indexes") or ())
+        seed = str(config.get("seed", "0"))
+        for start in range(0, rows, FIXTURE_BULK_CHUNK):
+            store.load(generated_records(self, min(FIXTURE_BULK_CHUNK, rows - start), f"{seed}:{start}"))
+        self.store = store
+        self.state_config = dict(config, primary_key=primary_key, rows=rows, seed=seed, indexes=list(config.get("indexes") or ()))
+
+    def disable_state(self):
+        self.store = None
+        self.state_config = None
+
+    def item_param(self):
+        """Name of the {param} that addresses one row of a stateful mock."""
+        segments = _route_segments(self.route)
+        if segments and segments[-1].startswith("{") and segments[-1].endswith("}"):
+            return segments[-1][1:-1]
+        return self.store.primary_key
+
+    def routes(self):
+        """Stateful mocks answer on both the collection and the item route."""
+        if self.store is None:
+            return [self.route]
+        segments = _route_segments(self.route)
+        if segments and segments[-1] == "{" + self.item_param() + "}":
+            return [self.route, normalize_route("/".join(segments[:-1]))]
+        return [self.route, f"{self.route.rstrip('/')}/{{{self.item_param()}}}"]
+
+    def allowed_methods(self):
+        return MOCK_METHODS if self.store is not None else self.methods
+
+    def generate(self, offset, count, seed=None, rng=None):
+        """
+        Yields `count` records starting at dataset index `offset`. Seeded records use
+        record_rng(); unseeded ones share `rng` (the calling thread's by default).
+        Sandboxed mocks make one pipe round trip per SANDBOX_BATCH records.
+        With live validation on, about `live_rate` of the records are checked on the way out.
+        """
+        live_rate = self.live_rate
+        # The sampling draw uses the thread's own rng, so seeded records stay reproducible
+        sample = worker_rng().random if live_rate else None
+        if self.execution == "sandbox":
+            for start in range(offset, offset + count, SANDBOX_BATCH):
+                records, durations = sandbox_pool.run(self.source, self.name, start, min(SANDBOX_BATCH, offset + count - start), seed)
+                self.exec_timer.record_many(durations)
+                GENERATE_SECONDS.observe_many((self.name,), durations)
+                if live_rate:
+                    for record in records:
+                        if sample() < live_rate:
+                            self.live_check(record)
+                yield from records
+            return
+        func = self.func
+        if rng is None and seed is None:
+            rng = worker_rng()
+        durations = []
+        last = offset + count - 1
+        for i in range(offset, offset + count):
+            started = time.perf_counter()
+            record = func(rng if seed is None else record_rng(self.name, seed, i))
+            durations.append(time.perf_counter() - started)
+            if len(durations) >= EXEC_TIMER_FLUSH or i == last:
+                self.exec_timer.record_many(durations)
+                GENERATE_SECONDS.observe_many((self.name,), durations)
+                durations = []
+            if live_rate and sample() < live_rate:
+                self.live_check(record)
+            yield record
+
+    def checker(self):
+        """The compiled validator for this mock's shape, built on first use."""
+        if self.validator is None:
+            self.validator = compile_validator(self.shape)
+        return self.validator
+
+    def live_check(self, record):
+        diffs = self.checker()(record)
+        self.live_counts.add("checked")
+        LIVE_VALIDATIONS.inc((self.name, "mismatch" if diffs else "ok"))
+        if diffs:
+            self.live_counts.add("mismatched")
+            self.mismatches.append({"at": time.time(), "diffs": [format_diff(d) for d in diffs[:MAX_REPORTED_DIFFS]]})
+
+    def validate(self, runs, seed="validate"):
+        """Batch-validates the deployed generator (see validate_generator) and keeps the report."""
+        self.validation = validate_generator(self.name, self.func, self.source, self.execution, self.checker(), runs, seed)
+        return self.validation
+
+    def validation_status(self):
+        return {
+            "last_run": self.validation,
+            "live": dict({"sample_rate": self.live_rate, "checked": 0, "mismatched": 0},
+                         **self.live_counts.collect(), recent=list(self.mismatches)),
+        }
+
+    def chaos_active(self):
+        return CHAOS_ENABLED if self.chaos_enabled is None else self.chaos_enabled
+
+    def effective_chaos(self):
+        """The ChaosConfig to roll for this mock, or None when chaos is off."""
+        if not self.chaos_active():
+            return None
+        return self.chaos_config if self.chaos_config is not None else CHAOS_CONFIG
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "version": self.version,
+            "deployed_at": self.deployed_at,
+            "route": self.route,
+            "methods": list(self.methods),
+            "engine": self.engine,
+            "execution": self.execution,
+            "exec_time": self.exec_timer.snapshot(),
+            "chaos": {
+                "enabled": self.chaos_active(),
+                "inherited": self.chaos_enabled is None,
+                "config": (self.chaos_config or CHAOS_CONFIG).to_dict(),
+                "injected": self.chaos_stats.snapshot(),
+            },
+            "stats": self.stats.snapshot(),
+            "pool": self.pool.stats() if self.pool else None,
+            "fixture": self.fixture.describe() if self.fixture else None,
+            "state": self.store.stats() if self.store else None,
+            "validation": self.validation_status(),
+        }
+
+def normalize_route(route):
+    return "/" + "/".join(seg for seg in route.split("/") if seg)
+
+def _route_segments(path):
+    return [seg for seg in path.split("/") if seg]
+
+class RouteIndex:
+    """
+    Segment trie over route templates like /users/{user_id}/orders.
+    Static segments are dict lookups and each level has at most one {param} edge,
+    so matching costs O(path depth) no matter how many mocks are registered.
+    """
+    def __init__(self):
+        self.root = self._node()
+
+    @staticmethod
+    def _node():
+        return {"static": {}, "param": None, "param_name": None, "mock": None}
+
+    def add(self, template, mock):
+        node = self.root
+        for seg in _route_segments(template):
+            if seg.startswith("{") and seg.endswith("}"):
+                name = seg[1:-1]
+                if node["param"] is None:
+                    node["param"], node["param_name"] = self._node(), name
+                elif node["param_name"] != name:
+                    raise ValueError(f"Route {template} renames parameter {{{node['param_name']}}}")
+                node = node["param"]
+            else:
+                node = node["static"].setdefault(seg, self._node())
+        if node["mock"] is not None and node["mock"].name != mock.name:
+            raise ValueError(f"Route {template} is already served by mock '{node['mock'].name}'")
+        node["mock"] = mock
+
+    def match(self, path):
+        """Returns (mock, params) for a concrete path, or (None, None). Static segments win over params."""
+        return self._match(self.root, _route_segments(path), 0, {})
+
+    def _match(self, node, segs, i, params):
+        if i == len(segs):
+            return (node["mock"], params) if node["mock"] is not None else (None, None)
+        child = node["static"].get(segs[i])
+        if child is not None:
+            found = self._match(child, segs, i + 1, params)
+            if found[0] is not None:
+                return found
+        if node["param"] is not None:
+            return self._match(node["param"], segs, i + 1, dict(params, **{node["param_name"]: segs[i]}))
+        return None, None
+
+class MockRegistry:
+    """
+    Named mocks plus the compiled route index that serves them.
+    Writers rebuild both under a lock and publish them as one tuple,
+    so request handlers read a consistent snapshot without locking.
+    A redeploy is one such swap: requests that already hold the old version finish on it,
+    and the old version is retained (at most MAX_RETAINED_VERSIONS per name) for rollback.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = ({}, RouteIndex())
+        self.retired = {}  # name -> deque of replaced Mocks, oldest first
+        self.latest = {}   # name -> highest version number handed out
+
+    def _publish(self, mocks):
+        index = RouteIndex()
+        for mock in mocks.values():
+            for route in mock.routes():
+                index.add(route, mock)
+        self.snapshot = (mocks, index)
+
+    def refresh(self):
+        """Rebuilds the route index after a mock's routes changed. Raises ValueError on conflicts."""
+        with self.lock:
+            self._publish(dict(self.snapshot[0]))
+
+    def register(self, mock, keep_chaos=True):
+        """Makes `mock` the live version of its name. Raises ValueError on route conflicts, changing nothing."""
+        with self.lock:
+            mocks = dict(self.snapshot[0])
+            previous = mocks.get(mock.name)
+            replaced = previous is not None and previous is not mock
+            if replaced:
+                if keep_chaos:
+                    # Redeploying keeps the chaos settings the mock was given
+                    mock.chaos_enabled, mock.chaos_config = previous.chaos_enabled, previous.chaos_config
+                # Request counts belong to the name, not to one version
+                mock.stats, mock.chaos_stats = previous.stats, previous.chaos_stats
+            mocks[mock.name] = mock
+            self._publish(mocks)
+            self.latest[mock.name] = max(self.latest.get(mock.name, 0), mock.version or 0)
+            retired = self.retired.setdefault(mock.name, deque(maxlen=MAX_RETAINED_VERSIONS))
+            if mock in retired:
+                retired.remove(mock)
+            if replaced:
+                retired.append(previous)
+        if replaced:
+            previous.retire()
+
+    def remove(self, name):
+        with self.lock:
+            mocks = dict(self.snapshot[0])
+            previous = mocks.pop(name, None)
+            if previous is None:
+                return False
+            self._publish(mocks)
+            retired = self.retired.pop(name, ())
+        previous.disable_pool()
+        for mock in retired:
+            mock.disable_pool()
+        return True
+
+    def reserve_version(self, name):
+        """The next version number for `name`; concurrent deploys never get the same one."""
+        with self.lock:
+            self.latest[name] = version = self.latest.get(name, 0) + 1
+            return version
+
+    def note_version(self, name, version):
+        with self.lock:
+            self.latest[name] = max(self.latest.get(name, 0), version)
+
+    def retained(self, name):
+        """Replaced versions of `name` still held for rollback, oldest first."""
+        return list(self.retired.get(name, ()))
+
+    def find_version(self, name, version):
+        """The live or a retained Mock with that version number, or None."""
+        for mock in [self.get(name)] + self.retained(name):
+            if mock is not None and mock.version == version:
+                return mock
+        return None
+
+    def get(self, name):
+        return self.snapshot[0].get(name)
+
+    def match(self, path):
+        return self.snapshot[1].match(path)
+
+    def all(self):
+        return list(self.snapshot[0].values())
+
+active_simulations = MockRegistry()
+sandbox_pool = SandboxPool(
+    workers=int(os.environ.get("MIRAGE_SANDBOX_WORKERS", "0")) or None,
+    wall_timeout=float(os.environ.get("MIRAGE_SANDBOX_TIMEOUT", "2.0")),
+    cpu_seconds=float(os.environ.get("MIRAGE_SANDBOX_CPU_SECONDS", "1.0")),
+    memory_mb=int(os.environ.get("MIRAGE_SANDBOX_MEMORY_MB", "256")),
+)
+
+# --- RESPONSE POOL ---
+class ResponsePool:
+    """
+    Already-serialized JSON bodies for one mock, kept topped up by a daemon thread.
+    Handlers pop a buffer and write it; generation and serialization happen off the
+    request path. When the pool runs dry the request falls through to inline generation.
+    """
+    def __init__(self, mock, size=DEFAULT_POOL_SIZE, low_water=None):
+        self.mock = mock
+        self.size = max(1, int(size))
+        self.low_water = int(low_water) if low_water is not None else self.size // 4
+        self.buffers = deque()  # append/popleft are atomic, so handlers never lock
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.ready = threading.Event()  # set once low_water buffers are in (or the generator keeps failing)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.thread = threading.Thread(target=self._refill_loop, name=f"mirage-pool-{mock.name}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        self.ready.set()
+
+    def pop(self):
+        try:
+            buf = self.buffers.popleft()
+        except IndexError:
+            with self.lock:
+                self.misses += 1
+            self.wakeup.set()
+            return None
+        with self.lock:
+            self.hits += 1
+        if len(self.buffers) < self.low_water:
+            self.wakeup.set()
+        return buf
+
+    def _refill_loop(self):
+        rng = random.Random()
+        while not self.stopped.is_set():
+            while len(self.buffers) < self.size and not self.stopped.is_set():
+                started = time.perf_counter()
+                made = failed = 0
+                try:
+                    for record in self.mock.generate(0, min(POOL_REFILL_BATCH, self.size - len(self.buffers)), rng=rng):
+                        self.buffers.append(encode_record(record).encode("utf-8"))
+                        made += 1
+                except Exception:
+                    failed += 1
+                with self.lock:
+                    self.generated += made
+                    self.failures += failed
+                    self.busy_seconds += time.perf_counter() - started
+                if not made or len(self.buffers) >= self.low_water:
+                    self.ready.set()
+                if not made:
+                    break  # the generator keeps failing; let requests surface the error inline
+            self.wakeup.wait(timeout=1.0)
+            self.wakeup.clear()
+
+    def stats(self):
+        with self.lock:
+            served = self.hits + self.misses
+            return {
+                "size": self.size,
+                "low_water": self.low_water,
+                "available": len(self.buffers),
+                "hits": self.hits,
+                "fall_through": self.misses,
+                "hit_rate": round(self.hits / served, 4) if served else 0.0,
+                "generated": self.generated,
+                "failures": self.failures,
+                "refill_rate_per_sec": round(self.generated / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+            }
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return render_template_string(HTML_TEMPLATE, sample=json.dumps(SAMPLE_PROFILE, indent=4))
 
-@app.route('/deploy', methods=['POST'])
-def deploy():
-    data_in = request.json
+# --- DEPLOYMENT ---
+def build_mock(spec, func=None):
+    """
+    Builds a Mock from a spec (name, plan, route, methods, engine, execution, pool, chaos)
+    with its state seeded and its pool warm, but doesn't register it.
+    Raises ValueError for a bad stateful config and whatever exec raises for bad code.
+    """
+    code_body = plan_to_code(spec["plan"])
+    if func is None:
+        started = time.perf_counter()
+        func = load_generator(generator_source(code_body))
+        COMPILE_SECONDS.observe((), time.perf_counter() - started)
+    if spec.get("execution") == 'sandbox':
+        # Pay the worker start-up cost here rather than on the first request
+        sandbox_pool.start()
+    mock = Mock(spec["name"], func, spec["plan"], route=spec.get("route"), methods=spec.get("methods") or ["GET"],
+                engine=spec.get("engine", "local"), source=generator_source(code_body),
+                execution=spec.get("execution") or "inline", shape=spec.get("shape"))
+    mock.version = spec.get("version")
+    mock.deployed_at = spec.get("deployed_at") or mock.deployed_at
+    apply_settings(mock, spec)
+    return mock
+
+def apply_settings(mock, spec):
+    """
+    Brings a mock's runtime settings (live validation rate, state, chaos, pool, fixture) in
+    line with a spec, touching only what differs. A new pool is warm before this returns,
+    so a version swapped in afterwards serves its first requests from it.
+    """
+    mock.live_rate = float((spec.get("validate") or {}).get("sample_rate", LIVE_VALIDATE_RATE))
+    if (spec.get("stateful") or None) != mock.state_config:
+        if spec.get("stateful"):
+            mock.enable_state(spec["stateful"])
+        else:
+            mock.disable_state()
+    if "chaos_enabled" in spec:
+        mock.chaos_enabled = spec["chaos_enabled"]
+        mock.chaos_config = ChaosConfig(spec["chaos"]) if spec.get("chaos") else None
+    pool = spec.get("pool")
+    if pool:
+        size, low_water = pool_options(pool)
+        if mock.pool is None or (mock.pool.size, mock.pool.low_water) != (size, low_water):
+            mock.enable_pool(size, low_water)
+            mock.pool.ready.wait(POOL_WARM_TIMEOUT_S)
+    elif mock.pool is not None:
+        mock.disable_pool()
+    fixture = spec.get("fixture")
+    if fixture != (mock.fixture.path if mock.fixture else None):
+        if not fixture:
+            mock.detach_fixture()
+        else:
+            try:
+                mock.attach_fixture(fixture)
+            except (OSError, ValueError) as e:
+                print(f"FIXTURE ERROR ({mock.name}): {e}")
+
+def activate(mock, keep_chaos=True):
+    """Swaps a built mock in as the live version of its name. Raises ValueError for route conflicts."""
+    if mock.version is None:
+        mock.version = active_simulations.reserve_version(mock.name)
+    try:
+        active_simulations.register(mock, keep_chaos=keep_chaos)
+    except ValueError:
+        mock.disable_pool()
+        raise
+    return mock
+
+def install_mock(spec, func=None):
+    """
+    Builds a Mock from a spec and swaps it in. Used both by /deploy and when another
+    worker's deploy is synced in. Everything slow (compiling, seeding state, filling the
+    pool) happens before the swap, so in-flight and new requests never see a half-built mock.
+    Raises ValueError for route conflicts and whatever exec raises for bad code.
+    """
+    return activate(build_mock(spec, func), keep_chaos="chaos_enabled" not in spec)
+
+def prepare_deploy(data_in):
+    """
+    Validates a /deploy body and infers the local plan every engine builds on.
+    Returns (job, None), or (None, error payload).
+    """
     api_key = data_in.get('api_key')
     schema = data_in.get('schema')
-    
-    if not api_key: return jsonify({"success": False, "error": "API Key Missing"})
+    engine = data_in.get('engine') or ('gemini' if api_key else 'local')
+    name = data_in.get('name') or 'default'
+    methods = data_in.get('methods') or ["GET"]
+    execution = data_in.get('execution') or 'inline'
+    if engine not in ENGINES: return None, {"success": False, "error": f"Unknown engine: {engine}"}
+    if execution not in EXECUTION_MODES: return None, {"success": False, "error": f"Unknown execution mode: {execution}"}
+    if not isinstance(name, str) or not NAME_RE.match(name): return None, {"success": False, "error": f"Invalid mock name: {name}"}
+    if any(m.upper() not in MOCK_METHODS for m in methods):
+        return None, {"success": False, "error": f"Methods must be among {', '.join(MOCK_METHODS)}"}
 
-    # 1. Get Clean Code
-    code_body = get_ai_logic(api_key, schema)
-    
-    # 2. Construct Function
-    # We wrap the AI's code inside a real function definition
-    full_code = "def dynamic_generator():\n"
-    full_code += "    import random, datetime, uuid\n"
-    # Indent every line of the AI's body by 4 spaces
-    for line in code_body.splitlines():
-        full_code += f"    {line}\n"
-
-    # 3. Compile
     try:
-        local_ns = {}
-        # We print the code to console for debugging if it fails
-        print("--- COMPILING AI CODE ---")
-        print(full_code)
-        print("-------------------------")
-        
-        exec(full_code, {}, local_ns)
-        active_simulations['default'] = local_ns['dynamic_generator']
+        runs, sample_rate = validation_options(data_in.get('validate'))
+        pool = pool_options(data_in['pool']) if data_in.get('pool') else None
+    except ValueError as e:
+        return None, {"success": False, "error": str(e)}
+
+    samples = data_in.get('samples')
+    if samples is not None:
+        # Many samples (e.g. recorded responses): one merged plan fitted to all of them
+        if not isinstance(samples, list) or not samples:
+            return None, {"success": False, "error": "'samples' must be a non-empty list"}
+        shape = plan_from_samples(samples)
+        schema = json.dumps(samples[:GEMINI_PROMPT_SAMPLES])
+    else:
+        try:
+            sample = json.loads(schema) if isinstance(schema, str) else schema
+        except ValueError as e:
+            return None, {"success": False, "error": f"Invalid JSON sample: {e}"}
+        shape = infer_plan(sample)
+    cache_key = None
+    if engine == 'gemini':
+        # A list of samples must not share a key with one sample that happens to be that list
+        cache_key = schema_cache_key(schema) if samples is None else schema_cache_key(samples, f"{PROMPT_VERSION}:samples")
+    job = {
+        "api_key": api_key, "schema": schema, "engine": engine, "name": name, "methods": methods,
+        "execution": execution, "route": data_in.get('route'),
+        "pool": {"size": pool[0], "low_water": pool[1]} if pool else None,
+        "stateful": data_in.get('stateful') or None, "plan": shape, "shape": shape,
+        "runs": runs, "sample_rate": sample_rate, "func": None, "validation": None, "fallback": False,
+        "cache_key": cache_key, "cached": False,
+    }
+    return job, None
+
+def refine_job(job):
+    """Lets Gemini refine a gemini-engine job's plan (from the cache when this schema was refined before). Returns an error payload or None."""
+    if job["engine"] != 'gemini':
+        return None
+    cached_plan = generator_cache.get(job["cache_key"])
+    if cached_plan is not None:
+        job["plan"], job["cached"] = json.loads(cached_plan), True
+        return None
+    if not job["api_key"]: return {"success": False, "error": "API Key Missing"}
+    proposal = refine_with_gemini(job["api_key"], job["schema"], job["plan"])
+    if proposal.startswith("# Error:"):
+        return {"success": False, "error": f"Gemini Error: {proposal[len('# Error:'):].strip()}"}
+    try:
+        job["plan"] = refine_plan(job["plan"], json.loads(proposal))
+    except ValueError:
+        return {"success": False, "error": "Gemini returned an invalid plan"}
+    return None
+
+def check_job(job):
+    """
+    Compiles a job's plan and runs it `runs` times against a validator compiled from the
+    sample. A Gemini plan whose records raise or don't match goes back to Gemini with the
+    diffs, at most MAX_REPAIR_ROUNDS times, and the local plan replaces it if it still fails.
+    Sets job["func"] and job["validation"]; returns an error payload or None.
+    """
+    check = compile_validator(job["shape"]) if job["runs"] else None
+    repairs = 0
+    while True:
+        code_body = plan_to_code(job["plan"])
+        try:
+            func = compile_generator(code_body)
+        except Exception as e:
+            print(f"COMPILATION ERROR: {e}")
+            if not repairs or job["fallback"]:
+                return {"success": False, "error": f"Syntax Error: {e}"}
+            report = None  # a repair that doesn't even compile: give up on Gemini
+        else:
+            if check is None:
+                job["func"] = func
+                return None
+            report = validate_generator(job["name"], func, generator_source(code_body), job["execution"], check, job["runs"])
+            if report["ok"] or job["engine"] != 'gemini' or job["fallback"]:
+                break
+        if report is not None and repairs < MAX_REPAIR_ROUNDS and job["api_key"]:
+            repairs += 1
+            print(f"VALIDATION ({job['name']}): {report['raised']} raised, {report['mismatched']} mismatched "
+                  f"of {report['runs']}; repair {repairs}/{MAX_REPAIR_ROUNDS}")
+            proposal = refine_with_gemini(job["api_key"], job["schema"], job["plan"], feedback=repair_feedback(report))
+            if not proposal.startswith("# Error:"):
+                try:
+                    job["plan"], job["cached"] = refine_plan(job["shape"], json.loads(proposal)), False
+                    continue
+                except ValueError:
+                    pass
+        print(f"VALIDATION ({job['name']}): Gemini plan still failing, falling back to the local plan")
+        job["plan"], job["fallback"] = job["shape"], True
+    job["func"] = func
+    job["validation"] = dict(report, repairs=repairs, fallback=job["fallback"])
+    return None
+
+def finish_deploy(job):
+    """Registers a checked job's mock and publishes it. Returns the /deploy payload."""
+    plan = job["plan"]
+    spec = {
+        "name": job["name"], "plan": plan, "shape": job["shape"], "route": job["route"], "methods": job["methods"],
+        "engine": job["engine"], "execution": job["execution"], "pool": job["pool"], "stateful": job["stateful"],
+        "validate": {"sample_rate": job["sample_rate"]},
+    }
+    try:
+        mock = build_mock(spec, job["func"])
+        mock.validation = job["validation"]
+        # The watcher must not apply an older snapshot between the swap and the publish
+        with deploy_lock:
+            activate(mock)
+            publish_mock(mock, new_version=True)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+
+    # Only Gemini plans that compiled and passed validation are worth remembering
+    if job["engine"] == 'gemini' and not job["cached"] and not job["fallback"]:
+        generator_cache.put(job["cache_key"], json.dumps(plan))
+    return {
+        "success": True, "name": job["name"], "version": mock.version, "route": mock.route, "endpoint": f"/api/mirage{mock.route}",
+        "engine": job["engine"], "cached": job["cached"], "cache_key": job["cache_key"], "plan": plan,
+        "validation": job["validation"],
+    }
+
+def plan_job(job):
+    """Steps 2 and 3 of a deploy, the slow ones: Gemini refinement, then compile and validate."""
+    return refine_job(job) or check_job(job)
+
+def deploy_mock(data_in):
+    """Validates a /deploy body, plans and compiles the generator, and registers the mock. Returns the JSON payload."""
+    # 1. Infer the local plan; every engine builds on it
+    job, error = prepare_deploy(data_in)
+    if error: return error
+    # 2. Let Gemini refine it
+    error = refine_job(job)
+    if error: return error
+    # 3. Compile it and check its records against the sample, repairing a failing Gemini plan
+    error = check_job(job)
+    if error: return error
+    # 4. Construct and register it under its name and route
+    return finish_deploy(job)
+
+def batch_deploy_events(data):
+    """
+    Deploys many mocks from one POST /deploy/batch body: {"mocks": [...]} and/or an
+    "openapi" bundle, plus defaults (api_key, engine, execution) for every entry.
+    Gemini refinements (and validation) run concurrently, `concurrency` at a time (at
+    most GEMINI_CONCURRENCY), and each mock is registered as soon as its plan has been
+    checked. Returns an iterator of one result per mock as it finishes, then
+    {"summary": ...}. Raises ValueError (before anything is deployed) for a body that isn't a batch.
+    """
+    if not isinstance(data, dict): raise ValueError("Body must be a JSON object")
+    items = list(data.get('mocks') or [])
+    if data.get('openapi') is not None:
+        items += mocks_from_openapi(data['openapi'])
+    if not items: raise ValueError("Nothing to deploy: pass 'mocks' or 'openapi'")
+    if len(items) > MAX_BATCH_DEPLOY: raise ValueError(f"At most {MAX_BATCH_DEPLOY} mocks per batch")
+    if not all(isinstance(item, dict) for item in items): raise ValueError("Each mock must be a JSON object")
+    names = [item.get('name') or 'default' for item in items]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates: raise ValueError(f"Duplicate mock names: {', '.join(map(str, duplicates))}")
+    concurrency = max(1, min(GEMINI_CONCURRENCY, int(data.get('concurrency') or GEMINI_CONCURRENCY)))
+    defaults = {k: data[k] for k in ('api_key', 'engine', 'execution') if data.get(k) is not None}
+    return _run_batch([dict(defaults, **item) for item in items], concurrency)
+
+def _run_batch(items, concurrency):
+    started = time.perf_counter()
+    deployed = failed = 0
+    jobs = []
+    for item in items:
+        try:
+            job, error = prepare_deploy(item)
+        except Exception as e:
+            # One sample the planner can't handle must not take the rest of the batch down
+            job, error = None, {"success": False, "error": f"{type(e).__name__}: {e}"}
+        if error:
+            failed += 1
+            yield dict(error, name=item.get('name') or 'default')
+        else:
+            jobs.append(job)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="mirage-deploy") as executor:
+        futures = {executor.submit(plan_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result() or finish_deploy(job)
+            except Exception as e:
+                result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+            if result["success"]:
+                deployed += 1
+                result = {k: v for k, v in result.items() if k != "plan"}
+            else:
+                failed += 1
+                result = dict(result, name=job["name"])
+            yield result
+    yield {"summary": {"success": failed == 0, "deployed": deployed, "failed": failed,
+                       "seconds": round(time.perf_counter() - started, 3)}}
+
+def batch_deploy(data):
+    """POST /deploy/batch without streaming: every result, then the summary. Returns (payload, status)."""
+    try:
+        events = list(batch_deploy_events(data))
+    except (ValueError, TypeError) as e:
+        return {"success": False, "error": str(e)}, 400
+    return dict(events[-1]["summary"], results=events[:-1]), 200
+
+def invalidate_cache(data):
+    """
+    Applies a POST /api/cache/invalidate body. Returns (payload, status).
+    {"key": k} or {"schema": s} drops one cached plan; an empty body drops them all.
+    """
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    key = data.get('key')
+    if key is None and data.get('schema') is not None:
+        key = schema_cache_key(data['schema'])
+    return {"success": True, "removed": generator_cache.invalidate(key)}, 200
+
+def remove_mock(name):
+    with deploy_lock:
+        if not active_simulations.remove(name):
+            return False
+        publish_removal(name)
+    return True
+
+def mock_versions(name):
+    """GET /api/mocks/<name>/versions: every version still available for rollback, newest first. Returns (payload, status)."""
+    current = active_simulations.get(name)
+    if not current: return {"error": "Not Deployed"}, 404
+    rows = {}
+    for version, spec in shared_versions(name).items():
+        rows[version] = {"version": version, "live": False, "loaded": False,
+                         "engine": spec.get("engine"), "deployed_at": spec.get("deployed_at")}
+    for mock in [current] + active_simulations.retained(name):
+        rows[mock.version] = {"version": mock.version, "live": mock is current, "loaded": True,
+                              "engine": mock.engine, "deployed_at": mock.deployed_at}
+    return {"name": name, "live": current.version, "versions": sorted(rows.values(), key=lambda r: -r["version"])}, 200
+
+def rollback_mock(name, data):
+    """
+    Applies a POST /api/mocks/<name>/rollback body. Returns (payload, status).
+    Swaps `version` (by default the newest one older than the live one) back in. A version this
+    worker still holds goes live as it was, without recompiling; an older one is rebuilt from
+    the spec the shared snapshot keeps. Chaos settings stay as they are, like on a redeploy.
+    """
+    current = active_simulations.get(name)
+    if not current: return {"error": "Not Deployed"}, 404
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    try:
+        version = _int_arg(data, 'version', None, 1, 2 ** 31)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    stored = shared_versions(name)
+    if version is None:
+        older = [v for v in [m.version for m in active_simulations.retained(name)] + list(stored) if v < current.version]
+        if not older: return {"success": False, "error": f"No version of '{name}' older than {current.version} is retained"}, 404
+        version = max(older)
+    if version == current.version:
+        return {"success": True, "name": name, "version": version, "previous": version}, 200
+
+    target = active_simulations.find_version(name, version)
+    with deploy_lock:
+        try:
+            if target is not None:
+                spec = {k: v for k, v in target.spec().items() if k not in ("chaos_enabled", "chaos")}
+                apply_settings(target, dict(spec, pool=target.retired_pool))
+                activate(target)
+            elif version in stored:
+                spec = {k: v for k, v in stored[version].items() if k not in ("chaos_enabled", "chaos")}
+                target = install_mock(spec)
+            else:
+                return {"success": False, "error": f"Version {version} of '{name}' is no longer retained"}, 404
+        except Exception as e:
+            return {"success": False, "error": f"Rollback failed: {e}"}, 400
+        publish_mock(target)
+    return {"success": True, "name": name, "version": target.version, "previous": current.version}, 200
+
+def chaos_config_from_request(data):
+    """
+    Builds a ChaosConfig from a /api/chaos body: a full latency/faults/schedule
+    spec, or the legacy {"rate": x} meaning HTTP 500 with probability x.
+    Returns None when the body only toggles chaos on or off.
+    """
+    try:
+        if any(k in data for k in ('latency', 'faults', 'schedule')):
+            return ChaosConfig({k: data[k] for k in ('latency', 'faults', 'schedule') if k in data})
+        if 'rate' in data:
+            return ChaosConfig.legacy(float(data['rate']))
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Malformed chaos config: {e}")
+    return None
+
+def chaos_status():
+    return {
+        "chaos": CHAOS_ENABLED,
+        "config": CHAOS_CONFIG.to_dict(),
+        "mocks": {m.name: m.describe()["chaos"] for m in active_simulations.all()},
+    }
+
+def configure_chaos(data):
+    """Applies a POST /api/chaos body. Returns (payload, status)."""
+    global CHAOS_ENABLED, CHAOS_CONFIG
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    try:
+        config = chaos_config_from_request(data)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+
+    name = data.get('name')
+    if not name:
+        with deploy_lock:
+            CHAOS_ENABLED = data.get('enabled', config is not None)
+            if config is not None:
+                CHAOS_CONFIG = config
+            publish_chaos()
+        return {"success": True, "chaos": CHAOS_ENABLED, "config": CHAOS_CONFIG.to_dict()}, 200
+
+    mock = active_simulations.get(name)
+    if not mock: return {"success": False, "error": f"Unknown mock: {name}"}, 404
+    with deploy_lock:
+        # enabled: null hands the mock back to the global toggle
+        mock.chaos_enabled = data.get('enabled', config is not None)
+        if config is not None:
+            mock.chaos_config = config
+        publish_mock(mock)
+    return {"success": True, "name": name, "chaos": mock.chaos_active(), "config": (mock.chaos_config or CHAOS_CONFIG).to_dict()}, 200
+
+def configure_pool_for(name, data):
+    """Applies a POST /api/mocks/<name>/pool body. Returns (payload, status)."""
+    mock = active_simulations.get(name)
+    if not mock: return {"error": "Not Deployed"}, 404
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    try:
+        size, low_water = pool_options(data)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    with deploy_lock:
+        if data.get('enabled', True):
+            mock.enable_pool(size, low_water)
+        else:
+            mock.disable_pool()
+        publish_mock(mock)
+    return {"success": True, "pool": mock.pool.stats() if mock.pool else None}, 200
+
+def validate_mock(name, data):
+    """
+    Applies a POST /api/mocks/<name>/validate body. Returns (payload, status).
+    Runs `runs` seeded records of the deployed generator through its validator (0 skips
+    the batch) and, with `sample_rate`, sets the fraction of served records checked live.
+    """
+    mock = active_simulations.get(name)
+    if not mock: return {"error": "Not Deployed"}, 404
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    try:
+        runs, sample_rate = validation_options(dict({"sample_rate": mock.live_rate}, **data))
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    if sample_rate != mock.live_rate:
+        with deploy_lock:
+            mock.live_rate = sample_rate
+            publish_mock(mock)
+    if runs:
+        mock.validate(runs, str(data.get('seed', 'validate')))
+    return dict(mock.validation_status(), success=True), 200
+
+def plan_digest(plan):
+    return hashlib.sha256(json.dumps(plan, sort_keys=True).encode("utf-8")).hexdigest()
+
+def generated_records(mock, count, seed):
+    """
+    `count` seeded records for bulk work (fixtures, state seeding). Inline mocks use the
+    column-wise bulk generator when NumPy is installed; sandboxed mocks (and everything
+    without NumPy) go through generate().
+    """
+    if mirage_export.np is not None and mock.execution == "inline":
+        return load_bulk_generator(mock.plan, mock.func)(count, seed)
+    return mock.generate(0, count, seed)
+
+def fixture_bodies(mock, count, seed):
+    """Encoded records for a fixture, FIXTURE_BULK_CHUNK at a time."""
+    for start in range(0, count, FIXTURE_BULK_CHUNK):
+        for record in generated_records(mock, min(FIXTURE_BULK_CHUNK, count - start), f"{seed}:{start}"):
+            yield encode_record(record).encode("utf-8")
+
+def fixture_path(path):
+    """
+    The file a client-supplied fixture path names: relative to FIXTURE_DIR, or already inside
+    it. Raises ValueError for anything that resolves outside FIXTURE_DIR (.., absolute paths, symlinks).
+    """
+    if not isinstance(path, str) or not path:
+        raise ValueError("'path' must be a fixture file name")
+    root = os.path.realpath(FIXTURE_DIR)
+    for candidate in (path, os.path.join(FIXTURE_DIR, path)):
+        resolved = os.path.realpath(candidate)
+        if resolved != root and os.path.commonpath([root, resolved]) == root:
+            return resolved
+    raise ValueError(f"'path' must name a file inside {FIXTURE_DIR}")
+
+def materialize_mock(name, data):
+    """
+    Applies a POST /api/mocks/<name>/materialize body. Returns (payload, status).
+    {"count": N, "seed": s} writes N records (or reuses a file already written for the same
+    plan, count and seed), {"path": p} attaches an existing fixture, {"enabled": false} detaches.
+    A `path` names a file in FIXTURE_DIR; anything outside it is refused.
+    """
+    mock = active_simulations.get(name)
+    if not mock: return {"error": "Not Deployed"}, 404
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    if not data.get('enabled', True):
+        with deploy_lock:
+            mock.detach_fixture()
+            publish_mock(mock)
+        return {"success": True, "fixture": None}, 200
+
+    path = data.get('path')
+    if path is not None:
+        try:
+            path = fixture_path(path)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}, 400
+    if path and 'count' not in data:
+        with deploy_lock:
+            try:
+                mock.attach_fixture(path)
+            except (OSError, ValueError) as e:
+                return {"success": False, "error": str(e)}, 400
+            publish_mock(mock)
+        return {"success": True, "reused": True, "fixture": mock.fixture.describe()}, 200
+
+    try:
+        count = _int_arg(data, 'count', None, 1, MAX_FIXTURE_COUNT)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    if count is None: return {"success": False, "error": "'count' is required"}, 400
+    seed = str(data.get('seed', '0'))
+    digest = plan_digest(mock.plan)
+    if not path:
+        safe_seed = re.sub(r'[^A-Za-z0-9_.-]', '_', seed)
+        path = os.path.join(FIXTURE_DIR, f"{name}-{digest[:12]}-{safe_seed}-{count}.mfx")
+
+    meta = read_meta(path)
+    reused = (not data.get('regenerate') and meta is not None and meta.get("plan") == digest
+              and meta.get("seed") == seed and meta.get("count") == count)
+    started = time.perf_counter()
+    if not reused:
+        generator = "bulk" if mirage_export.np is not None and mock.execution == "inline" else "generate"
+        try:
+            write_fixture(path, fixture_bodies(mock, count, seed),
+                          {"mock": name, "plan": digest, "seed": seed, "generator": generator})
+        except Exception as e:
+            return {"success": False, "error": f"Materialize failed: {e}"}, 500
+    with deploy_lock:
+        mock.attach_fixture(path)
+        publish_mock(mock)
+    return {"success": True, "reused": reused, "seconds": round(time.perf_counter() - started, 3),
+            "fixture": mock.fixture.describe()}, 200
+
+def configure_state_for(name, data):
+    """
+    Applies a POST /api/mocks/<name>/state body. Returns (payload, status).
+    Enabling (again) reseeds the store; {"enabled": false} goes back to stateless generation.
+    """
+    mock = active_simulations.get(name)
+    if not mock: return {"error": "Not Deployed"}, 404
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    with deploy_lock:
+        previous = (mock.store, mock.state_config)
+        try:
+            if data.get('enabled', True):
+                mock.enable_state({k: v for k, v in data.items() if k != 'enabled'})
+            else:
+                mock.disable_state()
+            active_simulations.refresh()
+        except (ValueError, TypeError) as e:
+            mock.store, mock.state_config = previous
+            return {"success": False, "error": str(e)}, 400
+        publish_mock(mock)
+    return {"success": True, "routes": mock.routes(), "state": mock.store.stats() if mock.store else None}, 200
+
+def export_mock(name):
+    """Source of a standalone server module for a deployed mock, or None if it isn't deployed."""
+    mock = active_simulations.get(name)
+    if not mock:
+        return None
+    return export_server(mock.plan, mock.name, mock.route, mock.methods, chaos_error_rate(mock.effective_chaos()))
+
+# --- METRICS & PROFILING ---
+def metrics_text():
+    """Prometheus exposition: the recorded families plus cache, pool, chaos, store and sandbox state read now."""
+    mocks = active_simulations.all()
+    cache = generator_cache.stats()
+    sandbox = sandbox_pool.stats()
+    pools = [(m.name, m.pool.stats()) for m in mocks if m.pool]
+    extra = [
+        ("mirage_mocks", "gauge", "Deployed mocks.", [({}, len(mocks))]),
+        ("mirage_cache_entries", "gauge", "Generator cache entries.", [({}, cache["entries"])]),
+        ("mirage_cache_bytes", "gauge", "Generator cache size in bytes.", [({}, cache["bytes"])]),
+        ("mirage_cache_hits_total", "counter", "Generator cache hits.", [({}, cache["hits"])]),
+        ("mirage_cache_misses_total", "counter", "Generator cache misses.", [({}, cache["misses"])]),
+        ("mirage_cache_evictions_total", "counter", "Generator cache evictions.", [({}, cache["evictions"])]),
+        ("mirage_pool_available", "gauge", "Pre-serialized bodies ready in a mock's response pool.",
+         [({"mock": name}, p["available"]) for name, p in pools]),
+        ("mirage_pool_hits_total", "counter", "Requests answered from a response pool.",
+         [({"mock": name}, p["hits"]) for name, p in pools]),
+        ("mirage_pool_fall_through_total", "counter", "Requests that found the response pool empty.",
+         [({"mock": name}, p["fall_through"]) for name, p in pools]),
+        ("mirage_pool_generated_total", "counter", "Bodies generated by pool refill threads.",
+         [({"mock": name}, p["generated"]) for name, p in pools]),
+        ("mirage_chaos_injected_total", "counter", "Injected latency and faults by type.",
+         [({"mock": m.name, "type": kind}, count) for m in mocks
+          for kind, count in m.chaos_stats.snapshot().items() if kind != "latency_ms_total"]),
+        ("mirage_store_rows", "gauge", "Rows in a stateful mock's store.",
+         [({"mock": m.name}, m.store.stats()["rows"]) for m in mocks if m.store]),
+        ("mirage_sandbox_workers_idle", "gauge", "Idle sandbox worker processes.",
+         [({}, sandbox["idle"] if sandbox["started"] else None)]),
+        ("mirage_sandbox_restarts_total", "counter", "Sandbox workers killed and replaced.", [({}, sandbox["restarts"])]),
+        ("mirage_profiler_running", "gauge", "1 while the sampling profiler is running.", [({}, profiler.running())]),
+    ]
+    return metrics.render(extra)
+
+def profiler_status(args):
+    """
+    GET /api/profiler: the profile so far as JSON, or collapsed stacks as text with ?format=folded.
+    Returns (payload, status).
+    """
+    if args.get('format') == 'folded':
+        return profiler.folded(), 200
+    try:
+        top = _int_arg(args, 'top', 20, 1, 1000)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return profiler.snapshot(top), 200
+
+def configure_profiler(data):
+    """Applies a POST /api/profiler body ({"enabled", "interval_ms", "reset"}). Returns (payload, status)."""
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    if not data.get('enabled', True):
+        profiler.stop()
+        return dict(profiler.snapshot(0), success=True), 200
+    try:
+        interval_ms = float(data.get('interval_ms', PROFILE_INTERVAL_MS))
+    except (TypeError, ValueError):
+        return {"success": False, "error": "'interval_ms' must be a number"}, 400
+    if interval_ms < MIN_PROFILE_INTERVAL_MS:
+        return {"success": False, "error": f"'interval_ms' must be at least {MIN_PROFILE_INTERVAL_MS}"}, 400
+    profiler.start(interval_ms / 1000.0, reset=data.get('reset', True))
+    return dict(profiler.snapshot(0), success=True), 200
+
+# --- RECORD & REPLAY ---
+class Recording:
+    """A named record log, the upstream it proxies to, and its writer while it records."""
+    def __init__(self, name, log, upstream=None):
+        self.name = name
+        self.log = log
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.recorder = Recorder(log, RECORD_QUEUE_SIZE) if upstream else None
+        self.local = threading.local()
+
+    def session(self):
+        """The calling thread's requests.Session, so upstream connections are kept alive per thread."""
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.stop()
+        self.log.close()
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "upstream": self.upstream,
+            "recording": self.recorder is not None,
+            "proxy": f"/api/proxy/{self.name}/" if self.upstream else None,
+            "replay": f"/api/replay/{self.name}/",
+            "log": self.log.describe(),
+            "recorder": self.recorder.stats() if self.recorder else None,
+        }
+
+recordings = {}  # name -> Recording
+recordings_lock = threading.Lock()
+
+def open_recording(data):
+    """
+    Applies a POST /api/recordings body. Returns (payload, status).
+    {"name", "upstream"} proxies /api/proxy/<name>/... to the upstream and records every
+    exchange (appending to RECORDING_DIR/<name>.log if it exists); without "upstream"
+    the log is opened for replay and learning only.
+    """
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    name = data.get('name') or 'default'
+    upstream = data.get('upstream')
+    if not isinstance(name, str) or not NAME_RE.match(name): return {"success": False, "error": f"Invalid recording name: {name}"}, 400
+    if upstream is not None and not (isinstance(upstream, str) and re.match(r'^https?://[^/\s]+', upstream)):
+        return {"success": False, "error": "'upstream' must be an http(s) URL"}, 400
+    path = os.path.join(RECORDING_DIR, f"{name}.log")
+    with recordings_lock:
+        current = recordings.pop(name, None)
+        if current is not None:
+            current.close()
+        try:
+            recording = recordings[name] = Recording(name, RecordLog(path), upstream)
+        except (OSError, ValueError) as e:
+            return {"success": False, "error": str(e)}, 400
+    return dict(recording.describe(), success=True), 200
+
+def close_recording(name):
+    """Stops proxying and recording; the log stays on disk for a later replay. False if it isn't open."""
+    with recordings_lock:
+        recording = recordings.pop(name, None)
+    if recording is None:
+        return False
+    recording.close()
+    return True
+
+def proxy_exchange(recording, method, subpath, query, headers, body):
+    """
+    Forwards one request to the recording's upstream and queues the exchange for the log.
+    Returns (status, content_type, headers, body); an unreachable upstream is a 502.
+    """
+    path = "/" + subpath.strip("/")
+    url = recording.upstream + path + (f"?{query}" if query else "")
+    forward = {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+    started = time.perf_counter()
+    try:
+        reply = recording.session().request(method, url, headers=forward, data=body or None,
+                                            timeout=PROXY_TIMEOUT_S, allow_redirects=False)
+    except requests.RequestException as e:
+        return 502, "application/json", {}, json.dumps({"error": f"Upstream Error: {e}"}).encode("utf-8")
+    elapsed = time.perf_counter() - started
+    PROXY_SECONDS.observe((recording.name,), elapsed)
+    content_type = reply.headers.get("Content-Type", "")
+    # Never blocks: the writer thread appends it, or it is dropped and counted
+    recording.recorder.record(method, path, query, reply.status_code, content_type, reply.content, round(elapsed * 1000, 3))
+    passed = {k: v for k, v in reply.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() != "content-type"}
+    return reply.status_code, content_type, passed, reply.content
+
+def replay_exchange(recording, method, subpath):
+    """The next recorded (status, content_type, body view) for this method and path, or None."""
+    entry = recording.log.lookup(method, "/" + subpath.strip("/"))
+    if entry is None:
+        REPLAYS.inc((recording.name, "miss"))
+        return None
+    REPLAYS.inc((recording.name, "hit"))
+    return entry.status, entry.content_type or "application/octet-stream", recording.log.body(entry)
+
+def learn_recording(name, data):
+    """
+    Applies a POST /api/recordings/<name>/learn body. Returns (payload, status).
+    Deploys one mock per recorded route, planned from up to `max_samples` of its 2xx JSON
+    responses merged into one plan with fitted value distributions. `engine`, `api_key`,
+    `execution`, `concurrency` and `validate` apply to every mock, as in a batch deploy.
+    """
+    recording = recordings.get(name)
+    if not recording: return {"error": "Not Recording"}, 404
+    if not isinstance(data, dict): return {"success": False, "error": "Body must be a JSON object"}, 400
+    try:
+        max_samples = _int_arg(data, 'max_samples', MAX_LEARN_SAMPLES, 1, 10 ** 6)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    mocks = learned_mocks(recording.log, max_samples)
+    if not mocks: return {"success": False, "error": "No JSON responses recorded yet"}, 400
+    if data.get('validate') is not None:
+        mocks = [dict(mock, validate=data['validate']) for mock in mocks]
+    batch = {k: data[k] for k in ('engine', 'api_key', 'execution', 'concurrency') if data.get(k) is not None}
+    return batch_deploy(dict(batch, mocks=mocks))
+
+# --- SHARED STATE (multi-worker) ---
+shared_state = None
+state_watcher = None
+state_notifier = None
+applied_generation = 0
+published_generation = 0
+# Held from a local change to its publish, and while a synced snapshot is applied, so the
+# watcher never rolls a worker back to a snapshot taken before its own latest write
+deploy_lock = threading.RLock()
+
+def _apply_chaos_state(chaos):
+    global CHAOS_ENABLED, CHAOS_CONFIG
+    if chaos is not None:
+        CHAOS_ENABLED = chaos["enabled"]
+        CHAOS_CONFIG = ChaosConfig(chaos["config"])
+
+def _after_publish(written):
+    global applied_generation, published_generation
+    state, token = written
+    published_generation = state["generation"]
+    if state["generation"] == applied_generation + 1:
+        # Nothing changed in between, so our own write must not trigger a rebuild in this worker;
+        # otherwise the watcher applies the snapshot to pick up the other workers' changes
+        applied_generation = state["generation"]
+        if state_watcher is not None:
+            state_watcher.last_token = token
+    if state_notifier is not None:
+        state_notifier.notify()
+
+def publish_mock(mock, new_version=False):
+    """
+    Writes a mock's spec to the shared snapshot, and into its version history there.
+    A new deploy is renumbered past the highest version any worker has published for the
+    name, so deploys racing in two workers never share a number.
+    """
+    if shared_state is None:
+        return
+
+    def mutate(state):
+        latest = state.setdefault("latest", {})
+        if new_version and mock.version <= latest.get(mock.name, 0):
+            mock.version = latest[mock.name] + 1
+        latest[mock.name] = max(latest.get(mock.name, 0), mock.version)
+        spec = mock.spec()
+        mock.spec_digest = spec_digest(spec)
+        state["mocks"][mock.name] = spec
+        history = state.setdefault("versions", {}).setdefault(mock.name, {})
+        history[str(mock.version)] = spec
+        for version in sorted(history, key=int)[:-(MAX_RETAINED_VERSIONS + 1)]:
+            del history[version]
+
+    _after_publish(shared_state.update(mutate))
+    active_simulations.note_version(mock.name, mock.version)
+
+def publish_removal(name):
+    if shared_state is None:
+        return
+
+    def mutate(state):
+        state["mocks"].pop(name, None)
+        state.get("versions", {}).pop(name, None)
+
+    _after_publish(shared_state.update(mutate))
+
+def shared_versions(name):
+    """{version: spec} the shared snapshot keeps for `name`; empty without shared state."""
+    if shared_state is None:
+        return {}
+    return {int(v): spec for v, spec in shared_state.read().get("versions", {}).get(name, {}).items()}
+
+def publish_chaos():
+    if shared_state is None:
+        return
+    chaos = {"enabled": CHAOS_ENABLED, "config": CHAOS_CONFIG.to_dict()}
+    _after_publish(shared_state.update(lambda state: state.__setitem__("chaos", chaos)))
+
+def spec_digest(spec):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+def sync_from_state(state):
+    """Rebuilds only the mocks whose spec changed in another worker, and drops the ones it removed."""
+    global applied_generation
+    with deploy_lock:
+        # A snapshot read before this worker's own latest publish is already out of date
+        generation = state.get("generation", 0)
+        if generation <= applied_generation or generation < published_generation:
+            return
+        _apply_chaos_state(state.get("chaos"))
+        wanted = state.get("mocks", {})
+        for name, spec in wanted.items():
+            digest = spec_digest(spec)
+            current = active_simulations.get(name)
+            if current is not None and current.spec_digest == digest:
+                continue
+            try:
+                sync_mock(current, spec).spec_digest = digest
+            except Exception as e:
+                print(f"STATE SYNC: could not install mock '{name}': {e}")
+        for mock in active_simulations.all():
+            if mock.name not in wanted:
+                active_simulations.remove(mock.name)
+        applied_generation = generation
+
+def sync_mock(current, spec):
+    """
+    Applies another worker's spec for one mock: settings changes to the live version in place,
+    a version this worker still holds swapped back in, anything else compiled and swapped in.
+    """
+    version, digest = spec.get("version"), plan_digest(spec["plan"])
+    if current is not None and current.version == version and plan_digest(current.plan) == digest:
+        apply_settings(current, spec)
+        active_simulations.refresh()
+        return current
+    retained = active_simulations.find_version(spec["name"], version)
+    if retained is not None and plan_digest(retained.plan) == digest:
+        apply_settings(retained, spec)
+        return activate(retained, keep_chaos=False)
+    return install_mock(spec)
+
+def enable_shared_state(path):
+    """
+    Shares the mock registry with every other process pointing at the same snapshot file.
+    Call once per worker process before serving traffic.
+    """
+    global shared_state, state_watcher, state_notifier
+    if shared_state is not None:
+        return
+    shared_state = StateFile(path)
+    state_notifier = change_notifier(path)
+    state_watcher = StateWatcher(shared_state, sync_from_state, notifier=state_notifier)
+    state_watcher.start()
+
+# --- HTTP ROUTES ---
+@app.route('/deploy', methods=['POST'])
+def deploy():
+    data = request.json
+    if not isinstance(data, dict): return jsonify({"success": False, "error": "Body must be a JSON object"}), 400
+    return jsonify(deploy_mock(data))
+
+@app.route('/deploy/batch', methods=['POST'])
+def deploy_batch():
+    data = request.get_json(silent=True)
+    if request.args.get('stream') != 'ndjson':
+        payload, status = batch_deploy(data)
+        return jsonify(payload), status
+    try:
+        events = batch_deploy_events(data)
+    except (ValueError, TypeError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    # One line per mock as it finishes, so a long batch shows progress
+    return Response((json.dumps(event) + "\n" for event in events), mimetype="application/x-ndjson")
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(generator_cache.stats())
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    payload, status = invalidate_cache(request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+@app.route('/api/chaos', methods=['GET', 'POST'])
+def toggle_chaos():
+    if request.method == 'GET':
+        return jsonify(chaos_status())
+    payload, status = configure_chaos(request.json)
+    return jsonify(payload), status
+
+@app.route('/api/sandbox', methods=['GET'])
+def sandbox_stats():
+    return jsonify(sandbox_pool.stats())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/profiler', methods=['GET', 'POST'])
+def manage_profiler():
+    if request.method == 'GET':
+        payload, status = profiler_status(request.args)
+        if isinstance(payload, str):
+            return Response(payload, status=status, mimetype="text/plain")
+        return jsonify(payload), status
+    payload, status = configure_profiler(request.get_json(silent=True))
+    return jsonify(payload), status
+
+@app.route('/api/mocks', methods=['GET'])
+def list_mocks():
+    return jsonify({"mocks": [mock.describe() for mock in active_simulations.all()]})
+
+@app.route('/api/mocks/<name>', methods=['GET', 'DELETE'])
+def manage_mock(name):
+    if request.method == 'DELETE':
+        if not remove_mock(name): return jsonify({"error": "Not Deployed"}), 404
+        return jsonify({"success": True})
+    mock = active_simulations.get(name)
+    if not mock: return jsonify({"error": "Not Deployed"}), 404
+    return jsonify(dict(mock.describe(), plan=mock.plan))
+
+@app.route('/api/mocks/<name>/versions', methods=['GET'])
+def list_versions(name):
+    payload, status = mock_versions(name)
+    return jsonify(payload), status
+
+@app.route('/api/mocks/<name>/rollback', methods=['POST'])
+def rollback(name):
+    payload, status = rollback_mock(name, request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+@app.route('/api/mocks/<name>/export', methods=['GET'])
+def export_mock_server(name):
+    source = export_mock(name)
+    if source is None: return jsonify({"error": "Not Deployed"}), 404
+    return Response(source, mimetype="text/x-python",
+                    headers={"Content-Disposition": f'attachment; filename="{name}_server.py"'})
+
+@app.route('/api/mocks/<name>/state', methods=['POST'])
+def configure_state(name):
+    payload, status = configure_state_for(name, request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+@app.route('/api/mocks/<name>/materialize', methods=['POST'])
+def materialize(name):
+    payload, status = materialize_mock(name, request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+@app.route('/api/mocks/<name>/validate', methods=['POST'])
+def run_validation(name):
+    payload, status = validate_mock(name, request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+@app.route('/api/mocks/<name>/pool', methods=['POST'])
+def configure_pool(name):
+    payload, status = configure_pool_for(name, request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+@app.route('/api/recordings', methods=['GET', 'POST'])
+def manage_recordings():
+    if request.method == 'GET':
+        return jsonify({"recordings": [r.describe() for r in list(recordings.values())]})
+    payload, status = open_recording(request.get_json(silent=True))
+    return jsonify(payload), status
+
+@app.route('/api/recordings/<name>', methods=['GET', 'DELETE'])
+def manage_recording(name):
+    if request.method == 'DELETE':
+        if not close_recording(name): return jsonify({"error": "Not Recording"}), 404
         return jsonify({"success": True})
+    recording = recordings.get(name)
+    if not recording: return jsonify({"error": "Not Recording"}), 404
+    return jsonify(recording.describe())
+
+@app.route('/api/recordings/<name>/learn', methods=['POST'])
+def learn(name):
+    payload, status = learn_recording(name, request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+@app.route('/api/proxy/<name>/', defaults={'subpath': ''}, methods=list(MOCK_METHODS))
+@app.route('/api/proxy/<name>/<path:subpath>', methods=list(MOCK_METHODS))
+def proxy(name, subpath):
+    recording = recordings.get(name)
+    if not recording or not recording.upstream: return jsonify({"error": "Not Recording"}), 404
+    status, content_type, headers, body = proxy_exchange(
+        recording, request.method, subpath, request.query_string.decode("latin-1"), request.headers, request.get_data())
+    return Response(body, status=status, content_type=content_type or None, headers=headers)
+
+@app.route('/api/replay/<name>/', defaults={'subpath': ''}, methods=list(MOCK_METHODS))
+@app.route('/api/replay/<name>/<path:subpath>', methods=list(MOCK_METHODS))
+def replay(name, subpath):
+    recording = recordings.get(name)
+    if not recording: return jsonify({"error": "Not Recording"}), 404
+    found = replay_exchange(recording, request.method, subpath)
+    if found is None: return jsonify({"error": "Not Recorded"}), 404
+    status, content_type, body = found
+    return Response([body], status=status, content_type=content_type)
+
+def apply_path_params(data, params):
+    """Echoes path parameters into matching top-level fields, keeping the sample's type."""
+    if not params or not isinstance(data, dict):
+        return data
+    for key, value in params.items():
+        if key in data:
+            if isinstance(data[key], int) and not isinstance(data[key], bool) and value.lstrip("-").isdigit():
+                value = int(value)
+            data[key] = value
+    return data
+
+# --- BATCH & STREAMING ---
+encode_record = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+# --- SEEDED GENERATION ---
+_thread_state = threading.local()
+
+def worker_rng():
+    """Per-thread Random for unseeded traffic, so threads never share RNG state."""
+    rng = getattr(_thread_state, "rng", None)
+    if rng is None:
+        rng = _thread_state.rng = random.Random()
+    return rng
+
+def request_seed(args, headers):
+    """?seed= wins over the X-Mirage-Seed header; None means unseeded."""
+    return args.get('seed') or headers.get('X-Mirage-Seed') or None
+
+def encode_cursor(seed, offset, page_size):
+    raw = json.dumps({"s": seed, "o": offset, "n": page_size}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        seed, offset, page_size = str(data["s"]), int(data["o"]), int(data["n"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if offset < 0 or not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError("Invalid cursor")
+    return seed, offset, page_size
+
+def _int_arg(args, name, default, low, high):
+    raw = args.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be an integer")
+    if not low <= value <= high:
+        raise ValueError(f"'{name}' must be between {low} and {high}")
+    return value
+
+def parse_batch_args(args, seed=None):
+    """
+    Reads count / stream / page / page_size / cursor from the query string.
+    Returns None for a plain single-record request, else a dict describing the batch.
+    """
+    ndjson = args.get('stream') == 'ndjson'
+    if args.get('stream') not in (None, 'ndjson'):
+        raise ValueError("'stream' must be 'ndjson'")
+
+    if 'cursor' in args or 'page' in args or 'page_size' in args:
+        if 'cursor' in args:
+            seed, offset, page_size = decode_cursor(args['cursor'])
+            page_size = _int_arg(args, 'page_size', page_size, 1, MAX_PAGE_SIZE)
+        else:
+            page_size = _int_arg(args, 'page_size', DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+            offset = (_int_arg(args, 'page', 1, 1, 10 ** 9) - 1) * page_size
+        # Without a seed the first page picks one and the cursor carries it forward
+        if seed is None:
+            seed = uuid.uuid4().hex[:16]
+        return {"kind": "page", "ndjson": ndjson, "seed": seed, "offset": offset, "count": page_size}
+
+    if 'count' in args or ndjson:
+        count = _int_arg(args, 'count', 1, 0, MAX_BATCH_COUNT)
+        return {"kind": "stream", "ndjson": ndjson, "seed": seed, "offset": 0, "count": count}
+    return None
+
+def iter_records(mock, offset, count, seed=None, params=None):
+    """Calls the generator in a tight loop; seeded batches give record i its own RNG so any slice is reproducible."""
+    for record in mock.generate(offset, count, seed):
+        yield apply_path_params(record, params)
+
+def stream_records(mock, records, ndjson):
+    """
+    Serializes records into ~64 KB chunks, so neither the record list nor the
+    full body is ever held in memory. A generator failure mid-stream can no
+    longer change the status code; it is counted and the body is cut short.
+    """
+    buf = [] if ndjson else ["["]
+    size = 0
+    sep = ""
+    encoding = 0.0
+    clock = time.perf_counter
+    labels = (mock.name,)
+    try:
+        for record in records:
+            started = clock()
+            text = encode_record(record)
+            encoding += clock() - started
+            if ndjson:
+                buf.append(text)
+                buf.append("\n")
+            else:
+                buf.append(sep)
+                buf.append(text)
+                sep = ","
+            size += len(text) + 1
+            if size >= STREAM_CHUNK_BYTES:
+                SERIALIZE_SECONDS.observe(labels, encoding)
+                yield "".join(buf).encode("utf-8")
+                buf, size, encoding = [], 0, 0.0
     except Exception as e:
-        print(f"COMPILATION ERROR: {e}")
-        return jsonify({"success": False, "error": f"Syntax Error: {e}"})
+        mock.stats.hit("errors")
+        print(f"STREAM ERROR ({mock.name}): {e}")
+        if buf:
+            yield "".join(buf).encode("utf-8")
+        return
+    if not ndjson:
+        buf.append("]")
+    if buf:
+        SERIALIZE_SECONDS.observe(labels, encoding)
+        yield "".join(buf).encode("utf-8")
 
-@app.route('/api/chaos', methods=['POST'])
-def toggle_chaos():
-    global CHAOS_ENABLED
-    data = request.json
-    CHAOS_ENABLED = data.get('enabled', False)
-    return jsonify({"success": True, "chaos": CHAOS_ENABLED})
+def serve_batch(mock, batch, params):
+    records = iter_records(mock, batch["offset"], batch["count"], batch["seed"], params)
+    mimetype = "application/x-ndjson" if batch["ndjson"] else "application/json"
+    if batch["kind"] == "stream":
+        return Response(stream_records(mock, records, batch["ndjson"]), mimetype=mimetype)
 
-@app.route('/api/mirage')
-def mock_api():
-    # Chaos Mode
-    # Chaos Mode
-    if CHAOS_ENABLED and random.random() < 0.5:
-        return jsonify({"error": "🔥 CHAOS MODE: 500 Server Error Simulated"}), 500
-    
-    func = active_simulations.get('default')
-    if not func: return jsonify({"error": "Not Deployed"}), 404
-    
+    next_cursor = encode_cursor(batch["seed"], batch["offset"] + batch["count"], batch["count"])
+    headers = {"X-Mirage-Next-Cursor": next_cursor, "X-Mirage-Seed": batch["seed"]}
+    if batch["ndjson"]:
+        return Response(stream_records(mock, records, True), mimetype=mimetype, headers=headers)
+    payload = page_payload(batch, records, next_cursor)
+    started = time.perf_counter()
+    response = jsonify(payload)
+    SERIALIZE_SECONDS.observe((mock.name,), time.perf_counter() - started)
+    response.headers.update(headers)
+    return response
+
+def page_payload(batch, records, next_cursor):
+    return {
+        "data": list(records),
+        "page": batch["offset"] // batch["count"] + 1,
+        "page_size": batch["count"],
+        "offset": batch["offset"],
+        "seed": batch["seed"],
+        "next_cursor": next_cursor,
+    }
+
+# --- FIXTURE SERVING ---
+def fixture_body(mock, fixture, batch, index, seed, params):
+    """
+    (content_type, headers, chunks) for a request answered from a materialized fixture.
+    Chunks are slices of the mapping, so nothing is parsed or re-encoded; path
+    parameters are only echoed into single records. Without ?index= a request gets
+    a random record (a seeded one, for seeded requests).
+    """
+    if batch is None:
+        if index is None:
+            if not fixture.count:
+                raise FixtureIndexError("The fixture is empty")
+            rng = record_rng(mock.name, seed, 0, "fixture") if seed is not None else worker_rng()
+            index = rng.randrange(fixture.count)
+        if index >= fixture.count:
+            raise FixtureIndexError(f"Index {index} is beyond the fixture's {fixture.count} records")
+        body = fixture.record(index)
+        if params:
+            body = encode_record(apply_path_params(json.loads(body.tobytes()), params)).encode("utf-8")
+        return "application/json", {}, [body]
+
+    start, stop = batch["offset"], batch["offset"] + batch["count"]
+    if batch["kind"] == "stream":
+        if batch["ndjson"]:
+            return "application/x-ndjson", {}, [fixture.lines(start, stop)]
+        return "application/json", {}, [b"[", fixture.array_items(start, stop), b"]"]
+
+    next_cursor = encode_cursor(batch["seed"], stop, batch["count"])
+    headers = {"X-Mirage-Next-Cursor": next_cursor, "X-Mirage-Seed": batch["seed"]}
+    if batch["ndjson"]:
+        return "application/x-ndjson", headers, [fixture.lines(start, stop)]
+    # Same key order as page_payload(), with the records spliced in as raw bytes
+    tail = encode_record({k: v for k, v in page_payload(batch, (), next_cursor).items() if k != "data"})
+    return "application/json", headers, [b'{"data":[', fixture.array_items(start, stop), b"],", tail[1:].encode("utf-8")]
+
+# --- STATEFUL CRUD ---
+def serve_state(mock, method, params, args, body):
+    """
+    CRUD over a stateful mock's store. Returns (payload, status).
+    The collection route lists/filters (GET, ?field=value&offset=&limit=) and creates (POST);
+    the item route reads (GET), replaces or creates (PUT), merges (PATCH) and deletes (DELETE).
+    Other path parameters scope the collection like filters and are stamped onto new rows.
+    """
+    store = mock.store
+    params = params or {}
+    item_param = mock.item_param()
+    key = params.get(item_param)
+    scope = {k: v for k, v in params.items() if k != item_param and k in store.columns}
     try:
-        return jsonify(func())
+        if key is None:
+            if method == "GET":
+                filters = dict(scope)
+                filters.update((k, v) for k, v in args.items() if k not in STATE_QUERY_ARGS)
+                offset = _int_arg(args, 'offset', 0, 0, 10 ** 12)
+                limit = _int_arg(args, 'limit', DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+                total, rows = store.query(filters, offset, limit)
+                return {"data": rows, "total": total, "offset": offset, "limit": limit}, 200
+            if method == "POST":
+                if not isinstance(body, dict): return {"error": "Body must be a JSON object"}, 400
+                # Fields the client leaves out are filled in by the generator
+                row = apply_path_params(next(mock.generate(0, 1)), scope)
+                row.update(body)
+                return store.insert(row, assign_key=store.primary_key not in body), 201
+            return {"error": f"Method {method} not allowed on the collection"}, 405
+
+        if method == "GET":
+            row = store.get(key)
+            if row is None: return {"error": f"{store.primary_key} {key} not found"}, 404
+            return row, 200
+        if method == "DELETE":
+            if not store.delete(key): return {"error": f"{store.primary_key} {key} not found"}, 404
+            return {"success": True}, 200
+        if method not in ("PUT", "PATCH"):
+            return {"error": f"Method {method} not allowed on an item"}, 405
+        if not isinstance(body, dict): return {"error": "Body must be a JSON object"}, 400
+        if method == "PATCH":
+            row = store.update(key, body)
+            if row is None: return {"error": f"{store.primary_key} {key} not found"}, 404
+            return row, 200
+        row = apply_path_params(dict(body), scope)
+        row[store.primary_key] = store.coerce_key(key)
+        row, created = store.replace(key, row)
+        return row, 201 if created else 200
+    except StoreError as e:
+        return {"error": str(e)}, e.status
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+# --- CHAOS DELIVERY ---
+def roll_chaos(mock, seed, index):
+    """Decides this request's latency and fault, and counts what was injected."""
+    config = mock.effective_chaos()
+    if config is None:
+        return NO_CHAOS
+    chaos_rng = record_rng(mock.name, seed, index, "chaos") if seed is not None else worker_rng()
+    decision = config.decide(chaos_rng)
+    mock.chaos_stats.record(decision)
+    return decision
+
+def reset_connection():
+    """
+    Drops the connection mid-response. The response headers go out, then the body
+    raises; with SO_LINGER=0 on the dev server's socket the close is a TCP RST.
+    """
+    sock = request.environ.get("werkzeug.socket")
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        except OSError:
+            pass
+
+    def body():
+        yield b""
+        raise ConnectionResetError("🔥 CHAOS MODE: connection reset")
+    return Response(body(), mimetype="application/json")
+
+def chaos_response(fault):
+    """Responses for faults that replace the real body."""
+    kind = fault["type"]
+    if kind == "error":
+        status = int(fault["status"])
+        return jsonify({"error": fault["message"] or f"🔥 CHAOS MODE: {status} Server Error Simulated"}), status
+    if kind == "rate_limit":
+        return jsonify({"error": "🔥 CHAOS MODE: 429 Too Many Requests"}), 429, {"Retry-After": str(fault["retry_after"])}
+    if kind == "timeout":
+        time.sleep(float(fault["after_ms"]) / 1000.0)
+        return jsonify({"error": "🔥 CHAOS MODE: 504 Gateway Timeout"}), 504
+    return reset_connection()
+
+def mangle_body(response, fault):
+    """Applies truncate / slow_drip to a real response, streamed or not."""
+    streamed = response.is_streamed
+    chunks = response.response if streamed else [response.get_data()]
+    if fault["type"] == "truncate":
+        body = truncate_stream(chunks, fault) if streamed else truncate_body(chunks[0], fault)
+    else:
+        def body():
+            for piece, pause in drip(chunks, fault):
+                time.sleep(pause)
+                yield piece
+        body = body()
+    headers = [(k, v) for k, v in response.headers.items() if k.lower() != "content-length"]
+    return Response(body, status=response.status_code, headers=headers)
+
+def serve_mock(mock, params=None):
+    started = time.perf_counter()
+    try:
+        return respond_mock(mock, params)
+    finally:
+        REQUEST_SECONDS.observe((mock.name,), time.perf_counter() - started)
+
+def respond_mock(mock, params):
+    seed = request_seed(request.args, request.headers)
+    try:
+        index = _int_arg(request.args, 'index', 0, 0, 2 ** 63)
+        batch = parse_batch_args(request.args, seed)
+    except ValueError as e:
+        mock.stats.hit("rejected", 400)
+        return jsonify({"error": str(e)}), 400
+
+    # Chaos Mode (seeded requests replay the same chaos outcome too)
+    decision = roll_chaos(mock, seed, index)
+    if decision.delay:
+        # The sync server has to hold the thread; the ASGI entry point awaits instead
+        time.sleep(decision.delay)
+    fault = decision.fault
+    if fault is not None and fault["type"] in PRE_BODY_FAULTS:
+        mock.stats.hit("chaos", fault_status(fault))
+        return chaos_response(fault)
+
+    if mock.store is not None:
+        payload, status = serve_state(mock, request.method, params, request.args, request.get_json(silent=True))
+        encode_started = time.perf_counter()
+        response = jsonify(payload)
+        SERIALIZE_SECONDS.observe((mock.name,), time.perf_counter() - encode_started)
+        response.status_code = status
+        if fault is not None:
+            mock.stats.hit("chaos", status)
+            return mangle_body(response, fault)
+        mock.stats.hit("ok", status)
+        return response
+
+    try:
+        fixture, pool = mock.fixture, mock.pool
+        buf = pool.pop() if fixture is None and pool is not None and batch is None and seed is None and not params else None
+        if fixture is not None:
+            content_type, headers, chunks = fixture_body(mock, fixture, batch,
+                                                         index if 'index' in request.args else None, seed, params)
+            response = Response(chunks, mimetype=content_type, headers=headers)
+        elif buf is not None:
+            response = Response(buf, mimetype="application/json")
+        elif batch is not None:
+            response = serve_batch(mock, batch, params)
+        else:
+            record = apply_path_params(next(mock.generate(index, 1, seed)), params)
+            encode_started = time.perf_counter()
+            response = jsonify(record)
+            SERIALIZE_SECONDS.observe((mock.name,), time.perf_counter() - encode_started)
+            if seed is not None:
+                response.headers["X-Mirage-Seed"] = seed
+    except FixtureIndexError as e:
+        mock.stats.hit("rejected", 404)
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
+        mock.stats.hit("errors", 500)
         return jsonify({"error": f"Runtime Error: {str(e)}"}), 500
+    if fault is not None:
+        mock.stats.hit("chaos")
+        return mangle_body(response, fault)
+    mock.stats.hit("ok")
+    return response
+
+@app.route('/api/mirage')
+def mock_api():
+    mock = active_simulations.get('default')
+    if not mock: return jsonify({"error": "Not Deployed"}), 404
+    return serve_mock(mock)
+
+@app.route('/api/mirage/<path:subpath>', methods=list(MOCK_METHODS))
+def routed_mock_api(subpath):
+    mock, params = active_simulations.match(subpath)
+    if not mock: return jsonify({"error": "Not Deployed"}), 404
+    if request.method not in mock.allowed_methods():
+        return jsonify({"error": f"Method {request.method} not allowed"}), 405
+    return serve_mock(mock, params)
 
 if __name__ == "__main__":
+    if os.environ.get("MIRAGE_STATE_FILE"):
+        enable_shared_state(os.environ["MIRAGE_STATE_FILE"])
     app.run(host="0.0.0.0", port=5000)
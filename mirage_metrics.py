@@ -0,0 +1,304 @@
+"""
+Metrics and a sampling profiler for Project Mirage.
+
+Recording has to stay cheap at tens of thousands of requests per second, so
+nothing on the request path takes a lock. Every thread writes into its own
+shard (a plain dict it alone mutates), and only a scrape walks the shards and
+adds them up. A thread takes the registry lock once, the first time it records.
+Shards of threads that have exited are folded into a retired total, so the
+thread-per-request dev server does not pile them up.
+
+Histograms use fixed upper bounds (Prometheus `le` buckets), so observing a
+value is one bisect and two increments.
+
+The profiler is off until started. When running, a daemon thread snapshots
+every thread's stack with sys._current_frames() at a fixed interval and counts
+them, so a hot path can be found under real load without restarting the server
+or adding a tracer to every call.
+"""
+import os
+import sys
+import time
+import bisect
+import threading
+from collections import Counter
+
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+SHARD_PRUNE_AT = 64  # registered shards before exited threads are folded away
+PROFILE_MAX_DEPTH = 64
+PROFILE_MAX_STACKS = 20000  # distinct stacks kept; the rest are counted under "(other)"
+
+
+# --- PER-THREAD SHARDS ---
+class _Shard:
+    __slots__ = ("thread", "values")
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.values = {}
+
+
+def _merge(into, values):
+    for key, value in values.items():
+        if type(value) is list:
+            total = into.get(key)
+            if total is None:
+                into[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    total[i] += v
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+class ShardedCounts:
+    """
+    Counts (and histogram bucket lists) keyed by anything hashable, written
+    without locks into one dict per thread and summed by collect().
+    """
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+        self.retired = {}
+        self.prune_at = SHARD_PRUNE_AT
+
+    def values(self):
+        """The calling thread's own dict; only this thread ever writes to it."""
+        try:
+            return self.local.values
+        except AttributeError:
+            shard = _Shard(threading.current_thread())
+            with self.lock:
+                self.shards.append(shard)
+                if len(self.shards) >= self.prune_at:
+                    self._retire_exited()
+                    self.prune_at = max(SHARD_PRUNE_AT, 2 * len(self.shards))
+            self.local.values = shard.values
+            return shard.values
+
+    def add(self, key, amount=1):
+        values = self.values()
+        values[key] = values.get(key, 0) + amount
+
+    def _retire_exited(self):
+        # Caller holds self.lock. An exited thread can't write, so folding its shard is safe
+        live = []
+        for shard in self.shards:
+            if shard.thread.is_alive():
+                live.append(shard)
+            else:
+                _merge(self.retired, shard.values)
+        self.shards = live
+
+    def collect(self):
+        """Sum of every shard. Copies of dicts and lists are atomic under the GIL, so writers never wait."""
+        with self.lock:
+            self._retire_exited()
+            total = {}
+            _merge(total, self.retired)
+            for shard in self.shards:
+                _merge(total, dict(shard.values))
+        return total
+
+
+# --- METRIC FAMILIES ---
+class CounterFamily:
+    def __init__(self, counts, name):
+        self.counts = counts
+        self.name = name
+
+    def inc(self, labels=(), amount=1):
+        values = self.counts.values()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+
+class HistogramFamily:
+    """Observations in seconds. The bucket list is [per-bound counts..., +Inf count, sum]."""
+    def __init__(self, counts, name, buckets):
+        self.counts = counts
+        self.name = name
+        self.buckets = buckets
+
+    def _slot(self, labels):
+        values = self.counts.values()
+        key = (self.name, labels)
+        slot = values.get(key)
+        if slot is None:
+            slot = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        return slot
+
+    def observe(self, labels, value):
+        slot = self._slot(labels)
+        slot[bisect.bisect_left(self.buckets, value)] += 1
+        slot[-1] += value
+
+    def observe_many(self, labels, values):
+        if not values:
+            return
+        slot = self._slot(labels)
+        buckets = self.buckets
+        for value in values:
+            slot[bisect.bisect_left(buckets, value)] += 1
+        slot[-1] += sum(values)
+
+
+class Metrics:
+    """A set of declared counter and histogram families sharing one ShardedCounts."""
+    def __init__(self):
+        self.counts = ShardedCounts()
+        self.families = {}  # name -> (kind, help, label names, buckets)
+
+    def counter(self, name, help, labelnames=()):
+        self.families[name] = ("counter", help, tuple(labelnames), None)
+        return CounterFamily(self.counts, name)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        buckets = tuple(sorted(buckets))
+        self.families[name] = ("histogram", help, tuple(labelnames), buckets)
+        return HistogramFamily(self.counts, name, buckets)
+
+    def render(self, extra=()):
+        """
+        Prometheus text exposition of every family, followed by `extra`:
+        (name, kind, help, [(labels dict, value), ...]) tuples read at scrape time.
+        """
+        collected = {}
+        for (name, labels), value in self.counts.collect().items():
+            collected.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, (kind, help, labelnames, buckets) in self.families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(collected.get(name, ()), key=lambda item: tuple(map(str, item[0]))):
+                pairs = list(zip(labelnames, labels))
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                    continue
+                running = 0
+                for bound, count in zip(buckets + (float("inf"),), value):
+                    running += count
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', _number(bound))])} {running}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(pairs)} {running}")
+        for name, kind, help, samples in extra:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f"{name}{_labels(sorted(labels.items()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(round(value, 9))
+    return str(value)
+
+
+# --- SAMPLING PROFILER ---
+class SamplingProfiler:
+    """Counts every thread's call stack once per interval while running. Start and stop it at runtime."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.samples = 0
+        self.interval = None
+        self.started_at = None
+        self.sampled_seconds = 0.0
+        self.stop_event = None
+
+    def running(self):
+        return self.stop_event is not None
+
+    def start(self, interval_s, reset=True):
+        self.stop()
+        with self.lock:
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+                self.sampled_seconds = 0.0
+            self.interval = interval_s
+            self.started_at = time.monotonic()
+            self.stop_event = stop = threading.Event()
+        threading.Thread(target=self._run, args=(stop, interval_s), name="mirage-profiler", daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            stop, self.stop_event = self.stop_event, None
+            if stop is None:
+                return
+            self.sampled_seconds += time.monotonic() - self.started_at
+            self.started_at = None
+        stop.set()
+
+    def _run(self, stop, interval):
+        me = threading.get_ident()
+        names = {}
+        while not stop.wait(interval):
+            frames = sys._current_frames()
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            taken = []
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                taken.append(";".join(reversed(stack)))
+            del frames
+            with self.lock:
+                if self.stop_event is not stop:
+                    return
+                for key in taken:
+                    if key not in self.stacks and len(self.stacks) >= PROFILE_MAX_STACKS:
+                        key = "(other)"
+                    self.stacks[key] += 1
+                self.samples += 1
+
+    def folded(self):
+        """Collapsed stacks ("thread;outer;...;inner count" per line), the input flamegraph tools take."""
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def snapshot(self, top=20):
+        """The functions seen most often on top of a stack (self) and anywhere in it (total)."""
+        with self.lock:
+            stacks = list(self.stacks.items())
+            seconds = self.sampled_seconds + (time.monotonic() - self.started_at if self.started_at else 0.0)
+            status = {"running": self.running(), "samples": self.samples, "seconds": round(seconds, 3),
+                      "interval_ms": round(self.interval * 1000, 3) if self.interval else None}
+        own, total = Counter(), Counter()
+        for stack, count in stacks:
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        status["top_self"] = [{"function": f, "samples": n} for f, n in own.most_common(top)]
+        status["top_total"] = [{"function": f, "samples": n} for f, n in total.most_common(top)]
+        return status
@@ -0,0 +1,263 @@
+"""
+Record-and-replay for Project Mirage.
+
+In proxy mode Mirage forwards requests to a real upstream API and records
+every exchange into one append-only log per recording:
+
+    header | entry | entry | ...
+    entry  = (body length, metadata length, status) | metadata JSON | body
+
+The request path never touches the file. It hands the exchange to a bounded
+queue and returns; one writer thread drains whatever has queued up, appends it
+with a single write, and only then adds the new entries to the replay index.
+When the queue is full an exchange is dropped and counted rather than making
+the proxied request wait.
+
+Replay answers from that index: (method, path) maps to the offsets of every
+body recorded for it, and a body is a slice of an mmap of the log, so nothing
+is parsed or copied. Reopening a log rebuilds the index with one scan, and a
+torn entry at the end (a crash mid-write) is cut off.
+
+learned_mocks() groups the recorded JSON responses by route, with ID-like path
+segments folded into {id} parameters, ready to be deployed with one merged,
+distribution-fitted plan per route (see plan_from_samples in mirage_compiler).
+"""
+import os
+import re
+import json
+import mmap
+import time
+import queue
+import random
+import struct
+import threading
+import itertools
+from collections import OrderedDict
+
+from mirage_batch import mock_name
+
+MAGIC = b"MIRAGERL"
+VERSION = 1
+HEADER = struct.Struct("<8sI")   # magic, version
+ENTRY = struct.Struct("<IIH")    # body length, metadata length, status
+WRITE_BATCH = 512                # exchanges appended per write at most
+ID_SEGMENT_RE = re.compile(
+    r'^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
+    r'|[0-9a-fA-F]{16,}|[A-Za-z][A-Za-z0-9]*[_\-:](?=[0-9A-Za-z]*\d)[0-9A-Za-z]+)$'
+)
+JSON_TYPE_RE = re.compile(r"^application/(.+\+)?json")
+
+
+class ReplayEntry:
+    __slots__ = ("offset", "length", "status", "content_type")
+
+    def __init__(self, offset, length, status, content_type):
+        self.offset = offset
+        self.length = length
+        self.status = status
+        self.content_type = content_type
+
+
+# --- LOG ---
+class RecordLog:
+    """
+    An append-only exchange log at `path` plus its in-memory replay index.
+    One thread appends (the Recorder's writer); any number of threads look up and read.
+    Raises ValueError for a file that isn't a record log.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.index = {}    # (method, path) -> [ReplayEntry, ...]
+        self.cursors = {}  # (method, path) -> itertools.count, for round-robin replay
+        self.count = 0
+        self.map_lock = threading.Lock()
+        self.mm = None
+        self.view = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION))
+        self.file = open(path, "r+b")
+        magic, version = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            self.file.close()
+            raise ValueError(f"{path} is not a Mirage record log")
+        self.end = self._scan()
+        self.file.seek(self.end)
+        self.file.truncate()
+
+    def _scan(self):
+        size = os.fstat(self.file.fileno()).st_size
+        pos = HEADER.size
+        self.file.seek(pos)
+        while True:
+            head = self.file.read(ENTRY.size)
+            if len(head) < ENTRY.size:
+                return pos
+            body_len, meta_len, status = ENTRY.unpack(head)
+            meta_bytes = self.file.read(meta_len)
+            if len(meta_bytes) < meta_len:
+                return pos
+            try:
+                meta = json.loads(meta_bytes)
+            except ValueError:
+                return pos
+            body_at = pos + ENTRY.size + meta_len
+            if self.file.seek(body_len, os.SEEK_CUR) > size:
+                return pos
+            self._index(meta, ReplayEntry(body_at, body_len, status, meta.get("ct")))
+            pos = body_at + body_len
+
+    def _index(self, meta, entry):
+        key = (meta["m"], meta["p"])
+        entries = self.index.get(key)
+        if entries is None:
+            entries = self.index[key] = []
+            self.cursors[key] = itertools.count()
+        entries.append(entry)
+        self.count += 1
+
+    def append(self, exchanges):
+        """
+        Writes (method, path, query, status, content_type, body, latency_ms) tuples with
+        one write, then indexes them. Only the Recorder's writer thread calls this.
+        """
+        chunks, pending, pos = [], [], self.end
+        for method, path, query, status, content_type, body, latency_ms in exchanges:
+            meta = {"m": method, "p": path, "q": query, "ct": content_type, "t": round(time.time(), 3), "ms": latency_ms}
+            meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+            chunks += [ENTRY.pack(len(body), len(meta_bytes), status), meta_bytes, body]
+            body_at = pos + ENTRY.size + len(meta_bytes)
+            pending.append((meta, ReplayEntry(body_at, len(body), status, content_type)))
+            pos = body_at + len(body)
+        self.file.write(b"".join(chunks))
+        self.file.flush()
+        self.end = pos
+        # Readers only see an entry once its bytes are in the file
+        for meta, entry in pending:
+            self._index(meta, entry)
+
+    def lookup(self, method, path):
+        """The next recorded entry for (method, path), round-robin, or None."""
+        key = (method, path)
+        entries = self.index.get(key)
+        if not entries:
+            return None
+        return entries[next(self.cursors[key]) % len(entries)]
+
+    def body(self, entry):
+        """A recorded body as a zero-copy memoryview of the log."""
+        end = entry.offset + entry.length
+        view = self.view
+        if view is None or end > len(view):
+            with self.map_lock:
+                if self.view is None or end > len(self.view):
+                    # Views handed out earlier keep the old mapping alive until they are released
+                    self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.view = memoryview(self.mm)
+                view = self.view
+        return view[entry.offset:end]
+
+    def entries(self):
+        """((method, path), ReplayEntry) for everything recorded so far, in recording order per route."""
+        for key, entries in list(self.index.items()):
+            for entry in list(entries):
+                yield key, entry
+
+    def close(self):
+        self.file.close()
+
+    def describe(self):
+        return {"path": self.path, "entries": self.count, "routes": len(self.index), "bytes": self.end}
+
+
+# --- RECORDER ---
+class Recorder:
+    """Appends exchanges to a RecordLog from a background thread, so recording never blocks a request."""
+    def __init__(self, log, queue_size):
+        self.log = log
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.recorded = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name="mirage-recorder", daemon=True)
+        self.thread.start()
+
+    def record(self, method, path, query, status, content_type, body, latency_ms):
+        try:
+            self.queue.put_nowait((method, path, query, status, content_type, bytes(body), latency_ms))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < WRITE_BATCH:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self.log.append(batch)
+                self.recorded += len(batch)
+            except OSError as e:
+                self.errors += len(batch)
+                print(f"RECORDER ERROR ({self.log.path}): {e}")
+            if stop:
+                return
+
+    def stop(self, timeout=5.0):
+        """Flushes what is queued and stops the writer."""
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def stats(self):
+        return {"recorded": self.recorded, "dropped": self.dropped, "errors": self.errors, "queued": self.queue.qsize()}
+
+
+# --- LEARNING ---
+def route_template(path):
+    """/users/42/orders/ord_9f3a -> /users/{id}/orders/{id2}: ID-like segments become parameters."""
+    segments, ids = [], 0
+    for segment in path.strip("/").split("/"):
+        if segment and ID_SEGMENT_RE.match(segment):
+            ids += 1
+            segment = "{id}" if ids == 1 else f"{{id{ids}}}"
+        segments.append(segment)
+    return "/" + "/".join(s for s in segments if s)
+
+
+def learned_mocks(log, max_samples, seed=0):
+    """
+    One /deploy body per recorded route with 2xx JSON responses: {"name", "route",
+    "methods", "samples"}, sampled from GET's responses when the route has any.
+    Routes with more than `max_samples` responses contribute an evenly random subset.
+    """
+    routes = OrderedDict()  # template -> {method: [entries]}
+    for (method, path), entry in log.entries():
+        if 200 <= entry.status < 300 and entry.length and JSON_TYPE_RE.match(entry.content_type or ""):
+            routes.setdefault(route_template(path), OrderedDict()).setdefault(method, []).append(entry)
+    mocks = []
+    rng = random.Random(seed)
+    for route, by_method in routes.items():
+        entries = by_method.get("GET") or next(iter(by_method.values()))
+        if len(entries) > max_samples:
+            entries = rng.sample(entries, max_samples)
+        samples = []
+        for entry in entries:
+            try:
+                samples.append(json.loads(bytes(log.body(entry))))
+            except ValueError:
+                continue
+        if samples:
+            mocks.append({"name": mock_name(route.replace("{", "by_").replace("}", "")), "route": route,
+                          "methods": list(by_method), "samples": samples})
+    return mocks
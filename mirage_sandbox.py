@@ -0,0 +1,284 @@
+"""
+Sandboxed generator execution for Project Mirage.
+
+Generated code runs in a pool of pre-started worker processes instead of the
+server process, so a runaway loop or a huge allocation costs one worker, not
+the whole server. Each worker caps its own address space, arms a CPU timer
+around every generator call, and the parent enforces a wall-clock deadline,
+killing and replacing a worker that misses it. Calls are batched: one pipe
+round trip carries many records. The deadline is still per call, not per
+batch: the worker stamps the start of each call into shared memory, and the
+parent checks that stamp while it waits. Workers only import the standard library and
+mirage_compiler, so they start cleanly under forkserver or spawn.
+"""
+import os
+import time
+import queue
+import random
+import signal
+import hashlib
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+
+from mirage_compiler import load_generator, record_rng
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, the wall-clock deadline still applies
+    resource = None
+
+DEFAULT_WALL_TIMEOUT = 2.0   # seconds per generator call
+DEFAULT_CPU_SECONDS = 1.0    # CPU seconds per generator call
+DEFAULT_MEMORY_MB = 256      # extra address space a worker may grow by
+WORKER_START_TIMEOUT = 60.0  # spawn/forkserver children re-import __main__ before they are ready
+DEADLINE_CHECK_S = 0.05      # how often a waiting parent looks at the current call's start time
+
+
+class SandboxError(Exception):
+    """A sandboxed generator raised, timed out, or took its worker down."""
+
+
+class _CPUTimeExceeded(BaseException):
+    # BaseException so generated code's own `except Exception` cannot swallow it
+    pass
+
+
+def _on_cpu_timer(signum, frame):
+    raise _CPUTimeExceeded()
+
+
+def _apply_memory_cap(memory_mb):
+    if resource is None or not memory_mb:
+        return
+    try:
+        with open("/proc/self/statm") as f:
+            baseline = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    limit = baseline + memory_mb * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError):
+        pass
+
+
+def _worker_main(conn, call_started, cpu_seconds, memory_mb):
+    """
+    Worker loop. Messages are ("run", key, source_or_None, mock_name, seed, offset, count);
+    replies are ("ok", records, durations) or ("error", message). `call_started` is a shared
+    double the worker sets to time.monotonic() as each generator call begins.
+    """
+    _apply_memory_cap(memory_mb)
+    cpu_timer = hasattr(signal, "setitimer") and cpu_seconds
+    if cpu_timer:
+        signal.signal(signal.SIGPROF, _on_cpu_timer)
+    funcs = {}
+    local_rng = random.Random()
+    conn.send(("ready",))
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        if msg[0] == "stop":
+            return
+        _, key, source, mock_name, seed, offset, count = msg
+        try:
+            func = funcs.get(key)
+            if func is None:
+                func = funcs[key] = load_generator(source)
+            records, durations = [], []
+            for i in range(offset, offset + count):
+                rng = local_rng if seed is None else record_rng(mock_name, seed, i)
+                call_started.value = time.monotonic()
+                if cpu_timer:
+                    signal.setitimer(signal.ITIMER_PROF, cpu_seconds)
+                started = time.perf_counter()
+                try:
+                    records.append(func(rng))
+                finally:
+                    if cpu_timer:
+                        signal.setitimer(signal.ITIMER_PROF, 0)
+                durations.append(time.perf_counter() - started)
+            conn.send(("ok", records, durations))
+        except _CPUTimeExceeded:
+            conn.send(("error", f"CPU limit of {cpu_seconds}s exceeded"))
+        except MemoryError:
+            funcs.pop(key, None)
+            conn.send(("error", f"Memory limit of {memory_mb} MB exceeded"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+        except BaseException:
+            traceback.print_exc()
+            return
+
+
+class _Worker:
+    def __init__(self, ctx, cpu_seconds, memory_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.call_started = ctx.RawValue("d", 0.0)  # monotonic start of the call in progress
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, self.call_started, cpu_seconds, memory_mb),
+            daemon=True, name="mirage-sandbox"
+        )
+        self.process.start()
+        child_conn.close()
+        self.loaded = set()
+
+    def wait_reply(self, wall_timeout):
+        """
+        Waits for a batch reply. False as soon as one call has run longer than `wall_timeout`,
+        however many calls the batch holds; the caller then kills the worker.
+        """
+        while not self.conn.poll(DEADLINE_CHECK_S):
+            if time.monotonic() - self.call_started.value > wall_timeout:
+                return False
+        return True
+
+    def wait_ready(self):
+        try:
+            ready = self.conn.poll(WORKER_START_TIMEOUT) and self.conn.recv()[0] == "ready"
+        except (EOFError, OSError):
+            ready = False
+        if not ready:
+            self.kill()
+            raise SandboxError("Sandbox worker failed to start")
+        return self
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=1)
+        except Exception:
+            pass
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Fixed-size pool of generator worker processes, started on first use.
+    run() borrows an idle worker, ships the generator source the first time that
+    worker sees it, and returns (records, per-call durations) for a whole batch.
+    """
+    def __init__(self, workers=None, wall_timeout=DEFAULT_WALL_TIMEOUT,
+                 cpu_seconds=DEFAULT_CPU_SECONDS, memory_mb=DEFAULT_MEMORY_MB):
+        self.size = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.wall_timeout = wall_timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        methods = multiprocessing.get_all_start_methods()
+        self.ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods:
+            # Keep the app's __main__ (Flask, Gemini client) out of the fork server
+            self.ctx.set_forkserver_preload(["mirage_sandbox"])
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = False
+        self.restarts = 0
+
+    def _spawn(self):
+        return _Worker(self.ctx, self.cpu_seconds, self.memory_mb).wait_ready()
+
+    def _respawn(self):
+        """Replaces a killed worker off the request path; callers wait on the idle queue meanwhile."""
+        def replace():
+            try:
+                self.idle.put(self._spawn())
+            except SandboxError as e:
+                print(f"SANDBOX RESPAWN FAILED: {e}")
+        threading.Thread(target=replace, name="mirage-sandbox-respawn", daemon=True).start()
+
+    def start(self):
+        """Starts every worker and waits until each has reported ready."""
+        with self.lock:
+            if self.started:
+                return
+            workers = [_Worker(self.ctx, self.cpu_seconds, self.memory_mb) for _ in range(self.size)]
+            for worker in workers:
+                self.idle.put(worker.wait_ready())
+            self.started = True
+
+    def shutdown(self):
+        with self.lock:
+            while True:
+                try:
+                    worker = self.idle.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    worker.conn.send(("stop",))
+                except OSError:
+                    pass
+                worker.kill()
+            self.started = False
+
+    def run(self, source, mock_name, offset, count, seed=None):
+        if not self.started:
+            self.start()
+        key = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        worker = self.idle.get()
+        healthy = False
+        try:
+            # Compiling the source counts against the first call's deadline
+            worker.call_started.value = time.monotonic()
+            worker.conn.send(("run", key, None if key in worker.loaded else source, mock_name, seed, offset, count))
+            worker.loaded.add(key)
+            if not worker.wait_reply(self.wall_timeout):
+                raise SandboxError(f"Wall-clock limit of {self.wall_timeout}s per call exceeded")
+            reply = worker.conn.recv()
+            if reply[0] == "error":
+                # The worker may have dropped the function (compile failure, MemoryError); resend next time
+                worker.loaded.discard(key)
+            healthy = True
+        except (EOFError, OSError):
+            raise SandboxError("Sandbox worker died (memory limit or crash)")
+        finally:
+            if healthy:
+                self.idle.put(worker)
+            else:
+                worker.kill()
+                with self.lock:
+                    self.restarts += 1
+                self._respawn()
+        if reply[0] == "error":
+            raise SandboxError(reply[1])
+        return reply[1], reply[2]
+
+    def stats(self):
+        return {
+            "workers": self.size,
+            "started": self.started,
+            "idle": self.idle.qsize(),
+            "restarts": self.restarts,
+            "wall_timeout_s": self.wall_timeout,
+            "cpu_seconds": self.cpu_seconds,
+            "memory_mb": self.memory_mb,
+        }
+
+
+class ExecTimer:
+    """Rolling window of per-call generator execution times, for p50/p99 reporting."""
+    def __init__(self, window=2048):
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=window)
+        self.calls = 0
+
+    def record_many(self, durations):
+        if not durations:
+            return
+        with self.lock:
+            self.samples.extend(durations)
+            self.calls += len(durations)
+
+    def snapshot(self):
+        with self.lock:
+            ordered = sorted(self.samples)
+            calls = self.calls
+        if not ordered:
+            return {"calls": calls, "p50_ms": None, "p99_ms": None, "max_ms": None}
+
+        def pct(q):
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 4)
+        return {"calls": calls, "p50_ms": pct(0.50), "p99_ms": pct(0.99), "max_ms": round(ordered[-1] * 1000, 4)}
@@ -0,0 +1,201 @@
+"""
+Shared registry state for multi-process Project Mirage deployments.
+
+Every worker process keeps its own compiled mocks, but the *specs* they are
+built from (plan, route, methods, chaos, pool settings) live in one JSON
+snapshot file. A worker that changes something rewrites the snapshot under an
+exclusive file lock and bumps its generation; the others notice the new file
+(a cheap stat() from a watcher thread) and rebuild only the mocks whose spec
+changed. Writes go to a temp file and os.replace(), so readers never see a
+half-written snapshot.
+
+The snapshot also keeps the last few specs of every mock by version, so a
+rollback can be applied in a worker that never compiled that version. Where
+Unix sockets exist, a writer pings every other worker right after a write
+(see ChangeNotifier), so a deploy lands everywhere within milliseconds; the
+stat() poll stays as the fallback.
+"""
+import os
+import json
+import errno
+import select
+import socket
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer deployments only
+    fcntl = None
+
+STATE_POLL_INTERVAL = 0.25  # seconds between stat() calls in each worker
+NOTIFY_SUFFIX = ".notify"   # directory next to the snapshot holding one socket per worker
+
+
+def empty_state():
+    return {"generation": 0, "chaos": None, "mocks": {}, "versions": {}, "latest": {}}
+
+
+class StateFile:
+    """Atomic, lock-protected JSON snapshot at `path`."""
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.thread_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        with self.thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return empty_state()
+        except ValueError:
+            # Only possible if someone edited the file by hand; start over rather than crash every worker
+            return empty_state()
+
+    def update(self, mutate):
+        """
+        Runs mutate(state) under the exclusive lock, bumps the generation and writes atomically.
+        Returns (state, token): the token is taken before the lock is released, so it is this
+        write's and never a later writer's.
+        """
+        with self._exclusive():
+            state = self.read()
+            mutate(state)
+            state["generation"] = state.get("generation", 0) + 1
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+            return state, self.token()
+
+    def token(self):
+        """Changes whenever the snapshot file is replaced."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class ChangeNotifier:
+    """
+    Wakes the other workers as soon as the snapshot changes instead of at their next poll.
+    Each process binds a Unix datagram socket in <snapshot>.notify/, and a writer sends one
+    byte to every other socket there. Sockets left by dead processes are removed. A lost
+    datagram only costs one poll interval.
+    """
+    def __init__(self, state_path):
+        self.dir = state_path + NOTIFY_SUFFIX
+        os.makedirs(self.dir, exist_ok=True)
+        self.path = os.path.join(self.dir, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
+
+    def wait(self, timeout):
+        """True if a change was announced within `timeout` seconds."""
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while self.sock.recv(64):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def notify(self):
+        for entry in os.listdir(self.dir):
+            path = os.path.join(self.dir, entry)
+            if path == self.path or not entry.endswith(".sock"):
+                continue
+            try:
+                self.sender.sendto(b"!", path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                # A full buffer means that worker already has a wake-up pending
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    print(f"STATE NOTIFY ERROR ({entry}): {e}")
+
+    def close(self):
+        self.sock.close()
+        self.sender.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def change_notifier(state_path):
+    """A ChangeNotifier for the snapshot at `state_path`, or None where Unix sockets aren't available."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    try:
+        return ChangeNotifier(state_path)
+    except OSError as e:
+        print(f"STATE NOTIFY: falling back to polling ({e})")
+        return None
+
+
+class StateWatcher:
+    """
+    Daemon thread that calls on_change(state) whenever the snapshot file is replaced:
+    at once when a ChangeNotifier announces it, otherwise at the next poll.
+    """
+    def __init__(self, state_file, on_change, interval=STATE_POLL_INTERVAL, notifier=None):
+        self.state_file = state_file
+        self.on_change = on_change
+        self.interval = interval
+        self.notifier = notifier
+        self.stopped = threading.Event()
+        self.last_token = None
+        self.thread = threading.Thread(target=self._loop, name="mirage-state-watcher", daemon=True)
+
+    def start(self):
+        self.check()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def check(self):
+        token = self.state_file.token()
+        if token is not None and token != self.last_token:
+            self.last_token = token
+            self.on_change(self.state_file.read())
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            if self.notifier is not None:
+                self.notifier.wait(self.interval)
+            else:
+                self.stopped.wait(self.interval)
+            if self.stopped.is_set():
+                return
+            try:
+                self.check()
+            except Exception as e:
+                print(f"STATE SYNC ERROR: {e}")
@@ -0,0 +1,609 @@
+"""
+Stateful CRUD storage for Project Mirage.
+
+A stateful mock keeps its rows in a ColumnStore instead of inventing a fresh
+object per call. Rows live column-wise: plain ints, floats and bools sit in
+typed arrays (8 bytes a value, no Python object each), enum fields are
+2-byte codes into a small value table, nested objects and arrays are kept as
+marshalled bytes (the process never shares them), and only free-form strings stay Python objects. A row is a
+slot number across the columns; there is no dict per row until one is read.
+
+The primary key maps straight to a slot (O(1) lookups), and each declared
+secondary field keeps value -> sorted array of slots, so an equality filter
+pages by slicing it and several filters are intersected by walking the
+shortest and bisecting the others. Filters on undeclared fields fall back to
+a column scan.
+A column that receives a value its typed storage cannot hold (a string in an
+int column, a null in an enum) is converted to a plain list once and carries on.
+"""
+import json
+import heapq
+import bisect
+import marshal
+import threading
+from array import array
+from collections import OrderedDict
+
+MISSING = object()  # an optional field the row does not have
+
+QUERY_CACHE_ENTRIES = 32  # filtered match lists kept between writes, so later pages are slices
+GALLOP_RATIO = 8          # bisect into the other postings when the shortest is this many times smaller
+ENUM_LIMIT = 65535  # codes are array('H'); more distinct values than this demotes the column to a list
+ID_STEMS = ("_id", "Id", "ID")
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+class StoreError(Exception):
+    """A request the store cannot satisfy; `status` is the HTTP status to answer with."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def infer_primary_key(plan, name=None, route=None):
+    """
+    Picks the primary key among the top-level fields: the route's trailing {param}
+    if it names a field, then `id`, then an *_id field matching the mock name
+    (product_id for "products"), then any *_id field, then the first UUID field.
+    """
+    fields = plan.get("fields", {}) if plan.get("type") == "object" else {}
+    segments = [seg for seg in (route or "").split("/") if seg]
+    if segments and segments[-1].startswith("{") and segments[-1][1:-1] in fields:
+        return segments[-1][1:-1]
+    if "id" in fields:
+        return "id"
+    id_fields = [k for k in fields if k.endswith(ID_STEMS)]
+    stem = (name or "").lower().rstrip("s")
+    for key in id_fields:
+        if stem and key.lower().startswith(stem):
+            return key
+    if id_fields:
+        return id_fields[0]
+    for key, child in fields.items():
+        if child.get("type") == "uuid":
+            return key
+    return None
+
+
+# --- COLUMNS ---
+class _Demote(Exception):
+    pass
+
+
+class _Packed(bytes):
+    """A marshalled nested object or array; marshal packs and unpacks several times faster than json."""
+    __slots__ = ()
+
+
+class _ListColumn:
+    """Python objects, one list slot per row. Nested containers are stored packed."""
+    kind = "list"
+
+    def __init__(self, values=(), encoded=False):
+        self.encoded = encoded
+        self.values = list(values)
+
+    def _pack(self, value):
+        if self.encoded and isinstance(value, (dict, list)):
+            return _Packed(marshal.dumps(value))
+        return value
+
+    def get(self, slot):
+        value = self.values[slot]
+        return marshal.loads(value) if type(value) is _Packed else value
+
+    def raw(self, slot):
+        return self.values[slot]
+
+    def set(self, slot, value):
+        self.values[slot] = self._pack(value)
+
+    def extend(self, values):
+        if self.encoded:
+            values = (self._pack(v) for v in values)
+        self.values.extend(values)
+
+    def append(self, value):
+        self.values.append(self._pack(value))
+
+    def items(self):
+        return self.values
+
+    def nbytes(self):
+        return 8 * len(self.values)
+
+
+class _TypedColumn:
+    """array-backed int / float / bool column; anything else raises _Demote."""
+    def __init__(self, typecode, pytype):
+        self.kind = {"q": "int", "d": "float", "b": "bool"}[typecode]
+        self.values = array(typecode)
+        self.pytype = pytype
+
+    def _check(self, value):
+        if type(value) is not self.pytype:
+            raise _Demote()
+        return value
+
+    def get(self, slot):
+        value = self.values[slot]
+        return bool(value) if self.pytype is bool else value
+
+    raw = get
+
+    def set(self, slot, value):
+        try:
+            self.values[slot] = self._check(value)
+        except OverflowError:
+            raise _Demote()
+
+    def extend(self, values):
+        try:
+            self.values.extend(self._check(v) for v in values)
+        except OverflowError:
+            raise _Demote()
+
+    def append(self, value):
+        self.extend((value,))
+
+    def items(self):
+        return [bool(v) for v in self.values] if self.pytype is bool else self.values.tolist()
+
+    def nbytes(self):
+        return self.values.itemsize * len(self.values)
+
+
+class _EnumColumn:
+    """Strings from a small vocabulary stored as 2-byte codes into a value table."""
+    kind = "enum"
+
+    def __init__(self, values=()):
+        self.table = []
+        self.codes = {}
+        self.values = array("H")
+        for value in values:
+            self._code(value)
+
+    def _code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            if type(value) is not str or len(self.table) >= ENUM_LIMIT:
+                raise _Demote()
+            code = self.codes[value] = len(self.table)
+            self.table.append(value)
+        return code
+
+    def get(self, slot):
+        return self.table[self.values[slot]]
+
+    raw = get
+
+    def set(self, slot, value):
+        self.values[slot] = self._code(value)
+
+    def extend(self, values):
+        codes = self.codes
+        self.values.extend(codes[v] if v in codes else self._code(v) for v in values)
+
+    def append(self, value):
+        self.values.append(self._code(value))
+
+    def items(self):
+        table = self.table
+        return [table[c] for c in self.values]
+
+    def nbytes(self):
+        return 2 * len(self.values)
+
+
+def _column_for(plan):
+    """Typed storage for fields that are always present and never null; a list otherwise."""
+    kind = plan.get("type")
+    if plan.get("optional") or plan.get("nullable") or "expr" in plan:
+        return _ListColumn(encoded=kind in ("object", "array", "subset") or "expr" in plan)
+    if kind == "int":
+        return _TypedColumn("q", int)
+    if kind == "float":
+        return _TypedColumn("d", float)
+    if kind == "bool":
+        return _TypedColumn("b", bool)
+    if kind == "choice" and all(isinstance(v, str) for v in plan.get("values", ())):
+        return _EnumColumn(plan["values"])
+    return _ListColumn(encoded=kind in ("object", "array", "subset"))
+
+
+# --- STORE ---
+def _intersect(postings):
+    """
+    Slots in every sorted posting, in order. A short first posting walks itself and bisects
+    the others; postings of similar size are intersected as sets, which is faster in C.
+    """
+    first, rest = postings[0], postings[1:]
+    if not rest:
+        return first
+    if len(first) * GALLOP_RATIO >= sum(len(other) for other in rest):
+        return sorted(set(first).intersection(*rest))
+    found, starts = [], [0] * len(rest)
+    for slot in first:
+        for i, other in enumerate(rest):
+            j = starts[i] = bisect.bisect_left(other, slot, starts[i])
+            if j == len(other) or other[j] != slot:
+                break
+        else:
+            found.append(slot)
+    return found
+
+
+class ColumnStore:
+    """
+    Rows of one mock, column-wise, indexed by primary key and by any declared secondary fields.
+    All methods are thread-safe; rows come back as fresh dicts.
+    """
+    def __init__(self, plan, primary_key, indexes=()):
+        if plan.get("type") != "object":
+            raise ValueError("Stateful mocks need an object sample")
+        if primary_key not in plan["fields"]:
+            raise ValueError(f"Primary key '{primary_key}' is not a top-level field")
+        unknown = [f for f in indexes if f not in plan["fields"]]
+        if unknown:
+            raise ValueError(f"Cannot index unknown fields: {', '.join(unknown)}")
+        self.fields = list(plan["fields"])
+        self.columns = {f: _column_for(plan["fields"][f]) for f in self.fields}
+        self.primary_key = primary_key
+        self.pk_index = {}
+        self.indexes = {f: {} for f in indexes if f != primary_key}
+        self.alive = bytearray()
+        self.free = []
+        self.extra = {}  # slot -> fields a client sent that the plan doesn't have
+        self.next_int = 1
+        self.suffixes = {}  # next -N suffix to try per colliding string key
+        self.query_cache = OrderedDict()  # filters -> matching slots, until the next write
+        self.lock = threading.RLock()
+
+    # Column plumbing
+    def _demote(self, field):
+        column = self.columns[field]
+        encoded = getattr(column, "encoded", False)
+        self.columns[field] = _ListColumn(column.items(), encoded=encoded)
+
+    def _write(self, field, slot, value):
+        try:
+            self.columns[field].set(slot, value)
+        except _Demote:
+            self._demote(field)
+            self.columns[field].set(slot, value)
+
+    def _append(self, field, value):
+        try:
+            self.columns[field].append(value)
+        except _Demote:
+            self._demote(field)
+            self.columns[field].append(value)
+
+    # Index plumbing
+    def _index_add(self, slot, field, value):
+        if value is MISSING:
+            return
+        slots = self.indexes[field].get(value)
+        if slots is None:
+            slots = self.indexes[field][value] = array("q")
+        if not slots or slot > slots[-1]:
+            slots.append(slot)
+        else:
+            # A reused free slot or a rewritten row lands in the middle
+            bisect.insort(slots, slot)
+
+    def _index_remove(self, slot, field, value):
+        slots = self.indexes[field].get(value)
+        if slots is not None:
+            i = bisect.bisect_left(slots, slot)
+            if i < len(slots) and slots[i] == slot:
+                del slots[i]
+            if not slots:
+                del self.indexes[field][value]
+
+    def _posting(self, field, text):
+        """Sorted slots whose indexed `field` matches query text ("5" may match both "5" and 5)."""
+        found = []
+        for value in self.key_candidates(text):
+            slots = self.indexes[field].get(value)
+            if slots is not None and not any(slots is f for f in found):
+                found.append(slots)
+        if not found:
+            return ()
+        return found[0] if len(found) == 1 else list(heapq.merge(*found))
+
+    def _live_slots(self, offset, limit):
+        """Slots of the live rows offset..offset+limit, skipping the free ones without a scan."""
+        dead = sorted(self.free)
+        slot, i = offset, 0
+        while i < len(dead) and dead[i] <= slot:
+            slot += 1
+            i += 1
+        page = []
+        while len(page) < limit and slot < len(self.alive):
+            if i < len(dead) and dead[i] == slot:
+                i += 1
+            else:
+                page.append(slot)
+            slot += 1
+        return page
+
+    def _keyed(self, value):
+        # Indexes key containers by their JSON text, which is what a query string can carry
+        if type(value) is _Packed:
+            value = marshal.loads(value)
+        return _encode(value) if isinstance(value, (dict, list)) else value
+
+    def key_candidates(self, text):
+        """Typed values a path or query-string value could stand for: "5" may be the int 5."""
+        candidates = [text]
+        for convert in (int, float):
+            try:
+                candidates.append(convert(text))
+            except ValueError:
+                pass
+        if text in ("true", "false"):
+            candidates.append(text == "true")
+        elif text == "null":
+            candidates.append(None)
+        return candidates
+
+    def coerce_key(self, text):
+        """A primary key from a URL, typed like the key column (the int 42 for "/users/42")."""
+        kind = self.columns[self.primary_key].kind
+        for candidate in self.key_candidates(text):
+            if kind == "int" and type(candidate) is int or kind == "float" and type(candidate) is float:
+                return candidate
+        return text
+
+    def _slot_for(self, key):
+        if not isinstance(key, str):
+            return self.pk_index.get(key)
+        for candidate in self.key_candidates(key):
+            slot = self.pk_index.get(candidate)
+            if slot is not None:
+                return slot
+        return None
+
+    def _row(self, slot):
+        row = {}
+        for field in self.fields:
+            value = self.columns[field].get(slot)
+            if value is not MISSING:
+                row[field] = value
+        extra = self.extra.get(slot)
+        if extra:
+            row.update(extra)
+        return row
+
+    def _check_key(self, key):
+        # Keys are dict keys in pk_index and path segments in URLs, so containers can't be keys
+        if isinstance(key, (dict, list)):
+            raise StoreError(f"{self.primary_key} must be a string, number or boolean")
+
+    def _fresh_key(self, value, pending=()):
+        """A primary key that is neither stored nor in `pending`: the next int id, or `value` with a -N suffix."""
+        if isinstance(value, int) and not isinstance(value, bool):
+            return self.next_int
+        base, n = value, self.suffixes.get(value, 1)
+        while value in self.pk_index or value in pending:
+            value = f"{base}-{n}"
+            n += 1
+        self.suffixes[base] = n
+        return value
+
+    def _store(self, slot, row):
+        self.query_cache.clear()
+        for field in self.fields:
+            value = row.get(field, MISSING)
+            if slot == len(self.alive):
+                self._append(field, value)
+            else:
+                self._write(field, slot, value)
+            if field in self.indexes:
+                self._index_add(slot, field, self._keyed(value))
+        extra = {k: v for k, v in row.items() if k not in self.columns}
+        if extra:
+            self.extra[slot] = extra
+        else:
+            self.extra.pop(slot, None)
+        key = row[self.primary_key]
+        self.pk_index[key] = slot
+        if isinstance(key, int) and not isinstance(key, bool) and key >= self.next_int:
+            self.next_int = key + 1
+
+    def _unstore(self, slot):
+        self.query_cache.clear()
+        for field in self.indexes:
+            self._index_remove(slot, field, self._keyed(self.columns[field].raw(slot)))
+
+    # Public API
+    def load(self, rows):
+        """
+        Bulk-appends generated rows column by column. Integer primary keys are renumbered
+        1..n after the current maximum; other keys get a -N suffix when they collide.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        with self.lock:
+            self.query_cache.clear()
+            pk = self.primary_key
+            first = rows[0].get(pk)
+            if isinstance(first, int) and not isinstance(first, bool):
+                for i, row in enumerate(rows):
+                    row[pk] = self.next_int + i
+            else:
+                pending, taken = set(), self.pk_index
+                for row in rows:
+                    key = row.get(pk)
+                    if key in pending or key in taken:
+                        key = row[pk] = self._fresh_key(key, pending)
+                    pending.add(key)
+            start = len(self.alive)
+            for field in self.fields:
+                values = [row.get(field, MISSING) for row in rows]
+                try:
+                    self.columns[field].extend(values)
+                except _Demote:
+                    # extend() may have appended part of the batch; rebuild the column from scratch
+                    column = self.columns[field]
+                    kept = column.items()[:start]
+                    self.columns[field] = _ListColumn(kept, encoded=getattr(column, "encoded", False))
+                    self.columns[field].extend(values)
+                if field in self.indexes:
+                    # New slots are past every existing one, so appending keeps the arrays sorted
+                    index = self.indexes[field]
+                    for slot, value in enumerate(values, start):
+                        if value is not MISSING:
+                            key = self._keyed(value)
+                            slots = index.get(key)
+                            if slots is None:
+                                slots = index[key] = array("q")
+                            slots.append(slot)
+            self.pk_index.update((row[pk], slot) for slot, row in enumerate(rows, start))
+            self.alive.extend(b"\x01" * len(rows))
+            last = rows[-1][pk]
+            if isinstance(last, int) and not isinstance(last, bool):
+                self.next_int = max(self.next_int, last + 1)
+            return len(rows)
+
+    def get(self, key):
+        with self.lock:
+            slot = self._slot_for(key)
+            return None if slot is None else self._row(slot)
+
+    def insert(self, row, assign_key=False):
+        """
+        Adds a row. A missing primary key is assigned; with assign_key the row's key is only a
+        suggestion (generated rows: ints become the next id, taken strings get a suffix).
+        Raises StoreError(409) when a client-chosen key already exists, StoreError(400) for an
+        object or array key.
+        """
+        with self.lock:
+            pk = self.primary_key
+            key = row.get(pk)
+            self._check_key(key)
+            if key is None:
+                row[pk] = self.next_int
+            elif assign_key and (type(key) is int or self._slot_for(key) is not None):
+                row[pk] = self._fresh_key(key)
+            elif self._slot_for(key) is not None:
+                raise StoreError(f"{pk} {key!r} already exists", 409)
+            slot = self.free.pop() if self.free else len(self.alive)
+            self._store(slot, row)
+            if slot == len(self.alive):
+                self.alive.append(1)
+            else:
+                self.alive[slot] = 1
+            return self._row(slot)
+
+    def replace(self, key, row):
+        """PUT: the row becomes exactly `row` (created if absent). Returns (row, created)."""
+        with self.lock:
+            self._check_key(key)
+            self._check_key(row.get(self.primary_key))
+            slot = self._slot_for(key)
+            if slot is None:
+                return self.insert(row), True
+            old_key = self.columns[self.primary_key].raw(slot)
+            if row.get(self.primary_key, old_key) != old_key and self._slot_for(row[self.primary_key]) is not None:
+                raise StoreError(f"{self.primary_key} {row[self.primary_key]!r} already exists", 409)
+            self._unstore(slot)
+            del self.pk_index[old_key]
+            row.setdefault(self.primary_key, old_key)
+            self._store(slot, row)
+            return self._row(slot), False
+
+    def update(self, key, changes):
+        """PATCH: merges top-level fields into the row. Returns the row, or None if absent."""
+        with self.lock:
+            slot = self._slot_for(key)
+            if slot is None:
+                return None
+            row = self._row(slot)
+            row.update(changes)
+            return self.replace(key, row)[0]
+
+    def delete(self, key):
+        with self.lock:
+            slot = self._slot_for(key)
+            if slot is None:
+                return False
+            self._unstore(slot)
+            del self.pk_index[self.columns[self.primary_key].raw(slot)]
+            for column in self.columns.values():
+                if isinstance(column, _ListColumn):
+                    column.set(slot, MISSING)  # let go of the dead row's objects
+            self.extra.pop(slot, None)
+            self.alive[slot] = 0
+            self.free.append(slot)
+            return True
+
+    def query(self, filters, offset=0, limit=20):
+        """
+        Rows whose fields equal every filter value (query-string text), in slot order.
+        One indexed filter pages straight off its sorted slot array. Several are intersected
+        shortest first, and other filters scan those candidates (or every row, if no filter is
+        indexed); that match list is cached until the next write, so only the first page pays.
+        Returns (total, rows).
+        """
+        with self.lock:
+            unknown = [f for f in filters if f not in self.columns and f != self.primary_key]
+            if unknown:
+                raise StoreError(f"Unknown filter fields: {', '.join(unknown)}")
+            cache_key = tuple(sorted(filters.items()))
+            candidates = self.query_cache.get(cache_key)
+            if candidates is not None:
+                self.query_cache.move_to_end(cache_key)
+                return len(candidates), [self._row(slot) for slot in candidates[offset:offset + limit]]
+            postings, scans = [], []
+            for field, text in filters.items():
+                if field == self.primary_key:
+                    slot = self._slot_for(text)
+                    postings.append((slot,) if slot is not None else ())
+                elif field in self.indexes:
+                    postings.append(self._posting(field, text))
+                else:
+                    scans.append((field, text))
+            if not scans and len(postings) <= 1:
+                if postings:
+                    candidates = postings[0]
+                    return len(candidates), [self._row(slot) for slot in candidates[offset:offset + limit]]
+                return len(self.pk_index), [self._row(slot) for slot in self._live_slots(offset, limit)]
+            if postings:
+                candidates = _intersect(sorted(postings, key=len))
+            else:
+                candidates = (slot for slot, live in enumerate(self.alive) if live)
+            for field, text in scans:
+                wanted = set(self.key_candidates(text))
+                column = self.columns[field]
+                candidates = [slot for slot in candidates if self._matches(column.raw(slot), wanted, text)]
+            self.query_cache[cache_key] = candidates
+            if len(self.query_cache) > QUERY_CACHE_ENTRIES:
+                self.query_cache.popitem(last=False)
+            return len(candidates), [self._row(slot) for slot in candidates[offset:offset + limit]]
+
+    @staticmethod
+    def _matches(value, wanted, text):
+        if value is MISSING:
+            return False
+        if type(value) is _Packed:
+            value = _encode(marshal.loads(value))
+        try:
+            return value in wanted or (isinstance(value, str) and value == text)
+        except TypeError:
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rows": len(self.pk_index),
+                "free_slots": len(self.free),
+                "primary_key": self.primary_key,
+                "columns": {f: c.kind for f, c in self.columns.items()},
+                "column_bytes": sum(c.nbytes() for c in self.columns.values()),
+                "indexes": {f: len(index) for f, index in self.indexes.items()},
+            }
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Data directories are read at import time, so point them somewhere disposable first
+DATA_DIR = tempfile.mkdtemp(prefix="mirage-tests-")
+for var, sub in (("MIRAGE_CACHE_DIR", "cache"), ("MIRAGE_FIXTURE_DIR", "fixtures"), ("MIRAGE_RECORDING_DIR", "recordings")):
+    os.environ.setdefault(var, os.path.join(DATA_DIR, sub))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def core():
+    """mirage_gemini with an empty registry and generator cache, cleaned up again after the test."""
+    import mirage_gemini
+    mirage_gemini.generator_cache.invalidate()
+    yield mirage_gemini
+    for name in list(mirage_gemini.recordings):
+        mirage_gemini.close_recording(name)
+    for mock in mirage_gemini.active_simulations.all():
+        mirage_gemini.remove_mock(mock.name)
+    mirage_gemini.generator_cache.invalidate()
+
+
+@pytest.fixture
+def client(core):
+    return core.app.test_client()
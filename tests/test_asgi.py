@@ -0,0 +1,65 @@
+import json
+import asyncio
+
+import pytest
+
+
+def call(method, path, body=None, query=b""):
+    """Drives mirage_asgi.app through one request; returns (status, decoded JSON or raw bytes)."""
+    import mirage_asgi
+    raw = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {"type": "http", "method": method, "path": path, "query_string": query,
+             "headers": [(b"content-type", b"application/json")]}
+    messages = [{"type": "http.request", "body": raw, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(mirage_asgi.app(scope, receive, send))
+    status = sent[0]["status"]
+    payload = b"".join(m.get("body", b"") for m in sent[1:])
+    try:
+        return status, json.loads(payload)
+    except ValueError:
+        return status, payload
+
+
+def test_deploy_and_serve(core):
+    status, reply = call("POST", "/deploy", {"name": "a", "schema": {"id": 1, "name": "Ada"}})
+    assert status == 200 and reply["success"]
+    status, record = call("GET", "/api/mirage/a")
+    assert status == 200 and sorted(record) == ["id", "name"]
+
+
+@pytest.mark.parametrize("path", ["/deploy", "/api/chaos", "/api/cache/invalidate", "/api/recordings"])
+def test_non_object_bodies_are_rejected(core, path):
+    status, reply = call("POST", path, [1])
+    assert status == 400
+    assert reply["error"] == "Body must be a JSON object"
+
+
+def test_mock_settings_reject_non_object_bodies(core):
+    call("POST", "/deploy", {"name": "a", "schema": {"id": 1}})
+    for action in ("pool", "state", "materialize", "validate", "rollback"):
+        status, reply = call("POST", f"/api/mocks/a/{action}", [1])
+        assert status == 400, action
+
+
+def test_cache_invalidate_is_served(core, monkeypatch):
+    monkeypatch.setattr(core, "plan_refiner", lambda key, schema, plan, feedback=None: json.dumps(plan))
+    call("POST", "/deploy", {"name": "g", "schema": {"id": 1}, "engine": "gemini", "api_key": "test"})
+    assert core.generator_cache.stats()["entries"] == 1
+    status, reply = call("POST", "/api/cache/invalidate", {"schema": {"id": 1}})
+    assert status == 200 and reply == {"success": True, "removed": 1}
+    assert call("POST", "/api/cache/invalidate", {})[1]["removed"] == 0
+
+
+@pytest.mark.parametrize("path", ["/deploy", "/api/chaos", "/api/cache/invalidate"])
+def test_flask_rejects_non_object_bodies_too(client, path):
+    reply = client.post(path, json=[1])
+    assert reply.status_code == 400
+    assert reply.get_json()["error"] == "Body must be a JSON object"
@@ -0,0 +1,121 @@
+import json
+import time
+import threading
+
+import pytest
+
+SCHEMA = {"user_id": 1, "name": "Ada", "email": "ada@example.com"}
+
+
+class CountingRefiner:
+    """A plan_refiner that proposes the plan unchanged and records how many calls overlapped."""
+    def __init__(self, delay=0.0, failures=()):
+        self.delay = delay
+        self.failures = list(failures)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    def __call__(self, api_key, schema_str, plan, feedback=None):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            failure = self.failures.pop(0) if self.failures else None
+        try:
+            time.sleep(self.delay)
+            return failure if failure is not None else json.dumps(plan)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def refiner(core, monkeypatch):
+    stub = CountingRefiner()
+    monkeypatch.setattr(core, "plan_refiner", stub)
+    monkeypatch.setattr(core, "GEMINI_BACKOFF_S", 0.0)
+    return stub
+
+
+def batch(n, **extra):
+    return dict({"engine": "gemini", "api_key": "test", "mocks": [
+        {"name": f"m{i}", "schema": dict(SCHEMA, **{f"field_{i}": i})} for i in range(n)
+    ]}, **extra)
+
+
+def test_batch_refines_concurrently_within_the_limit(client, refiner):
+    refiner.delay = 0.1
+    started = time.perf_counter()
+    reply = client.post("/deploy/batch", json=batch(8, concurrency=4)).get_json()
+    assert reply["deployed"] == 8 and reply["failed"] == 0
+    assert refiner.calls == 8
+    assert 1 < refiner.peak <= 4
+    assert time.perf_counter() - started < 8 * refiner.delay
+
+
+def test_stub_ms_stands_in_for_gemini(client, core, monkeypatch):
+    monkeypatch.setattr(core, "GEMINI_STUB_MS", 20.0)
+    monkeypatch.setattr(core, "plan_refiner", core.stub_ai_logic)
+    reply = client.post("/deploy/batch", json=batch(3)).get_json()
+    assert reply["deployed"] == 3
+    assert all(r["engine"] == "gemini" and not r["cached"] for r in reply["results"])
+
+
+def test_rate_limited_refinement_is_retried(client, refiner):
+    refiner.failures = ["# Error: 429 Resource exhausted", "# Error: quota exceeded"]
+    reply = client.post("/deploy", json={"name": "retry", "schema": SCHEMA, "engine": "gemini", "api_key": "test"}).get_json()
+    assert reply["success"]
+    assert refiner.calls == 3
+
+
+def test_permanent_refiner_error_is_not_retried(client, refiner):
+    refiner.failures = ["# Error: API key not valid"]
+    reply = client.post("/deploy", json={"name": "bad_key", "schema": SCHEMA, "engine": "gemini", "api_key": "test"}).get_json()
+    assert not reply["success"] and "API key not valid" in reply["error"]
+    assert refiner.calls == 1
+
+
+def test_cached_plan_deploys_without_an_api_key(client, refiner):
+    first = client.post("/deploy", json={"name": "c1", "schema": SCHEMA, "engine": "gemini", "api_key": "test"}).get_json()
+    assert first["success"] and not first["cached"]
+    second = client.post("/deploy", json={"name": "c2", "schema": SCHEMA, "engine": "gemini"}).get_json()
+    assert second["success"] and second["cached"]
+    assert second["cache_key"] == first["cache_key"]
+    assert refiner.calls == 1
+
+
+def test_missing_api_key_without_cache_fails(client, refiner):
+    reply = client.post("/deploy", json={"name": "nokey", "schema": SCHEMA, "engine": "gemini"}).get_json()
+    assert reply == {"success": False, "error": "API Key Missing"}
+    assert refiner.calls == 0
+
+
+def test_one_failing_item_does_not_fail_the_batch(client, core, refiner):
+    refiner.failures = ["# Error: API key not valid"]
+    body = batch(3, concurrency=1)
+    body["mocks"] += [{"name": "bad_methods", "schema": SCHEMA, "methods": [1]},
+                      {"name": "bad_json", "schema": "{not json"}]
+    reply = client.post("/deploy/batch", json=body).get_json()
+    assert reply["deployed"] == 2 and reply["failed"] == 3
+    failed = {r["name"] for r in reply["results"] if not r["success"]}
+    assert {"bad_methods", "bad_json"} <= failed
+    assert len(core.active_simulations.all()) == 2
+
+
+def test_streamed_batch_reports_every_item(client, refiner):
+    body = batch(2)
+    body["mocks"].append({"name": "bad_methods", "schema": SCHEMA, "methods": [1]})
+    reply = client.post("/deploy/batch?stream=ndjson", json=body)
+    events = [json.loads(line) for line in reply.get_data(as_text=True).splitlines() if line]
+    assert events[-1]["summary"]["deployed"] == 2
+    assert events[-1]["summary"]["failed"] == 1
+    assert len(events) == 4
+
+
+def test_batch_rejects_duplicate_names(client, refiner):
+    body = {"mocks": [{"name": "dup", "schema": SCHEMA}, {"name": "dup", "schema": SCHEMA}]}
+    reply = client.post("/deploy/batch", json=body)
+    assert reply.status_code == 400
+    assert "dup" in reply.get_json()["error"]
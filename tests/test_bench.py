@@ -0,0 +1,53 @@
+import html
+import json
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+import mirage_bench
+from mirage_compiler import SAMPLE_PROFILE
+
+
+def test_dashboard_and_bench_share_the_sample(client):
+    page = html.unescape(client.get("/").get_data(as_text=True))
+    editor = page.split('spellcheck="false">', 1)[1].split("</textarea>", 1)[0]
+    assert json.loads(editor) == SAMPLE_PROFILE == mirage_bench.REFERENCE_SCHEMAS["user_profile"]
+
+
+def test_summarize_percentiles_and_ok_ratio():
+    result = mirage_bench.summarize([0.001 * i for i in range(1, 101)], {"200": 90, "500": 10}, 2, 2.0, 1234)
+    assert result["requests"] == 100 and result["rps"] == 50.0 and result["ok_ratio"] == 0.9
+    assert result["latency_ms"]["p50"] == 51.0 and result["latency_ms"]["max"] == 100.0
+    assert result["transport_errors"] == 2
+    assert mirage_bench.summarize([], {}, 0, 1.0, 0)["latency_ms"] == {}
+
+
+@pytest.fixture
+def server(core):
+    server = make_server("127.0.0.1", 0, core.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    thread.join(5)
+
+
+def test_suite_runs_against_a_live_server(core, server, tmp_path, capsys):
+    first, second = str(tmp_path / "a.json"), str(tmp_path / "b.json")
+    args = ["--server", server, "--schemas", "user_profile,inventory", "--duration", "0.3", "--warmup", "0",
+            "--concurrency", "2", "--chaos", "off"]
+    assert mirage_bench.main(args + ["-o", first]) == 0
+    assert mirage_bench.main(args + ["-o", second, "--compare", first]) == 0
+    with open(second, encoding="utf-8") as f:
+        report = json.load(f)
+    assert [(r["schema"], r["chaos"]) for r in report["results"]] == [("user_profile", "off"), ("inventory", "off")]
+    assert all(r["requests"] > 0 and r["ok_ratio"] == 1.0 for r in report["results"])
+    assert "user_profile (chaos off): req/s" in capsys.readouterr().out
+    # Without --keep the bench mocks are removed again
+    assert core.active_simulations.get("bench_user_profile") is None
+
+
+def test_unknown_schema_is_refused(server):
+    with pytest.raises(SystemExit):
+        mirage_bench.main(["--server", server, "--schemas", "nope"])
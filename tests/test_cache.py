@@ -0,0 +1,67 @@
+import pytest
+
+from mirage_compiler import infer_plan, plan_to_code
+
+
+def test_compiling_prints_nothing_unless_it_fails(core, capsys):
+    func = core.compile_generator(plan_to_code(infer_plan({"id": 1})))
+    assert set(func()) == {"id"}
+    assert capsys.readouterr().out == ""
+    with pytest.raises(SyntaxError):
+        core.compile_generator("return {")
+    assert capsys.readouterr().out.startswith("COMPILE ERROR:\n")
+
+
+def test_schema_key_ignores_whitespace_and_key_order(core):
+    key = core.schema_cache_key('{"b": 2, "a": 1}')
+    assert core.schema_cache_key('{ "a":1,\n "b":2 }') == key == core.schema_cache_key({"a": 1, "b": 2})
+    assert core.schema_cache_key({"a": 1, "b": 3}) != key
+    assert core.schema_cache_key({"a": 1, "b": 2}, "other-prompt") != key
+
+
+def test_cache_evicts_least_recently_used_and_survives_a_restart(core, tmp_path):
+    cache = core.GeneratorCache(str(tmp_path), max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None and cache.get("a") == "1"
+    assert cache.stats()["evictions"] == 1
+    reopened = core.GeneratorCache(str(tmp_path), max_entries=2)
+    assert reopened.get("a") == "1" and reopened.get("c") == "3"
+    assert reopened.invalidate("a") == 1 and reopened.get("a") is None
+
+
+def test_cache_respects_its_byte_budget(core, tmp_path):
+    cache = core.GeneratorCache(str(tmp_path), max_bytes=10)
+    cache.put("a", "x" * 6)
+    cache.put("b", "y" * 6)
+    assert cache.get("a") is None and cache.get("b") == "y" * 6
+    assert cache.stats()["bytes"] == 6
+
+
+def test_second_deploy_of_a_schema_skips_gemini(client, core, monkeypatch):
+    calls = []
+
+    def refiner(api_key, schema, plan, feedback=None):
+        calls.append(schema)
+        return core.json.dumps(plan)
+
+    monkeypatch.setattr(core, "plan_refiner", refiner)
+    body = {"name": "u", "engine": "gemini", "api_key": "k", "schema": '{"id": 1, "name": "Ada"}'}
+    hits = client.get("/api/cache").get_json()["hits"]
+    first = client.post("/deploy", json=body).get_json()
+    assert first["success"] and not first["cached"]
+    second = client.post("/deploy", json=dict(body, schema='{"name": "Ada", "id": 1}')).get_json()
+    assert second["success"] and second["cached"] and second["cache_key"] == first["cache_key"]
+    assert len(calls) == 1
+    assert client.get("/api/cache").get_json()["hits"] == hits + 1
+    removed = client.post("/api/cache/invalidate", json={"schema": body["schema"]}).get_json()
+    assert removed == {"success": True, "removed": 1}
+    assert not client.post("/deploy", json=body).get_json()["cached"]
+    assert len(calls) == 2
+
+
+def test_local_deploys_are_not_cached(client):
+    assert client.post("/deploy", json={"name": "l", "schema": {"id": 1}}).get_json()["success"]
+    assert client.get("/api/cache").get_json()["entries"] == 0
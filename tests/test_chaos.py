@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from mirage_chaos import ChaosConfig, Latency, fault_status
+
+
+@pytest.mark.parametrize("spec", [
+    {"dist": "longtail"},
+    {"dist": "longtail", "percentiles": {}},
+    {"dist": "longtail", "percentiles": [[50, 10]]},
+    {"dist": "longtail", "percentiles": {"50": "fast", "100": 20}},
+    {"dist": "longtail", "percentiles": {"50": None, "100": 20}},
+    {"dist": "longtail", "percentiles": {"50": 10}},
+])
+def test_bad_longtail_tables_are_value_errors(spec):
+    with pytest.raises(ValueError):
+        Latency(spec)
+
+
+def test_longtail_samples_follow_the_table():
+    latency = Latency({"dist": "longtail", "percentiles": {"50": 20, "99": 900, "100": 3000}})
+    rng = random.Random(3)
+    samples = sorted(latency.sample_ms(rng) for _ in range(10000))
+    assert 0 <= samples[0] and samples[-1] <= 3000
+    assert 15 <= samples[5000] <= 25
+
+
+@pytest.mark.parametrize("percentiles", [{}, None])
+def test_chaos_endpoint_rejects_an_empty_table(client, percentiles):
+    reply = client.post("/api/chaos", json={"enabled": True, "latency": {"dist": "longtail", "percentiles": percentiles}})
+    assert reply.status_code == 400
+    assert not reply.get_json()["success"]
+
+
+@pytest.mark.parametrize("latency", [
+    {"dist": "fixed", "ms": -5},
+    {"dist": "fixed", "ms": "slow"},
+    {"dist": "fixed", "ms": float("inf")},
+    {"dist": "uniform", "min_ms": 50, "max_ms": 10},
+    {"dist": "normal", "mean_ms": -1},
+    {"dist": "normal", "mean_ms": 10, "stddev_ms": -1},
+    {"dist": "fixed", "ms": 5, "probability": 2},
+    {"dist": "longtail", "percentiles": {"100": -3}},
+    "fast",
+])
+def test_bad_latency_is_a_value_error(latency):
+    with pytest.raises(ValueError):
+        ChaosConfig({"latency": latency})
+
+
+@pytest.mark.parametrize("fault", [
+    {"type": "error", "status": "abc"},
+    {"type": "error", "status": 42},
+    {"type": "error", "status": 600},
+    {"type": "error", "status": 500.5},
+    {"type": "error", "message": 7},
+    {"type": "rate_limit", "retry_after": -1},
+    {"type": "timeout", "after_ms": -10},
+    {"type": "truncate", "fraction": 1.5},
+    {"type": "slow_drip", "chunk_bytes": 0},
+    {"type": "slow_drip", "interval_ms": "often"},
+    {"type": "reset", "probability": True},
+    ["error"],
+])
+def test_bad_fault_params_are_value_errors(fault):
+    with pytest.raises(ValueError):
+        ChaosConfig({"faults": [fault]})
+
+
+def test_fault_params_are_coerced_once():
+    config = ChaosConfig({"faults": [{"type": "error", "status": "503", "probability": "1"}]})
+    decision = config.decide(random.Random(0))
+    assert decision.fault["status"] == 503
+    assert fault_status(decision.fault) == 503
+
+
+def test_chaos_endpoint_rejects_bad_params_and_keeps_serving(client):
+    assert client.post("/deploy", json={"name": "c", "schema": {"id": 1}}).get_json()["success"]
+    for body in ({"latency": {"dist": "fixed", "ms": -5}}, {"faults": [{"type": "error", "status": "abc"}]},
+                 {"faults": [{"type": "error", "status": 42, "probability": 1}]}):
+        reply = client.post("/api/chaos", json=dict(body, enabled=True))
+        assert reply.status_code == 400
+        reply = client.post("/api/chaos", json=dict(body, enabled=True, name="c"))
+        assert reply.status_code == 400
+    assert client.get("/api/mirage/c").status_code == 200
@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from mirage_compiler import infer_plan, plan_to_code, generator_source, load_generator
+
+
+@pytest.mark.parametrize("value", ["2025-02-30T10:00:00Z", "2025-13-01", "2025-01-01T25:00:00"])
+def test_impossible_dates_are_inferred_as_text(value):
+    plan = infer_plan({"d": value})
+    assert plan["fields"]["d"]["type"] == "string"
+    record = load_generator(generator_source(plan_to_code(plan)))(random.Random(1))
+    assert isinstance(record["d"], str)
+
+
+def test_real_dates_keep_their_format():
+    plan = infer_plan({"at": "2025-02-28T10:00:00Z", "day": "2025-12-01"})
+    assert plan["fields"]["at"]["type"] == "datetime"
+    assert plan["fields"]["day"]["type"] == "date"
+
+
+@pytest.mark.parametrize("value", ["2025-02-30T10:00:00Z", "2025-13-01"])
+def test_deploy_with_impossible_date(client, value):
+    reply = client.post("/deploy", json={"name": "d", "schema": {"d": value}})
+    assert reply.status_code == 200
+    assert reply.get_json()["success"]
+    assert isinstance(client.get("/api/mirage/d").get_json()["d"], str)
+
+
+def test_batch_with_impossible_date(client):
+    reply = client.post("/deploy/batch", json={"mocks": [
+        {"name": "bad", "schema": {"d": "2025-13-01"}}, {"name": "ok", "schema": {"d": "2025-01-01"}},
+    ]})
+    assert reply.status_code == 200
+    assert reply.get_json()["deployed"] == 2
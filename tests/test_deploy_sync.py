@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from mirage_state import StateFile
+
+SCHEMA = {"id": 1, "name": "Ada"}
+
+
+@pytest.fixture
+def shared(core, tmp_path, monkeypatch):
+    """This worker's view of a snapshot file, without the watcher thread, plus a second writer."""
+    path = str(tmp_path / "registry.json")
+    monkeypatch.setattr(core, "shared_state", StateFile(path))
+    monkeypatch.setattr(core, "applied_generation", 0)
+    monkeypatch.setattr(core, "published_generation", 0)
+    return StateFile(path)
+
+
+def test_snapshot_read_before_a_deploy_does_not_drop_it(core, client, shared):
+    shared.update(lambda s: None)
+    stale = shared.read()
+    assert client.post("/deploy", json={"name": "fresh", "schema": SCHEMA}).get_json()["success"]
+    core.sync_from_state(stale)
+    assert core.active_simulations.get("fresh") is not None
+    assert client.get("/api/mirage/fresh").status_code == 200
+
+
+def test_other_workers_changes_in_our_own_publish_are_applied(core, client, shared):
+    assert client.post("/deploy", json={"name": "mine", "schema": SCHEMA}).get_json()["success"]
+    spec = dict(shared.read()["mocks"]["mine"], name="theirs", route="/theirs")
+    shared.update(lambda s: s["mocks"].__setitem__("theirs", spec))
+    assert client.post("/api/mocks/mine/validate", json={"runs": 0, "sample_rate": 0.5}).get_json()["success"]
+    # Our write landed on top of theirs, so the watcher still has to deliver the snapshot
+    core.sync_from_state(shared.read())
+    assert core.active_simulations.get("theirs") is not None
+    assert core.active_simulations.get("mine").live_rate == 0.5
+
+
+def test_sync_waits_for_a_deploy_in_progress(core, client, shared, monkeypatch):
+    shared.update(lambda s: None)
+    stale = shared.read()
+    published, release = threading.Event(), threading.Event()
+    publish = core.publish_mock
+
+    def slow_publish(mock, new_version=False):
+        published.set()
+        release.wait(5)
+        publish(mock, new_version)
+
+    monkeypatch.setattr(core, "publish_mock", slow_publish)
+    deploy = threading.Thread(target=lambda: client.post("/deploy", json={"name": "slow", "schema": SCHEMA}))
+    deploy.start()
+    assert published.wait(10)
+    sync = threading.Thread(target=core.sync_from_state, args=(stale,))
+    sync.start()
+    sync.join(0.2)
+    assert sync.is_alive()
+    release.set()
+    deploy.join(10)
+    sync.join(10)
+    assert core.active_simulations.get("slow") is not None
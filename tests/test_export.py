@@ -0,0 +1,97 @@
+import json
+import random
+import importlib.util
+
+import pytest
+
+import mirage_export
+from mirage_chaos import ChaosConfig
+from mirage_compiler import infer_plan, plan_from_samples, plan_to_code, generator_source, load_generator
+from mirage_export import load_bulk_generator, chaos_error_rate, flask_route
+
+INVENTORY = {"product_id": "sku_4821", "stock_level": 320, "warehouse_location": "Zone-A",
+             "next_shipment": "2025-03-14", "status": "IN_STOCK", "dimensions": {"h": 40, "w": 25, "l": 60}}
+
+SAMPLES = [{"id": i, "coupon": None if i % 4 else "SAVE10"} for i in range(400)]  # 75% null
+
+
+def null_rate(records):
+    return sum(1 for r in records if r["coupon"] is None) / len(records)
+
+
+@pytest.fixture
+def plan():
+    plan = plan_from_samples(SAMPLES)
+    assert plan["fields"]["coupon"]["p_null"] == 0.75
+    return plan
+
+
+def test_per_record_generator_follows_the_learned_null_rate(plan):
+    func = load_generator(generator_source(plan_to_code(plan)))
+    rng = random.Random(0)
+    assert null_rate([func(rng) for _ in range(4000)]) == pytest.approx(0.75, abs=0.04)
+
+
+@pytest.mark.skipif(mirage_export.np is None, reason="the column-wise path needs NumPy")
+def test_bulk_generator_follows_the_learned_null_rate(plan):
+    func = load_generator(generator_source(plan_to_code(plan)))
+    bulk = load_bulk_generator(plan, func)
+    assert null_rate(list(bulk(4000, seed=1))) == pytest.approx(0.75, abs=0.04)
+
+
+def load_module(path, name="exported"):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def shape(value):
+    """Field names and JSON types, recursively, so two generators' records can be compared."""
+    if isinstance(value, dict):
+        return {k: shape(v) for k, v in value.items()}
+    return "number" if isinstance(value, (int, float)) and not isinstance(value, bool) else type(value).__name__
+
+
+def test_bulk_rows_have_the_per_record_shape():
+    plan = infer_plan(INVENTORY)
+    func = load_generator(generator_source(plan_to_code(plan)))
+    bulk = load_bulk_generator(plan, func)
+    rows = list(bulk(500, seed="s"))
+    assert len(rows) == 500
+    assert all(shape(row) == shape(func(random.Random(i))) for i, row in enumerate(rows[:50]))
+    assert list(bulk(500, seed="s")) == rows
+
+
+def test_exported_server_serves_the_mock(client, tmp_path):
+    assert client.post("/deploy", json={"name": "inv", "schema": INVENTORY,
+                                        "route": "/products/{product_id}"}).get_json()["success"]
+    reply = client.get("/api/mocks/inv/export")
+    assert reply.status_code == 200 and 'filename="inv_server.py"' in reply.headers["Content-Disposition"]
+    path = tmp_path / "inv_server.py"
+    path.write_bytes(reply.get_data())
+    module = load_module(str(path))
+    served = module.app.test_client()
+    record = served.get("/products/sku_9").get_json()
+    assert record["product_id"] == "sku_9" and set(record) == set(INVENTORY)
+    batch = served.get("/products/sku_9?count=25&seed=1").get_json()
+    assert len(batch) == 25 and batch == served.get("/products/sku_9?count=25&seed=1").get_json()
+    module.write_fixture(str(tmp_path / "out.ndjson"), 30, seed=2)
+    lines = (tmp_path / "out.ndjson").read_text().splitlines()
+    assert len(lines) == 30 and set(json.loads(lines[0])) == set(INVENTORY)
+    assert client.get("/api/mocks/nope/export").status_code == 404
+
+
+def test_cli_exports_from_a_sample_file(tmp_path, capsys):
+    sample, output = tmp_path / "sample.json", tmp_path / "orders_server.py"
+    sample.write_text(json.dumps({"order_id": 1, "total": 9.5}))
+    assert mirage_export.main(["--schema", str(sample), "--name", "orders", "-o", str(output)]) == 0
+    module = load_module(str(output), "orders_server")
+    assert set(module.app.test_client().get("/orders").get_json()) == {"order_id", "total"}
+
+
+def test_only_error_faults_survive_export():
+    config = ChaosConfig({"faults": [{"type": "error", "probability": 0.2}, {"type": "rate_limit", "probability": 0.3}]})
+    assert chaos_error_rate(config) == pytest.approx(0.2)
+    assert chaos_error_rate(None) == 0.0
+    assert flask_route("/users/{user_id}/orders") == "/users/<user_id>/orders"
@@ -0,0 +1,79 @@
+import os
+import json
+
+import pytest
+
+from mirage_fixture import Fixture, write_fixture, read_meta
+
+
+@pytest.fixture
+def deployed(client):
+    assert client.post("/deploy", json={"name": "o", "schema": {"id": 1, "sku": "sku_1"}}).get_json()["success"]
+    return client
+
+
+def test_materialize_writes_reuses_and_serves(deployed, core):
+    reply = deployed.post("/api/mocks/o/materialize", json={"count": 50, "seed": "s"}).get_json()
+    assert reply["success"] and not reply["reused"] and reply["fixture"]["count"] == 50
+    assert deployed.post("/api/mocks/o/materialize", json={"count": 50, "seed": "s"}).get_json()["reused"]
+    assert deployed.get("/api/mirage/o?index=7").status_code == 200
+    assert deployed.get("/api/mirage/o?index=50").status_code == 404
+    assert deployed.post("/api/mocks/o/materialize", json={"enabled": False}).get_json()["fixture"] is None
+
+
+def test_materialize_path_stays_in_the_fixture_dir(deployed, core, tmp_path):
+    outside = tmp_path / "outside" / "x.txt"
+    for path in (str(outside), "../escape.mfx", os.path.join(core.FIXTURE_DIR, "..", "escape.mfx"), "", 5):
+        reply = deployed.post("/api/mocks/o/materialize", json={"count": 5, "path": path})
+        assert reply.status_code == 400, path
+        reply = deployed.post("/api/mocks/o/materialize", json={"path": path})
+        assert reply.status_code == 400, path
+    assert not outside.exists()
+    assert not os.path.exists(os.path.join(os.path.dirname(core.FIXTURE_DIR), "escape.mfx"))
+
+
+def test_materialize_to_a_named_file(deployed, core):
+    reply = deployed.post("/api/mocks/o/materialize", json={"count": 5, "path": "named.mfx"}).get_json()
+    assert reply["success"]
+    assert reply["fixture"]["path"] == os.path.realpath(os.path.join(core.FIXTURE_DIR, "named.mfx"))
+    again = deployed.post("/api/mocks/o/materialize", json={"path": reply["fixture"]["path"]}).get_json()
+    assert again["success"] and again["fixture"]["count"] == 5
+
+
+def test_bad_count_is_rejected(deployed):
+    for body in ({}, {"count": 0}, {"count": "many"}):
+        assert deployed.post("/api/mocks/o/materialize", json=body).status_code == 400
+
+
+def test_fixture_file_round_trips(tmp_path):
+    path = str(tmp_path / "f.mfx")
+    bodies = [json.dumps({"i": i, "text": "line\\nbreak"}).encode("utf-8") for i in range(1000)]
+    assert write_fixture(path, iter(bodies), {"seed": "s"}) == 1000
+    assert read_meta(path)["count"] == 1000 and read_meta(path)["seed"] == "s"
+    fixture = Fixture(path)
+    assert fixture.record(999).tobytes() == bodies[999]
+    assert fixture.lines(10, 13).tobytes() == b"\n".join(bodies[10:13]) + b"\n"
+    assert json.loads(b"[" + fixture.array_items(0, 1000) + b"]") == [json.loads(b) for b in bodies]
+    assert fixture.lines(990, 2000).tobytes().count(b"\n") == 10
+    assert fixture.lines(5, 5).tobytes() == b""
+
+
+def test_non_fixtures_are_refused(tmp_path):
+    path = tmp_path / "plain.txt"
+    path.write_bytes(b"not a fixture at all, just some text")
+    assert read_meta(str(path)) is None and read_meta(str(tmp_path / "missing")) is None
+    with pytest.raises(ValueError):
+        Fixture(str(path))
+
+
+def test_fixture_serves_the_same_bytes_as_generation(deployed, core):
+    seeded = deployed.get("/api/mirage/o?seed=s&page_size=20").get_json()
+    assert deployed.post("/api/mocks/o/materialize", json={"count": 100, "seed": "s"}).get_json()["success"]
+    page = deployed.get("/api/mirage/o?seed=s&page_size=20")
+    assert page.get_json()["data"] == [json.loads(line) for line in
+                                       deployed.get("/api/mirage/o?page_size=20&stream=ndjson&seed=s").get_data().splitlines()]
+    assert page.get_json()["next_cursor"] == seeded["next_cursor"]
+    following = deployed.get("/api/mirage/o?cursor=" + page.get_json()["next_cursor"]).get_json()
+    assert following["offset"] == 20 and len(following["data"]) == 20
+    assert len(deployed.get("/api/mirage/o?count=500").get_json()) == 100
+    assert deployed.get("/api/mirage/o?index=3").get_json() == page.get_json()["data"][3]
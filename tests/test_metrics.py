@@ -0,0 +1,95 @@
+import re
+import time
+import threading
+
+import pytest
+
+from mirage_metrics import Metrics, ShardedCounts, SamplingProfiler
+
+
+def sample(text, name, **labels):
+    """The value of one exposition line (labels in exposition order), or None."""
+    want = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    pattern = re.escape(name) + (r"\{" + re.escape(want) + r"\}" if labels else "") + r" (\S+)$"
+    for line in text.splitlines():
+        found = re.match(pattern, line)
+        if found:
+            return float(found.group(1))
+    return None
+
+
+def test_shards_from_many_threads_add_up():
+    counts = ShardedCounts()
+
+    def work():
+        for _ in range(1000):
+            counts.add("hits")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counts.add("hits", 5)
+    assert counts.collect() == {"hits": 8005}
+    # Exited threads are folded into one retired total, not lost
+    assert counts.collect() == {"hits": 8005} and len(counts.shards) == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    latency = metrics.histogram("t_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+    latency.observe(("a",), 0.05)
+    latency.observe_many(("a",), [0.5, 2.0])
+    text = metrics.render()
+    assert sample(text, "t_seconds_bucket", route="a", le="0.1") == 1
+    assert sample(text, "t_seconds_bucket", route="a", le="1.0") == 2
+    assert sample(text, "t_seconds_bucket", route="a", le="+Inf") == 3
+    assert sample(text, "t_seconds_count", route="a") == 3
+    assert sample(text, "t_seconds_sum", route="a") == pytest.approx(2.55)
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.counter("t_total", "Test.", ("mock",)).inc(('a"b\nc',))
+    assert 't_total{mock="a\\"b\\nc"} 1' in metrics.render()
+
+
+def test_metrics_split_chaos_errors_from_real_ones(client, core):
+    assert client.post("/deploy", json={"name": "mx", "schema": {"id": 1}}).get_json()["success"]
+    for _ in range(3):
+        assert client.get("/api/mirage/mx").status_code == 200
+    client.post("/api/chaos", json={"name": "mx", "enabled": True, "faults": [{"type": "error", "probability": 1}]})
+    assert client.get("/api/mirage/mx").status_code == 500
+    reply = client.get("/metrics")
+    assert reply.mimetype == "text/plain"
+    text = reply.get_data(as_text=True)
+    assert sample(text, "mirage_requests_total", mock="mx", status="200", outcome="ok") >= 3
+    assert sample(text, "mirage_requests_total", mock="mx", status="500", outcome="chaos") >= 1
+    assert sample(text, "mirage_chaos_injected_total", mock="mx", type="error") >= 1
+    assert sample(text, "mirage_generate_seconds_count", mock="mx") >= 3
+    assert sample(text, "mirage_compile_seconds_count") >= 1
+    assert sample(text, "mirage_mocks") >= 1
+
+
+def test_profiler_samples_while_running(client):
+    stop = threading.Event()
+    spinner = threading.Thread(target=lambda: [time.sleep(0.001) for _ in iter(stop.is_set, True)], name="spinner")
+    spinner.start()
+    try:
+        assert client.post("/api/profiler", json={"interval_ms": 2}).get_json()["running"]
+        time.sleep(0.2)
+        status = client.post("/api/profiler", json={"enabled": False}).get_json()
+    finally:
+        stop.set()
+        spinner.join()
+    assert not status["running"] and status["samples"] > 0
+    folded = client.get("/api/profiler?format=folded").get_data(as_text=True)
+    assert any(line.startswith("spinner;") for line in folded.splitlines())
+    assert client.get("/api/profiler?top=3").get_json()["samples"] == status["samples"]
+
+
+@pytest.mark.parametrize("body", [{"interval_ms": "fast"}, {"interval_ms": 0}, [1]])
+def test_bad_profiler_settings_are_rejected(client, body):
+    assert client.post("/api/profiler", json=body).status_code == 400
+    assert not SamplingProfiler().running()
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+SCHEMA = {"id": 1, "name": "Ada"}
+
+
+@pytest.fixture
+def deployed(client):
+    assert client.post("/deploy", json={"name": "p", "schema": SCHEMA}).get_json()["success"]
+    return client
+
+
+def test_seeded_records_are_stable(deployed):
+    first = deployed.get("/api/mirage/p?index=3&seed=abc").get_json()
+    assert deployed.get("/api/mirage/p?index=3", headers={"X-Mirage-Seed": "abc"}).get_json() == first
+
+
+def test_cursor_walks_the_same_records_as_pages(deployed, core):
+    page = deployed.get("/api/mirage/p?page=1&page_size=4&seed=s").get_json()
+    assert page["page"] == 1 and len(page["data"]) == 4
+    following = deployed.get("/api/mirage/p?cursor=" + page["next_cursor"]).get_json()
+    assert following["offset"] == 4 and following["seed"] == "s"
+    assert following["data"] == deployed.get("/api/mirage/p?page=2&page_size=4&seed=s").get_json()["data"]
+
+
+def test_first_page_without_seed_hands_one_to_the_cursor(deployed, core):
+    page = deployed.get("/api/mirage/p?page_size=2").get_json()
+    assert page["seed"]
+    assert core.decode_cursor(page["next_cursor"]) == (page["seed"], 2, 2)
+
+
+@pytest.mark.parametrize("offset,size", [(0, 0), (0, 5000), (-5, 10), (0, -1)])
+def test_out_of_range_cursor_is_rejected(deployed, core, offset, size):
+    reply = deployed.get("/api/mirage/p?cursor=" + core.encode_cursor("s", offset, size))
+    assert reply.status_code == 400
+    assert reply.get_json()["error"] == "Invalid cursor"
+
+
+@pytest.mark.parametrize("query", ["cursor=!!!", "page=0", "page_size=0", "page_size=1001", "count=x"])
+def test_bad_paging_args_are_rejected(deployed, query):
+    assert deployed.get("/api/mirage/p?" + query).status_code == 400
+
+
+def test_count_returns_a_json_array(deployed):
+    reply = deployed.get("/api/mirage/p?count=300&seed=a")
+    assert reply.mimetype == "application/json"
+    records = reply.get_json()
+    assert len(records) == 300 and all(set(r) == {"id", "name"} for r in records)
+    assert deployed.get("/api/mirage/p?count=0").get_json() == []
+
+
+def test_ndjson_stream_spans_several_chunks(deployed, core, monkeypatch):
+    monkeypatch.setattr(core, "STREAM_CHUNK_BYTES", 256)
+    reply = deployed.get("/api/mirage/p?count=200&stream=ndjson&seed=a")
+    assert reply.mimetype == "application/x-ndjson"
+    lines = reply.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == deployed.get("/api/mirage/p?count=200&seed=a").get_json()
+
+
+def test_ndjson_pages_carry_the_cursor_in_a_header(deployed):
+    reply = deployed.get("/api/mirage/p?page_size=3&stream=ndjson&seed=h")
+    assert len(reply.get_data(as_text=True).splitlines()) == 3
+    assert reply.headers["X-Mirage-Seed"] == "h"
+    following = deployed.get("/api/mirage/p?cursor=" + reply.headers["X-Mirage-Next-Cursor"]).get_json()
+    assert following["offset"] == 3
+
+
+def test_generator_failure_mid_stream_cuts_the_body(deployed, core):
+    mock = core.active_simulations.get("p")
+    calls = []
+
+    def flaky(rng=None):
+        calls.append(1)
+        if len(calls) > 5:
+            raise RuntimeError("boom")
+        return {"id": len(calls)}
+
+    mock.func = flaky
+    body = deployed.get("/api/mirage/p?count=50&stream=ndjson").get_data(as_text=True)
+    assert len(body.splitlines()) == 5
+    assert mock.stats.snapshot()["errors"] == 1
+
+
+@pytest.mark.parametrize("query", ["stream=xml", "count=-1", "count=10000000000"])
+def test_bad_batch_args_are_rejected(deployed, query):
+    assert deployed.get("/api/mirage/p?" + query).status_code == 400
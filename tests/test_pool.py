@@ -0,0 +1,47 @@
+import pytest
+
+SCHEMA = {"id": 1, "name": "Ada"}
+
+
+@pytest.fixture
+def deployed(client):
+    assert client.post("/deploy", json={"name": "pl", "schema": SCHEMA}).get_json()["success"]
+    return client
+
+
+def test_pool_serves_and_reports(deployed, core):
+    reply = deployed.post("/api/mocks/pl/pool", json={"size": 40, "low_water": 10}).get_json()
+    assert reply["success"] and reply["pool"]["size"] == 40 and reply["pool"]["low_water"] == 10
+    assert core.active_simulations.get("pl").pool.ready.wait(5)
+    for _ in range(5):
+        assert set(deployed.get("/api/mirage/pl").get_json()) == {"id", "name"}
+    assert core.active_simulations.get("pl").pool.hits >= 1
+    assert deployed.post("/api/mocks/pl/pool", json={"enabled": False}).get_json()["pool"] is None
+
+
+def test_pool_defaults_low_water_to_a_quarter(deployed):
+    assert deployed.post("/api/mocks/pl/pool", json={"size": 100}).get_json()["pool"]["low_water"] == 25
+
+
+@pytest.mark.parametrize("body", [
+    {"size": "x"}, {"size": -3}, {"size": 0}, {"size": 10 ** 9},
+    {"size": 10, "low_water": 10}, {"size": 10, "low_water": -1}, {"size": 10, "low_water": "lots"},
+])
+def test_bad_pool_settings_are_rejected(deployed, core, body):
+    reply = deployed.post("/api/mocks/pl/pool", json=body)
+    assert reply.status_code == 400
+    assert not reply.get_json()["success"]
+    assert core.active_simulations.get("pl").pool is None
+
+
+@pytest.mark.parametrize("pool", [{"size": 0}, {"size": "x"}, "big", {"size": 8, "low_water": 9}])
+def test_deploy_rejects_a_bad_pool(client, core, pool):
+    reply = client.post("/deploy", json={"name": "pd", "schema": SCHEMA, "pool": pool}).get_json()
+    assert not reply["success"]
+    assert core.active_simulations.get("pd") is None
+
+
+def test_deploy_with_pool_true_uses_the_defaults(client, core):
+    assert client.post("/deploy", json={"name": "pd", "schema": SCHEMA, "pool": True}).get_json()["success"]
+    pool = core.active_simulations.get("pd").pool
+    assert (pool.size, pool.low_water) == (core.DEFAULT_POOL_SIZE, core.DEFAULT_POOL_SIZE // 4)
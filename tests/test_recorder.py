@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from mirage_compiler import plan_from_samples, plan_to_code, generator_source, load_generator
+from mirage_recorder import RecordLog, Recorder, route_template, learned_mocks
+
+
+def exchange(path, body, status=200, method="GET", content_type="application/json"):
+    return (method, path, "", status, content_type, body, 1.5)
+
+
+def test_log_replays_round_robin_and_survives_reopening(tmp_path):
+    path = str(tmp_path / "r.log")
+    log = RecordLog(path)
+    log.append([exchange("/a", b'{"n":1}'), exchange("/a", b'{"n":2}'), exchange("/b", b"[]", 404)])
+    assert [bytes(log.body(log.lookup("GET", "/a"))) for _ in range(3)] == [b'{"n":1}', b'{"n":2}', b'{"n":1}']
+    assert log.lookup("POST", "/a") is None and log.lookup("GET", "/b").status == 404
+    log.close()
+    # A torn trailing entry (a crash mid-write) is dropped on reopen
+    with open(path, "ab") as f:
+        f.write(b"\x05\x00\x00")
+    reopened = RecordLog(path)
+    assert reopened.describe()["entries"] == 3 and reopened.describe()["routes"] == 2
+    reopened.append([exchange("/a", b'{"n":3}')])
+    assert [bytes(reopened.body(e)) for (_, p), e in reopened.entries() if p == "/a"][-1] == b'{"n":3}'
+    reopened.close()
+
+
+def test_other_files_are_not_logs(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"definitely not a record log")
+    with pytest.raises(ValueError):
+        RecordLog(str(path))
+
+
+def test_recorder_drops_instead_of_blocking(tmp_path):
+    log = RecordLog(str(tmp_path / "r.log"))
+    recorder = Recorder(log, queue_size=2)
+    recorder.queue.put(None)  # the writer exits, so the queue stays full
+    recorder.thread.join(5)
+    for i in range(5):
+        recorder.record("GET", "/x", "", 200, "application/json", b"{}", 1.0)
+    assert recorder.stats()["dropped"] >= 3
+    log.close()
+
+
+def test_recorder_flushes_on_stop(tmp_path):
+    log = RecordLog(str(tmp_path / "r.log"))
+    recorder = Recorder(log, queue_size=10000)
+    for i in range(2000):
+        recorder.record("GET", f"/items/{i}", "", 200, "application/json", b'{"i":1}', 1.0)
+    recorder.stop()
+    assert recorder.stats()["recorded"] == 2000 and log.count == 2000
+    log.close()
+
+
+@pytest.mark.parametrize("path,template", [
+    ("/users/42/orders/ord_9f3a", "/users/{id}/orders/{id2}"),
+    ("/users/me", "/users/me"),
+    ("/v1/items/", "/v1/items"),
+])
+def test_id_segments_become_parameters(path, template):
+    assert route_template(path) == template
+
+
+def test_learning_merges_routes_and_skips_errors(tmp_path):
+    log = RecordLog(str(tmp_path / "r.log"))
+    log.append([exchange(f"/users/{i}", b'{"id": %d, "tier": "%s"}' % (i, b"GOLD" if i % 4 else b"BASIC"))
+                for i in range(1, 41)])
+    log.append([exchange("/users/9", b'{"error": "nope"}', 500), exchange("/health", b"ok", content_type="text/plain")])
+    mocks = learned_mocks(log, max_samples=25)
+    assert [(m["route"], m["methods"], len(m["samples"])) for m in mocks] == [("/users/{id}", ["GET"], 25)]
+    log.close()
+
+
+def test_fitted_plan_follows_observed_frequencies():
+    samples = [{"tier": "GOLD" if i % 4 else "BASIC", "score": i} for i in range(400)]
+    plan = plan_from_samples(samples)
+    func = load_generator(generator_source(plan_to_code(plan)))
+    rng = random.Random(0)
+    records = [func(rng) for _ in range(4000)]
+    assert sum(r["tier"] == "GOLD" for r in records) / 4000 == pytest.approx(0.75, abs=0.04)
+    assert min(r["score"] for r in records) >= 0 and max(r["score"] for r in records) <= 399
+
+
+def test_optional_fields_are_sometimes_absent():
+    plan = plan_from_samples([{"id": 1, "note": "x"}, {"id": 2}, {"id": 3}, {"id": 4}])
+    func = load_generator(generator_source(plan_to_code(plan)))
+    rng = random.Random(1)
+    present = sum("note" in func(rng) for _ in range(2000)) / 2000
+    assert 0.1 < present < 0.45
@@ -0,0 +1,69 @@
+import pytest
+
+from mirage_gemini import RouteIndex
+
+
+class Named:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_static_segments_win_over_params():
+    index = RouteIndex()
+    users, me, orders = Named("users"), Named("me"), Named("orders")
+    index.add("/users/{user_id}", users)
+    index.add("/users/me", me)
+    index.add("/users/{user_id}/orders", orders)
+    assert index.match("/users/me") == (me, {})
+    assert index.match("users/42/") == (users, {"user_id": "42"})
+    assert index.match("/users/42/orders") == (orders, {"user_id": "42"})
+    assert index.match("/users") == (None, None)
+    assert index.match("/users/42/refunds") == (None, None)
+
+
+def test_conflicting_routes_are_value_errors():
+    index = RouteIndex()
+    index.add("/users/{user_id}", Named("a"))
+    with pytest.raises(ValueError):
+        index.add("/users/{id}/orders", Named("b"))
+    with pytest.raises(ValueError):
+        index.add("/users/{user_id}", Named("c"))
+    index.add("/users/{user_id}", Named("a"))
+
+
+def test_many_mocks_each_with_their_own_route(client, core):
+    for i in range(20):
+        assert client.post("/deploy", json={"name": f"m{i}", "schema": {f"field_{i}": i}}).get_json()["success"]
+    for i in (0, 7, 19):
+        assert list(client.get(f"/api/mirage/m{i}").get_json()) == [f"field_{i}"]
+    assert len(client.get("/api/mocks").get_json()["mocks"]) == 20
+    assert client.get("/api/mirage/m20").status_code == 404
+
+
+def test_route_template_params_are_echoed(client):
+    assert client.post("/deploy", json={"name": "orders", "schema": {"user_id": 1, "order_id": "o_1", "total": 5},
+                                        "route": "/users/{user_id}/orders/{order_id}"}).get_json()["success"]
+    record = client.get("/api/mirage/users/42/orders/o_9").get_json()
+    assert record["user_id"] == 42 and record["order_id"] == "o_9"
+
+
+def test_default_mock_keeps_the_bare_route(client):
+    assert client.post("/deploy", json={"schema": {"id": 1}}).get_json()["success"]
+    assert client.get("/api/mirage").status_code == 200
+    assert client.get("/api/mirage/default").status_code == 200
+
+
+def test_methods_and_route_conflicts(client):
+    assert client.post("/deploy", json={"name": "r", "schema": {"id": 1}, "methods": ["GET", "POST"]}).get_json()["success"]
+    assert client.post("/api/mirage/r").status_code == 200
+    assert client.delete("/api/mirage/r").status_code == 405
+    clash = client.post("/deploy", json={"name": "s", "schema": {"id": 1}, "route": "/r"}).get_json()
+    assert not clash["success"] and "already served" in clash["error"]
+    assert client.post("/deploy", json={"name": "t", "schema": {"id": 1}, "methods": ["BREW"]}).get_json()["success"] is False
+
+
+def test_removed_mock_stops_matching(client):
+    assert client.post("/deploy", json={"name": "gone", "schema": {"id": 1}}).get_json()["success"]
+    assert client.delete("/api/mocks/gone").get_json()["success"]
+    assert client.get("/api/mirage/gone").status_code == 404
+    assert client.delete("/api/mocks/gone").status_code == 404
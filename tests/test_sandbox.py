@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+from mirage_compiler import generator_source
+from mirage_sandbox import SandboxPool, SandboxError
+
+
+def source(body):
+    return generator_source(body)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = SandboxPool(workers=1, wall_timeout=0.5, cpu_seconds=1.0)
+    yield pool
+    pool.shutdown()
+
+
+def test_batches_longer_than_one_deadline_still_finish(pool):
+    # 20 calls of 50 ms: each under the 0.5 s limit, the batch well over it
+    records, durations = pool.run(source("import time\ntime.sleep(0.05)\nreturn {'n': random.randint(1, 9)}"), "slow", 0, 20)
+    assert len(records) == 20 and len(durations) == 20
+
+
+def test_one_blocking_call_fails_the_batch_at_its_own_deadline(pool):
+    started = time.monotonic()
+    with pytest.raises(SandboxError, match="Wall-clock"):
+        pool.run(source("import time\ntime.sleep(5)\nreturn {}"), "stuck", 0, 256)
+    assert time.monotonic() - started < 2.0
+    # The killed worker is replaced and the pool keeps serving
+    records, _ = pool.run(source("return {'ok': True}"), "after", 0, 3)
+    assert records == [{"ok": True}] * 3
+
+
+def test_generator_errors_come_back_as_sandbox_errors(pool):
+    with pytest.raises(SandboxError, match="ZeroDivisionError"):
+        pool.run(source("return {'x': 1 / 0}"), "broken", 0, 1)
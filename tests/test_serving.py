@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+import subprocess
+
+import pytest
+from flask import Flask, jsonify
+from werkzeug.serving import make_server
+
+SCHEMA = {"order_id": "ord_8f3a2c91", "total": 42.5, "status": "PAID", "items": [{"sku": "sku_1", "qty": 2}]}
+
+
+def deploy(client, name, schema=SCHEMA, **extra):
+    reply = client.post("/deploy", json=dict({"name": name, "schema": schema}, **extra)).get_json()
+    assert reply["success"], reply
+    return reply
+
+
+# --- SEEDED GENERATION ---
+def test_same_seed_same_record(client):
+    deploy(client, "orders")
+    first = client.get("/api/mirage/orders?seed=abc").get_json()
+    assert client.get("/api/mirage/orders", headers={"X-Mirage-Seed": "abc"}).get_json() == first
+    assert client.get("/api/mirage/orders?seed=abd").get_json() != first
+
+
+def test_pages_are_slices_of_one_seeded_dataset(client):
+    deploy(client, "orders")
+    whole = client.get("/api/mirage/orders?seed=s&page_size=10").get_json()
+    first = client.get("/api/mirage/orders?seed=s&page_size=5").get_json()
+    second = client.get(f"/api/mirage/orders?cursor={first['next_cursor']}").get_json()
+    assert first["data"] + second["data"] == whole["data"]
+
+
+def test_seeded_stream_is_reproducible(client):
+    deploy(client, "orders")
+    one = client.get("/api/mirage/orders?seed=7&count=50&stream=ndjson").get_data()
+    assert one == client.get("/api/mirage/orders?seed=7&count=50&stream=ndjson").get_data()
+    assert len(one.splitlines()) == 50
+
+
+
+def test_seeded_requests_leave_the_global_rng_alone(client):
+    deploy(client, "orders")
+    random.seed(1234)
+    expected = random.random()
+    random.seed(1234)
+    client.get("/api/mirage/orders?seed=g&count=20")
+    client.get("/api/mirage/orders?index=3")
+    assert random.random() == expected
+
+
+def test_seeded_records_are_the_same_in_another_process(client):
+    deploy(client, "orders")
+    here = client.get("/api/mirage/orders?seed=x&index=9").get_json()
+    plan = client.get("/api/mocks/orders").get_json()["plan"]
+    script = (
+        "import sys, json; sys.path.insert(0, sys.argv[1])\n"
+        "from mirage_compiler import plan_to_code, generator_source, load_generator, record_rng\n"
+        "func = load_generator(generator_source(plan_to_code(json.loads(sys.argv[2]))))\n"
+        "print(json.dumps(func(record_rng('orders', 'x', 9))))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", script, root, json.dumps(plan)], capture_output=True, text=True,
+                         env=dict(os.environ, PYTHONHASHSEED="99"), check=True).stdout
+    assert json.loads(out) == here
+
+
+def test_seeded_records_do_not_depend_on_other_threads(client, core):
+    deploy(client, "orders")
+    mock = core.active_simulations.get("orders")
+    expected = list(mock.generate(0, 200, "t"))
+    results = [None] * 8
+
+    def run(i):
+        results[i] = list(mock.generate(0, 200, "t"))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(result == expected for result in results)
+
+
+def test_seeded_chaos_replays_the_same_outcome(client):
+    deploy(client, "orders")
+    assert client.post("/api/chaos", json={"name": "orders", "enabled": True,
+                                           "faults": [{"type": "error", "probability": 0.5}]}).get_json()["success"]
+    first = [client.get(f"/api/mirage/orders?seed=c&index={i}").status_code for i in range(40)]
+    assert {200, 500} == set(first)
+    assert [client.get(f"/api/mirage/orders?seed=c&index={i}").status_code for i in range(40)] == first
+
+
+# --- VERSIONS & ROLLBACK ---
+def test_redeploy_bumps_the_version_and_rollback_restores_it(client):
+    assert deploy(client, "v", {"a": 1})["version"] == 1
+    assert deploy(client, "v", {"a": 1, "b": "x"})["version"] == 2
+    assert sorted(client.get("/api/mirage/v").get_json()) == ["a", "b"]
+
+    reply = client.post("/api/mocks/v/rollback", json={}).get_json()
+    assert reply == {"success": True, "name": "v", "version": 1, "previous": 2}
+    assert sorted(client.get("/api/mirage/v").get_json()) == ["a"]
+
+    versions = client.get("/api/mocks/v/versions").get_json()
+    assert versions["live"] == 1
+    assert [(v["version"], v["live"]) for v in versions["versions"]] == [(2, False), (1, True)]
+
+    assert client.post("/api/mocks/v/rollback", json={"version": 2}).get_json()["version"] == 2
+    assert sorted(client.get("/api/mirage/v").get_json()) == ["a", "b"]
+
+
+def test_rollback_errors(client):
+    deploy(client, "v", {"a": 1})
+    assert client.post("/api/mocks/v/rollback", json={}).status_code == 404
+    assert client.post("/api/mocks/v/rollback", json={"version": 9}).status_code == 404
+    assert client.post("/api/mocks/v/rollback", json={"version": "x"}).status_code == 400
+    assert client.post("/api/mocks/nope/rollback", json={}).status_code == 404
+
+
+def test_redeploy_keeps_counts_and_drops_no_requests(core, client):
+    deploy(client, "busy", {"a": 1}, pool={"size": 64})
+    errors = []
+    stop = threading.Event()
+
+    def load():
+        local = core.app.test_client()
+        while not stop.is_set():
+            status = local.get("/api/mirage/busy").status_code
+            if status != 200:
+                errors.append(status)
+
+    threads = [threading.Thread(target=load) for _ in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        for i in range(5):
+            deploy(client, "busy", {"a": 1, f"f{i}": i}, pool={"size": 64})
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert errors == []
+    stats = client.get("/api/mocks/busy").get_json()["stats"]
+    assert stats["requests"] == stats["ok"] > 0
+
+
+# --- RECORD & REPLAY ---
+@pytest.fixture
+def upstream():
+    app = Flask("upstream")
+    counter = iter(range(10 ** 6))
+
+    @app.route("/users/<int:user_id>")
+    def user(user_id):
+        n = next(counter)
+        return jsonify({"id": user_id, "name": "Ada", "plan": ["free", "pro"][n % 2], "score": 10 + n})
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def wait_recorded(client, name, count):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if client.get(f"/api/recordings/{name}").get_json()["log"]["entries"] >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError("exchanges were not recorded")
+
+
+def test_proxy_records_and_replay_answers(client, upstream):
+    assert client.post("/api/recordings", json={"name": "shop", "upstream": upstream}).status_code == 200
+    proxied = [client.get(f"/api/proxy/shop/users/{i % 3}").get_json() for i in range(6)]
+    wait_recorded(client, "shop", 6)
+
+    replayed = [client.get(f"/api/replay/shop/users/{i % 3}").get_json() for i in range(6)]
+    assert sorted(map(str, replayed)) == sorted(map(str, proxied))
+    assert client.get("/api/replay/shop/users/99").status_code == 404
+
+
+def test_reopened_log_replays_without_upstream(client, upstream):
+    client.post("/api/recordings", json={"name": "again", "upstream": upstream})
+    recorded = client.get("/api/proxy/again/users/1").get_json()
+    wait_recorded(client, "again", 1)
+    assert client.delete("/api/recordings/again").status_code == 200
+
+    reply = client.post("/api/recordings", json={"name": "again"}).get_json()
+    assert reply["log"]["entries"] == 1 and not reply["recording"]
+    assert client.get("/api/replay/again/users/1").get_json() == recorded
+
+
+def test_learn_deploys_a_mock_per_route(client, upstream):
+    client.post("/api/recordings", json={"name": "learn", "upstream": upstream})
+    for i in range(20):
+        client.get(f"/api/proxy/learn/users/{i}")
+    wait_recorded(client, "learn", 20)
+
+    reply = client.post("/api/recordings/learn/learn", json={}).get_json()
+    assert reply["deployed"] == 1
+    result = reply["results"][0]
+    assert result["route"] == "/users/{id}"
+    record = client.get("/api/mirage/users/5").get_json()
+    assert record["plan"] in ("free", "pro")
+    assert 10 <= record["score"] <= 29
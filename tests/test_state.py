@@ -0,0 +1,49 @@
+import threading
+
+import mirage_state
+from mirage_state import StateFile, StateWatcher, ChangeNotifier
+
+
+def test_update_returns_its_own_token(tmp_path):
+    path = str(tmp_path / "registry.json")
+    mine, theirs = StateFile(path), StateFile(path)
+    state, token = mine.update(lambda s: s["mocks"].__setitem__("a", {}))
+    assert state["generation"] == 1 and token == mine.token()
+    _, later = theirs.update(lambda s: s["mocks"].__setitem__("b", {}))
+    assert later != token
+
+
+def test_write_after_own_publish_is_still_applied(tmp_path):
+    path = str(tmp_path / "registry.json")
+    mine, theirs = StateFile(path), StateFile(path)
+    seen = []
+    watcher = StateWatcher(mine, seen.append, interval=0.01)
+    _, token = mine.update(lambda s: None)
+    theirs.update(lambda s: s["mocks"].__setitem__("b", {}))
+    # Recording our own write's token must not hide the other worker's
+    watcher.last_token = token
+    watcher.check()
+    assert [s["generation"] for s in seen] == [2]
+
+
+def test_notifier_wakes_the_watcher_before_its_poll(tmp_path, monkeypatch):
+    path = str(tmp_path / "registry.json")
+    mine, theirs = StateFile(path), StateFile(path)
+    listener = ChangeNotifier(path)
+    # A second "worker" in the same process needs its own socket name
+    monkeypatch.setattr(mirage_state.os, "getpid", lambda: 1)
+    sender = ChangeNotifier(path)
+    monkeypatch.undo()
+    changed = threading.Event()
+    watcher = StateWatcher(mine, lambda state: changed.set(), interval=30, notifier=listener)
+    watcher.start()
+    try:
+        theirs.update(lambda s: None)
+        sender.notify()
+        assert changed.wait(5)
+    finally:
+        watcher.stop()
+        sender.notify()
+        watcher.thread.join(5)
+        listener.close()
+        sender.close()
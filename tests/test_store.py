@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from mirage_compiler import infer_plan
+from mirage_store import ColumnStore, StoreError
+
+PLAN = infer_plan({"id": 1, "status": "OPEN", "owner": "ada", "score": 3, "note": "hello there"})
+
+
+def rows(n, seed=0):
+    rng = random.Random(seed)
+    return [{"id": i, "status": rng.choice(["OPEN", "CLOSED", "HELD"]), "owner": rng.choice(["ada", "bob", "cy"]),
+             "score": rng.randint(0, 5), "note": "x"} for i in range(n)]
+
+
+def brute(store, filters):
+    """The reference answer: every live row checked field by field, in slot order."""
+    matched = []
+    for slot, live in enumerate(store.alive):
+        if not live:
+            continue
+        row = store._row(slot)
+        if all(str(row.get(k)) == v for k, v in filters.items()):
+            matched.append(row)
+    return matched
+
+
+@pytest.fixture
+def store():
+    store = ColumnStore(PLAN, "id", indexes=("status", "owner", "score"))
+    store.load(rows(2000))
+    return store
+
+
+@pytest.mark.parametrize("filters", [
+    {}, {"status": "OPEN"}, {"status": "OPEN", "owner": "bob"}, {"status": "HELD", "owner": "cy", "score": "3"},
+    {"score": "3", "note": "x"}, {"note": "x"}, {"id": "17"}, {"id": "17", "status": "CLOSED"}, {"status": "NOPE"},
+])
+def test_query_pages_match_a_scan(store, filters):
+    expected = brute(store, filters)
+    for offset, limit in ((0, 20), (35, 10), (len(expected) - 3, 20), (10 ** 6, 5)):
+        total, page = store.query(filters, max(0, offset), limit)
+        assert total == len(expected)
+        assert page == expected[max(0, offset):max(0, offset) + limit]
+
+
+def test_indexes_stay_sorted_through_writes(store):
+    rng = random.Random(1)
+    for step in range(3000):
+        key = rng.randrange(2500)
+        action = rng.random()
+        if action < 0.3:
+            store.delete(key)
+        elif action < 0.6:
+            try:
+                store.insert({"id": 5000 + step, "status": rng.choice(["OPEN", "HELD"]), "owner": "ada", "score": 1, "note": "y"})
+            except StoreError:
+                pass
+        else:
+            store.update(key, {"status": rng.choice(["OPEN", "CLOSED"]), "score": rng.randint(0, 5)})
+    for index in store.indexes.values():
+        for slots in index.values():
+            assert list(slots) == sorted(set(slots))
+    for filters in ({}, {"status": "OPEN"}, {"status": "OPEN", "owner": "ada"}, {"score": "1", "note": "y"}):
+        expected = brute(store, filters)
+        for offset in (0, 7, len(expected) // 2):
+            total, page = store.query(filters, offset, 25)
+            assert total == len(expected)
+            assert page == expected[offset:offset + 25]
+
+
+def test_unknown_filter_is_rejected(store):
+    with pytest.raises(StoreError):
+        store.query({"missing": "1"})
+
+
+def test_cached_matches_follow_writes(store):
+    filters = {"status": "OPEN", "owner": "bob"}
+    total, page = store.query(filters, 0, 5)
+    store.update(page[0]["id"], {"status": "CLOSED"})
+    assert store.query(filters, 0, 5)[0] == total - 1
+    store.insert({"id": 9999, "status": "OPEN", "owner": "bob", "score": 0, "note": "z"})
+    assert store.query(filters, 0, 5)[0] == total
+    assert store.query(filters, total - 1, 5)[1][-1]["id"] == 9999
+
+
+@pytest.mark.parametrize("key", [[1, 2], {"a": 1}])
+def test_container_primary_keys_are_store_errors(store, key):
+    with pytest.raises(StoreError) as raised:
+        store.insert(dict(rows(1)[0], id=key))
+    assert raised.value.status == 400
+    with pytest.raises(StoreError):
+        store.replace(5, dict(rows(1)[0], id=key))
+    with pytest.raises(StoreError):
+        store.replace(key, rows(1)[0])
+    assert store.get(5)["id"] == 5
+
+
+# A PUT takes its key from the path, so only POST and PATCH can carry a body key
+@pytest.mark.parametrize("method,path", [("POST", "/api/mirage/items"), ("PATCH", "/api/mirage/items/3")])
+def test_container_primary_key_over_http_is_a_400(client, method, path):
+    assert client.post("/deploy", json={"name": "items", "schema": {"id": 1, "title": "x"},
+                                        "stateful": {"rows": 10}}).get_json()["success"]
+    reply = client.open(path, method=method, json={"id": [1, 2], "title": "y"})
+    assert reply.status_code == 400
+    assert reply.get_json()["error"] == "id must be a string, number or boolean"
+    assert client.get("/api/mirage/items/3").get_json()["id"] == 3
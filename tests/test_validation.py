@@ -0,0 +1,109 @@
+import json
+import random
+
+import pytest
+
+from mirage_compiler import compile_validator, infer_plan, plan_to_code, generator_source, load_generator
+
+SAMPLE = {"id": 1, "name": "Ada", "tags": ["x"], "address": {"city": "Oslo", "lat": 59.9}}
+
+
+def test_validator_accepts_the_generators_own_records():
+    plan = infer_plan(SAMPLE)
+    check = compile_validator(plan)
+    func = load_generator(generator_source(plan_to_code(plan)))
+    assert all(check(func(random.Random(i))) == [] for i in range(200))
+
+
+def test_validator_reports_each_difference():
+    check = compile_validator(infer_plan(SAMPLE))
+    diffs = check({"id": "1", "tags": [3], "address": {"city": "Oslo", "lat": 1}, "extra": True})
+    assert set(diffs) == {("$.name", "present", "missing"), ("$.extra", "absent", "unexpected key"),
+                          ("$.id", "int", "string"), ("$.tags[0]", "string", "int")}
+
+
+def test_batch_report_counts_raises_and_folds_array_indexes(core):
+    check = compile_validator(infer_plan({"tags": ["x"]}))
+
+    def generator(random):
+        if random.random() < 0.3:
+            raise KeyError("boom")
+        return {"tags": [1, 2, 3]}
+
+    report = core.validate_generator("v", generator, None, "inline", check, 100)
+    assert not report["ok"] and report["raised"] + report["mismatched"] == 100 and report["raised"] > 0
+    assert [d["what"] for d in report["diffs"]] == ["$.tags[*]: expected string, got int"]
+    assert report["errors"][0]["what"] == "KeyError: 'boom'"
+    assert report["call_us"]["p50"] is not None
+    again = core.validate_generator("v", generator, None, "inline", check, 100)
+    # Seeded runs: the same records, so the same counts (only the timings differ)
+    assert {k: v for k, v in again.items() if k != "call_us"} == {k: v for k, v in report.items() if k != "call_us"}
+
+
+class Refiner:
+    """Proposes `plans` in turn and records the feedback each call got."""
+    def __init__(self, *plans):
+        self.plans = list(plans)
+        self.feedback = []
+
+    def __call__(self, api_key, schema, plan, feedback=None):
+        self.feedback.append(feedback)
+        return json.dumps(self.plans.pop(0) if self.plans else plan)
+
+
+@pytest.fixture
+def gemini(core, monkeypatch):
+    def install(*plans):
+        refiner = Refiner(*plans)
+        monkeypatch.setattr(core, "plan_refiner", refiner)
+        return refiner
+    return install
+
+
+def deploy(client, **extra):
+    return client.post("/deploy", json=dict({"name": "val", "engine": "gemini", "api_key": "k",
+                                             "schema": json.dumps({"id": 1, "name": "Ada"})}, **extra)).get_json()
+
+
+def test_mismatching_plan_is_repaired(client, gemini):
+    refiner = gemini(infer_plan({"id": "x", "name": "Ada"}), infer_plan({"id": 1, "name": "Ada"}))
+    reply = deploy(client)
+    assert reply["success"] and reply["validation"]["repairs"] == 1 and not reply["validation"]["fallback"]
+    assert refiner.feedback[0] is None and "$.id: expected int, got string" in refiner.feedback[1]
+
+
+def test_plan_that_never_validates_falls_back_to_the_local_one(client, core, gemini):
+    bad = infer_plan({"id": "x", "name": "Ada"})
+    refiner = gemini(*[bad] * (core.MAX_REPAIR_ROUNDS + 1))
+    reply = deploy(client)
+    assert reply["success"] and reply["validation"]["fallback"]
+    assert len(refiner.feedback) == core.MAX_REPAIR_ROUNDS + 1
+    assert isinstance(client.get("/api/mirage/val").get_json()["id"], int)
+    # A fallback plan is not worth caching
+    assert client.get("/api/cache").get_json()["entries"] == 0
+
+
+def test_validation_can_be_turned_off(client, gemini):
+    gemini(infer_plan({"id": "x", "name": "Ada"}))
+    reply = deploy(client, validate=False)
+    assert reply["success"] and reply["validation"] is None
+    assert isinstance(client.get("/api/mirage/val").get_json()["id"], str)
+
+
+def test_live_sampling_counts_served_records(client, core):
+    assert client.post("/deploy", json={"name": "live", "schema": {"id": 1}}).get_json()["success"]
+    status = client.post("/api/mocks/live/validate", json={"runs": 50, "sample_rate": 1.0}).get_json()
+    assert status["success"] and status["last_run"]["ok"] and status["last_run"]["runs"] == 50
+    core.active_simulations.get("live").func = lambda random=random: {"id": "oops"}
+    for _ in range(4):
+        client.get("/api/mirage/live")
+    live = client.post("/api/mocks/live/validate", json={"runs": 0}).get_json()["live"]
+    assert live["checked"] == 4 and live["mismatched"] == 4
+    assert live["recent"][0]["diffs"] == ["$.id: expected int, got string"]
+
+
+@pytest.mark.parametrize("body", [{"sample_rate": 2}, {"runs": -1}, {"runs": "many"}])
+def test_bad_validation_options_are_rejected(client, body):
+    assert client.post("/deploy", json={"name": "live", "schema": {"id": 1}}).get_json()["success"]
+    assert client.post("/api/mocks/live/validate", json=body).status_code == 400
+    assert not client.post("/deploy", json={"name": "other", "schema": {"id": 1}, "validate": body}).get_json()["success"]